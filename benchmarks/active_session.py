@@ -0,0 +1,113 @@
+"""Benchmark the active-session hot path over a database with many archived sessions.
+
+Seeds ``--users`` users with ``--sessions`` sessions each (all archived but the newest), then times
+``get_current_session`` and a /question-style invalidate-and-create cycle. It runs once with the
+``ix_sessions_active`` partial index and live-only invalidation, and once the old way: the index
+dropped, with every one of the user's sessions rewritten on each invalidation.
+
+    python -m benchmarks.active_session --users 1000 --sessions 100
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+
+async def run(users: int, sessions: int, samples: int) -> None:
+    from sqlalchemy import insert, text, update
+
+    from src.async_db import (
+        create_tutor_session,
+        db_session,
+        dispose_engine,
+        get_current_session,
+        init_db,
+        invalidate_old_sessions,
+    )
+    from src.db import TutorSession, utcnow
+
+    await init_db()
+
+    async def legacy_invalidate_old_sessions(db, user_id: int):
+        # noinspection PyTypeChecker
+        result = await db.execute(
+            update(TutorSession)
+            .filter(TutorSession.user_id == user_id)
+            .values(archived=True)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    now = utcnow()
+    rows = [
+        {
+            "user_id": user_id,
+            "subject": "math",
+            "question": f"Question {n}",
+            "archived": n < sessions - 1,
+            "created_at": now - timedelta(minutes=sessions - n),
+        }
+        for user_id in range(1, users + 1)
+        for n in range(sessions)
+    ]
+    async with db_session() as db:
+        for start in range(0, len(rows), 10_000):
+            await db.execute(insert(TutorSession), rows[start : start + 10_000])
+        await db.commit()
+        await db.execute(text("ANALYZE"))
+        await db.commit()
+    print(f"seeded {len(rows)} sessions for {users} users")
+
+    async def measure(invalidate) -> tuple[list[float], list[float], list[int]]:
+        lookups, cycles, touched = [], [], []
+        for user_id in random.sample(range(1, users + 1), samples):
+            async with db_session() as db:
+                started = time.perf_counter()
+                await get_current_session(db, user_id)
+                lookups.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                archived = await invalidate(db, user_id)
+                await create_tutor_session(db, user_id, "math", "", "New question", "", "", None)
+                cycles.append(time.perf_counter() - started)
+                touched.append(archived)
+        return lookups, cycles, touched
+
+    results = {"partial index": await measure(invalidate_old_sessions)}
+
+    async with db_session() as db:
+        await db.execute(text("DROP INDEX ix_sessions_active"))
+        await db.commit()
+    results["previous"] = await measure(legacy_invalidate_old_sessions)
+
+    await dispose_engine()
+
+    for name, (lookups, cycles, touched) in results.items():
+        print(
+            f"{name}: lookup median {statistics.median(lookups) * 1000:.2f}ms, "
+            f"invalidate+create median {statistics.median(cycles) * 1000:.2f}ms, "
+            f"rows rewritten per invalidation {statistics.mean(touched):.1f}"
+        )
+
+    assert max(results["partial index"][2]) <= 1, "invalidation should only touch the live session"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        asyncio.run(run(args.users, args.sessions, args.samples))
+
+
+if __name__ == "__main__":
+    main()
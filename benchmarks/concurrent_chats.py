@@ -0,0 +1,63 @@
+"""Load test: N concurrent tutoring turns should finish in roughly the time of one.
+
+Runs the async ``chat_*`` path against a local fake OpenAI server, so no API key or network is needed. The
+client-side rate limiters keep their defaults: a burst up to their capacity goes out at once and the rest is
+paced at the configured rate, so that pacing is the only wait allowed on top of the model's latency:
+
+    python -m benchmarks.concurrent_chats --users 50 --latency 1.0
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+
+async def run(users: int, latency: float) -> None:
+    async with FakeOpenAIServer(latency=latency) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+        import src.openai_handler as openai_handler
+        from src.openai_handler import chat_generate_question_async, chat_with_history_async
+
+        messages = [{"role": "user", "content": "I think the answer is 42?"}]
+
+        started = time.perf_counter()
+        await chat_with_history_async(messages)
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(chat_with_history_async(messages) for _ in range(users // 2)),
+            *(chat_generate_question_async("math", "") for _ in range(users - users // 2)),
+        )
+        concurrent = time.perf_counter() - started
+
+        # Requests beyond the bucket's burst capacity wait for the limiter (the single chat's token has refilled)
+        limiter = openai_handler._request_limiter
+        paced = max(0.0, users - limiter.capacity) / limiter.rate if limiter.rate > 0 else 0.0
+
+    print(f"1 chat: {single:.2f}s")
+    print(f"{users} concurrent chats: {concurrent:.2f}s ({concurrent / single:.1f}x a single chat)")
+    print(f"peak in-flight requests at the server: {server.max_in_flight}")
+    print(f"pacing required by the request rate limit: {paced:.2f}s")
+    print(f"connections opened for {server.requests} requests: {server.connections}")
+
+    # Serialized calls would take ~users x single; concurrent ones should stay within a small multiple, plus the
+    # time the rate limit makes the ones past the burst wait
+    assert concurrent < single * 3 + paced * 1.2, "concurrent chats are being serialized"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Check that the prompt sent per tutoring turn stays bounded as a conversation grows.
+
+Plays a long conversation through ``chat_message_async`` against the fake OpenAI server and records
+the size of every chat prompt it receives. Older turns should be folded into the session summary, so
+the last turns' prompts are no bigger than the early ones, and every turn the summary does not cover yet
+must still be in the prompt verbatim:
+
+    python -m benchmarks.context_window --turns 100
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+
+
+async def run(turns: int) -> None:
+    from benchmarks.fake_openai import FakeOpenAIServer
+
+    async with FakeOpenAIServer(latency=0.01) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+        from src.async_db import (
+            create_tutor_session,
+            db_session,
+            dispose_engine,
+            get_current_session,
+            get_session_messages,
+            init_db,
+        )
+        from src.openai_handler import chat_message_async, close_clients, wait_for_summaries
+
+        await init_db()
+
+        async with db_session() as db:
+            await create_tutor_session(db, 1, "math", "", "What is 6 x 7?", "Multiply 6 by 7.", "42", None)
+
+        turn_prompts = []
+        missing = 0
+        for turn in range(turns):
+            async with db_session() as db:
+                session = await get_current_session(db, 1)
+                unsummarized = await get_session_messages(db, session.id, after_id=session.summary_through_id)
+                before = len(server.prompt_chars)
+                await chat_message_async(session, f"Turn {turn}: is it {turn} times something? " * 5, db)
+                turn_prompts.append(server.prompt_chars[before])
+                sent = {m["content"] for m in server.prompts[before]}
+                missing += sum(m.content not in sent for m in unsummarized if m.role != "system")
+
+            # Users take a while to type; give the background summary time to land between turns
+            await wait_for_summaries()
+
+        async with db_session() as db:
+            session = await get_current_session(db, 1)
+
+        await close_clients()
+        await dispose_engine()
+
+    summaries = server.requests - turns
+    print(f"{turns} turns, {summaries} summary updates")
+    print(
+        f"prompt characters: first turn {turn_prompts[0]}, turn 10 {turn_prompts[min(9, turns - 1)]}, "
+        f"max {max(turn_prompts)}, last turn {turn_prompts[-1]}"
+    )
+    print(f"summary covers messages up to id {session.summary_through_id}; {missing} unsummarized messages not sent")
+
+    assert session.summary, "older turns should have been summarized"
+    assert missing == 0, "messages missing from both the summary and the prompt"
+    # Once the window is full, prompts should only wobble with the summary length, not grow with the turn count
+    settled = turn_prompts[turns // 2 :]
+    assert max(settled) - min(settled) <= max(settled) * 0.1, "prompt size keeps growing"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # The fake server has no rate limits, so the client-side limiters would only measure themselves
+        os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "0")
+        asyncio.run(run(args.turns))
+
+
+if __name__ == "__main__":
+    main()
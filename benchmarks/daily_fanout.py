@@ -0,0 +1,107 @@
+"""Benchmark the daily question fan-out against a fake OpenAI server and a fake bot.
+
+Seeds a scratch SQLite database with users, then runs ``generate_daily_questions`` with a bounded
+worker pool. A few users have blocked the bot and a few deliveries hit a flood-wait once (waited out by the
+bot's rate limiter, as in the bot), so the summary shows failure isolation and retries as well as throughput. Every user starts with yesterday's
+session still live, which the delivery must archive:
+
+    python -m benchmarks.daily_fanout --users 1000 --concurrency 50 --latency 1.0
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+
+from telegram.error import Forbidden, RetryAfter
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+
+class FakeBot:
+    def __init__(self, blocked: set[int], flood_once: set[int]):
+        from src.rate_limit import TelegramRateLimiter
+
+        self.blocked = blocked
+        self.flood_once = set(flood_once)
+        self.sent = 0
+        # Unlimited rates; it only waits out and retries the flood-waits, as it does for ExtBot
+        self.rate_limiter = TelegramRateLimiter(global_per_second=0, chat_per_second=0)
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        await self.rate_limiter.process_request(
+            self._send_message, (chat_id, text), {}, "sendMessage", {"chat_id": chat_id}, None
+        )
+
+    async def _send_message(self, chat_id: int, text: str) -> None:
+        await asyncio.sleep(0.01)
+        if chat_id in self.blocked:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        if chat_id in self.flood_once:
+            self.flood_once.discard(chat_id)
+            raise RetryAfter(1)
+        self.sent += 1
+
+
+async def run(users: int, concurrency: int, latency: float) -> None:
+    async with FakeOpenAIServer(latency=latency, jitter=latency / 2) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+        from sqlalchemy import func, select
+
+        import src.scheduler as scheduler
+        from src.async_db import db_session, dispose_engine, init_db
+        from src.db import TutorSession, User
+        from src.question_pool import stop_refills
+
+        await init_db()
+
+        scheduler.DAILY_QUESTION_RETRY_DELAY = 0.1
+
+        async with db_session() as db:
+            db.add_all(User(id=i, subject="algebra", memo="") for i in range(1, users + 1))
+            db.add_all(TutorSession(user_id=i, subject="algebra", question="Yesterday's") for i in range(1, users + 1))
+            await db.commit()
+
+        blocked = set(range(1, users + 1, 100))
+        bot = FakeBot(blocked=blocked, flood_once=set(range(2, users + 1, 50)))
+        await bot.rate_limiter.initialize()
+
+        summary = await scheduler.generate_daily_questions(bot, concurrency=concurrency)
+        await stop_refills()
+
+        async with db_session() as db:
+            # noinspection PyTypeChecker
+            live = await db.scalar(select(func.count()).select_from(TutorSession).filter(~TutorSession.archived))
+        await dispose_engine()
+
+    serial_estimate = users * latency * 1.25
+    print(f"{summary.total} users, concurrency {concurrency}: {summary.duration:.1f}s")
+    print(f"sent {summary.sent}, failed {summary.failed}, skipped {summary.skipped}")
+    print(f"one-at-a-time estimate: {serial_estimate:.0f}s")
+    print(f"live sessions afterwards: {live}")
+
+    assert summary.failed == len(blocked), "only users who blocked the bot should fail"
+    assert summary.sent == bot.sent == users - len(blocked)
+    # Users who blocked the bot got their session stored before the send failed, so every user has exactly one
+    assert live == users, "a delivered question should archive the sessions it replaces"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # The fake server has no rate limits, so the client-side limiters would only measure themselves
+        os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "0")
+        asyncio.run(run(args.users, args.concurrency, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Check per-user daily delivery scheduling: time zones, DST, the spread offset and the scheduler tick.
+
+Computes delivery slots with ``next_delivery_time`` for a US zone across both DST transitions (the slot stays at
+DAILY_QUESTION_HOUR local, so the UTC gap between slots is 23 or 25 hours), for a user whose slot today has already
+passed, and for ``--users`` users in one zone (spread over DAILY_QUESTION_SPREAD_MINUTES). Then seeds those users in
+a scratch SQLite database and runs ``enqueue_due_questions`` at chosen times, checking that a tick queues each due
+slot once, keyed by the slot's local day even when the tick runs late, and moves next_problem past the tick:
+
+    python -m benchmarks.delivery_schedule --users 500
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def check_slots(users: int) -> None:
+    import pytz
+
+    import src.scheduler as scheduler
+    from src.db import User
+
+    hour, spread = scheduler.DAILY_QUESTION_HOUR, scheduler.DAILY_QUESTION_SPREAD_MINUTES
+    eastern = pytz.timezone("US/Eastern")
+
+    def local(slot: datetime, tz) -> datetime:
+        return pytz.utc.localize(slot).astimezone(tz)
+
+    # Spring forward (2026-03-08) and fall back (2026-11-01): a week of slots around each, for a user with no offset
+    user = User(id=spread or 1, subject="algebra", timezone="US/Eastern")
+    offset = user.id % spread if spread else 0
+    for first_day in (datetime(2026, 3, 5), datetime(2026, 10, 29)):
+        slot = scheduler.next_delivery_time(user, first_day)
+        slots = [slot]
+        for _ in range(6):
+            slots.append(scheduler.next_delivery_time(user, slots[-1]))
+        days = [local(s, eastern) for s in slots]
+        assert all((d.hour, d.minute) == (hour, offset) for d in days), f"slots drifted off {hour}:00 local: {days}"
+        assert [d.date() for d in days] == [days[0].date() + timedelta(days=n) for n in range(7)], days
+        gaps = sorted({(b - a) / timedelta(hours=1) for a, b in zip(slots, slots[1:], strict=False)})
+        print(f"week from {first_day.date()}: UTC gaps between slots {gaps} hours")
+        assert gaps == ([23.0, 24.0] if first_day.month == 3 else [24.0, 25.0]), gaps
+
+    # A user whose slot today has already passed gets tomorrow's; one whose slot is still ahead gets today's
+    tokyo = pytz.timezone("Asia/Tokyo")
+    user = User(id=spread or 1, subject="algebra", timezone="Asia/Tokyo")
+    today = tokyo.localize(datetime(2026, 6, 10, hour)).astimezone(pytz.utc).replace(tzinfo=None)
+    for after, expected_day in ((today - timedelta(hours=1), 10), (today + timedelta(minutes=1), 11)):
+        slot = local(scheduler.next_delivery_time(user, after), tokyo)
+        assert (slot.day, slot.hour) == (expected_day, hour), (after, slot)
+    # Strictly after: a tick exactly at the slot schedules the next day's
+    assert local(scheduler.next_delivery_time(user, today), tokyo).day == 11
+
+    # The spread offset: users in one zone come due over DAILY_QUESTION_SPREAD_MINUTES, each at a stable minute
+    started = time.perf_counter()
+    after = datetime(2026, 6, 10)
+    slots = [scheduler.next_delivery_time(User(id=i, timezone="US/Eastern"), after) for i in range(users)]
+    elapsed = time.perf_counter() - started
+    minutes = {local(slot, eastern).minute for slot in slots}
+    print(
+        f"{users} users in one zone come due over {len(minutes)} distinct minutes ({elapsed / users * 1e6:.0f}µs each)"
+    )
+    assert len(minutes) == min(users, spread or 1), minutes
+    assert all(local(slot, eastern).minute == (i % spread if spread else 0) for i, slot in enumerate(slots))
+    assert len({local(slot, eastern).date() for slot in slots}) == 1, "the offset must not move a slot to another day"
+
+
+async def check_ticks(users: int) -> None:
+    import pytz
+    from sqlalchemy import func, select
+
+    import src.scheduler as scheduler
+    from src.async_db import db_session, dispose_engine, init_db
+    from src.db import Job, User
+
+    await init_db()
+
+    # Zones on both sides of UTC, so a late tick falls on another local day for some of them
+    zones = ["US/Eastern", "US/Pacific", "Europe/Berlin", "Asia/Tokyo", None]
+    async with db_session() as db:
+        db.add_all(User(id=i, subject="algebra", memo="", timezone=zones[i % len(zones)]) for i in range(1, users + 1))
+        await db.commit()
+
+    now = datetime(2026, 6, 10, 12)
+
+    async def tick(at: datetime) -> int:
+        scheduler.utcnow = lambda: at
+        return await scheduler.enqueue_due_questions()
+
+    async def snapshot() -> tuple[dict[int, datetime], list[str]]:
+        async with db_session() as db:
+            # noinspection PyTypeChecker
+            slots = {user.id: user.next_problem for user in await db.scalars(select(User))}
+            # noinspection PyTypeChecker
+            keys = (await db.scalars(select(Job.key))).all()
+        return slots, keys
+
+    # The first tick schedules everyone and queues nothing: no slot is due yet
+    assert await tick(now) == 0
+    scheduled, _ = await snapshot()
+    assert all(slot > now for slot in scheduled.values())
+
+    # Run late: a day after the last slot, so the tick lands on the next local day for every user
+    late = max(scheduled.values()) + timedelta(days=1)
+    queued = await tick(late)
+    advanced, keys = await snapshot()
+    print(f"late tick queued {queued} deliveries for {users} users")
+    assert queued == users, queued
+    assert all(advanced[user_id] > late for user_id in advanced), "next_problem should move past the tick"
+
+    # Keyed by the day of the slot that came due, not the day of the late tick
+    tz = {i: pytz.timezone(zones[i % len(zones)] or scheduler.DEFAULT_TIMEZONE) for i in range(1, users + 1)}
+    expected = {
+        f"daily_question:{i}:{pytz.utc.localize(slot).astimezone(tz[i]).date().isoformat()}"
+        for i, slot in scheduled.items()
+    }
+    assert set(keys) == expected, "job keys should name the local day of the due slot"
+
+    # The same tick again, and a replay of the old slots (as a replica that read them before the commit would),
+    # queue nothing new
+    assert await tick(late) == 0
+    async with db_session() as db:
+        for user in await db.scalars(select(User)):
+            user.next_problem = scheduled[user.id]
+        await db.commit()
+    assert await tick(late) == 0
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        jobs = await db.scalar(select(func.count()).select_from(Job))
+    assert jobs == users, f"{jobs} jobs for {users} slots"
+
+    await dispose_engine()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        check_slots(args.users)
+        asyncio.run(check_ticks(args.users))
+
+
+if __name__ == "__main__":
+    main()
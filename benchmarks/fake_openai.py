@@ -0,0 +1,219 @@
+"""A tiny OpenAI-compatible Chat Completions server for load tests and benchmarks.
+
+Only what the bot uses is implemented: ``POST /v1/chat/completions`` answering with a canned
+completion after a configurable latency. JSON-mode requests get a body shaped like the model the
+caller is about to validate (question generation or judge), based on the system prompt.
+
+With ``token_delay`` set, every word of the reply adds that much generation time. Streaming requests
+(``"stream": true``) get the first word after ``latency`` and the rest as server-sent events, one word
+every ``token_delay``; non-streaming ones get the whole reply once the last word would have been generated.
+
+With ``requests_per_second`` set, requests beyond that many in any one-second window are answered with
+429 and ``Retry-After: 1``, like an account hitting its rate limit.
+"""
+
+import asyncio
+import json
+import random
+import time
+from collections import deque
+
+QUESTION_JSON = {
+    "possible_topics": ["arithmetic", "geometry"],
+    "topic": "arithmetic",
+    "possible_questions": ["What is 6 x 7?", "What is 9 + 10?"],
+    "question": "What is 6 x 7?",
+    "solving_process": "Multiply 6 by 7.",
+    "expected_answer": "42",
+}
+
+SOLUTION_JSON = {
+    "summarized_solution": "The student multiplied 6 by 7.",
+    "is_correct": True,
+    "feedback": "Nicely done.",
+    "performance_explanation": "Quick and correct.",
+    "performance": 8,
+}
+
+JUDGED_SOLUTION_JSON = {**SOLUTION_JSON, "message": "You got it! 6 x 7 is indeed 42. Ready for another one?"}
+
+TEXT_REPLY = "Think about what multiplication means. What do you get if you add 6 seven times?"
+
+
+def completion_content(payload: dict, reply: str = TEXT_REPLY) -> str:
+    """Pick a canned reply that matches what the caller expects to parse."""
+    if payload.get("response_format", {}).get("type") != "json_object":
+        return reply
+
+    system_prompt = next((m["content"] for m in payload["messages"] if m["role"] == "system"), "")
+    if "possible_topics" in system_prompt:
+        return json.dumps(QUESTION_JSON)
+    if '"message"' in system_prompt:
+        return json.dumps(JUDGED_SOLUTION_JSON)
+    return json.dumps(SOLUTION_JSON)
+
+
+class FakeOpenAIServer:
+    def __init__(
+        self,
+        latency: float = 0.5,
+        jitter: float = 0.0,
+        token_delay: float = 0.0,
+        reply: str = TEXT_REPLY,
+        requests_per_second: float = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay
+        self.reply = reply
+        self.requests_per_second = requests_per_second
+        self.rate_limited = 0
+        self._accepted: deque[float] = deque()
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.prompt_chars: list[int] = []
+        # The messages of every request, in arrival order
+        self.prompts: list[list[dict]] = []
+        self._server: asyncio.Server | None = None
+        self._connections: set[asyncio.Task] = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> "FakeOpenAIServer":
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for task in self._connections:
+                task.cancel()
+            await asyncio.gather(*self._connections)
+            await self._server.wait_closed()
+
+    async def __aenter__(self) -> "FakeOpenAIServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._connections.add(asyncio.current_task())
+        try:
+            # Serve requests until the client closes the connection (HTTP keep-alive)
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                await self._handle_request(request_line.decode(), json.loads(body or b"{}"), writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def _handle_request(self, request_line: str, payload: dict, writer: asyncio.StreamWriter) -> None:
+        self.requests += 1
+        self.prompt_chars.append(sum(len(m.get("content") or "") for m in payload.get("messages", [])))
+        self.prompts.append(payload.get("messages", []))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if "/chat/completions" not in request_line:
+                self._write(writer, 404, {"error": {"message": "not found"}})
+                return
+
+            if self._over_rate_limit():
+                self.rate_limited += 1
+                error = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+                self._write(writer, 429, error, {"retry-after": "1"})
+                return
+
+            content = completion_content(payload, self.reply)
+            words = content.split(" ")
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+            if payload.get("stream"):
+                await self._stream(writer, payload, words)
+                return
+
+            await asyncio.sleep(self.token_delay * (len(words) - 1))
+            self._write(
+                writer,
+                200,
+                {
+                    "id": f"chatcmpl-{self.requests}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": payload.get("model", "fake"),
+                    "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                    ],
+                    "usage": {"prompt_tokens": 100, "completion_tokens": len(words), "total_tokens": 100 + len(words)},
+                },
+            )
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, writer: asyncio.StreamWriter, payload: dict, words: list[str]) -> None:
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            chunk = {
+                "id": f"chatcmpl-{self.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": payload.get("model", "fake"),
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else f" {word}"}, "finish_reason": None}],
+            }
+            self._write_event(writer, json.dumps(chunk))
+            await writer.drain()
+        if payload.get("stream_options", {}).get("include_usage"):
+            usage = {"prompt_tokens": 100, "completion_tokens": len(words), "total_tokens": 100 + len(words)}
+            self._write_event(writer, json.dumps({**chunk, "choices": [], "usage": usage}))
+        self._write_event(writer, "[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _write_event(writer: asyncio.StreamWriter, data: str) -> None:
+        event = f"data: {data}\n\n".encode()
+        writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+
+    def _over_rate_limit(self) -> bool:
+        if not self.requests_per_second:
+            return False
+        now = time.monotonic()
+        while self._accepted and self._accepted[0] <= now - 1:
+            self._accepted.popleft()
+        if len(self._accepted) >= self.requests_per_second:
+            return True
+        self._accepted.append(now)
+        return False
+
+    @staticmethod
+    def _write(writer: asyncio.StreamWriter, status: int, body: dict, headers: dict | None = None) -> None:
+        data = json.dumps(body).encode()
+        extra = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+        writer.write(
+            f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n{extra}\r\n".encode()
+            + data
+        )
@@ -0,0 +1,253 @@
+"""A tiny Telegram Bot API server for load tests and benchmarks.
+
+Point a bot at it with ``base_url=server.base_url``. It answers the methods the bot calls (``getMe``,
+``sendMessage``, ``editMessageText``, ``sendChatAction`` and friends) with minimal valid results, records every
+message sent, and enforces Telegram's flood limits: more than ``global_per_second`` calls in any second, or more
+than ``chat_per_second`` calls to one chat, are answered with 429 and ``retry_after``.
+
+Users "send" messages with ``send_text``; a polling bot receives them from ``getUpdates``, which long-polls like
+the real one. Calls to chats in ``blocked`` are answered with 403, as for a user who blocked the bot, and the next
+``unavailable[chat_id]`` calls to a chat with 502, as during a Telegram outage. Every call takes ``latency`` plus up
+to ``jitter`` seconds.
+
+For benchmarks that call handlers directly instead, ``fake_update``, ``fake_context``, ``FakeMessage`` and
+``FakeBot`` stand in for the python-telegram-bot objects a handler uses.
+"""
+
+import asyncio
+import contextlib
+import json
+import random
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from urllib.parse import parse_qsl
+
+
+class FakeTelegramServer:
+    def __init__(
+        self,
+        latency: float = 0.02,
+        jitter: float = 0.0,
+        global_per_second: float = 30,
+        chat_per_second: float = 0,
+        retry_after: int = 1,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.global_per_second = global_per_second
+        self.chat_per_second = chat_per_second
+        self.retry_after = retry_after
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.flood_errors = 0
+        self.sent: list[tuple[int, str]] = []
+        self.calls: dict[str, int] = defaultdict(int)
+        # time.perf_counter() of the first call to each method
+        self.first_call: dict[str, float] = {}
+        self.blocked: set[int] = set()
+        self.unavailable: dict[int, int] = {}
+        self._updates: deque[dict] = deque()
+        self._update_posted = asyncio.Event()
+        self._next_update_id = 0
+        self._calls: deque[float] = deque()
+        self._chat_calls: dict[int, deque[float]] = defaultdict(deque)
+        self._next_message_id = 0
+        self._server: asyncio.Server | None = None
+        self._connections: set[asyncio.Task] = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self) -> "FakeTelegramServer":
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for task in self._connections:
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def __aenter__(self) -> "FakeTelegramServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                method = request_line.decode().split(" ")[1].rsplit("/", 1)[-1]
+                if headers.get("content-type", "").startswith("application/json"):
+                    params = json.loads(body or b"{}")
+                else:
+                    params = dict(parse_qsl(body.decode()))
+                status, response = await self._call(method, params)
+                data = json.dumps(response).encode()
+                head = f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n"
+                writer.write(head.encode() + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+    def send_text(self, user_id: int, text: str) -> int:
+        """Queue a private message from ``user_id`` for the bot's next ``getUpdates``; returns its update id."""
+        self._next_update_id += 1
+        self._next_message_id += 1
+        message = {
+            "message_id": self._next_message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        self._updates.append({"update_id": self._next_update_id, "message": message})
+        self._update_posted.set()
+        return self._next_update_id
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        # Updates below the offset were confirmed by the bot and are dropped, as Telegram does
+        offset = int(params.get("offset") or 0)
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+
+        if not self._updates:
+            self._update_posted.clear()
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._update_posted.wait(), float(params.get("timeout") or 0))
+        return list(self._updates)[: int(params.get("limit") or 100)]
+
+    def _flooded(self, chat_id: int | None) -> bool:
+        now = time.monotonic()
+        windows = [(self._calls, self.global_per_second)]
+        if chat_id is not None:
+            windows.append((self._chat_calls[chat_id], self.chat_per_second))
+        for window, limit in windows:
+            while window and window[0] <= now - 1:
+                window.popleft()
+            if limit and len(window) >= limit:
+                return True
+        for window, _ in windows:
+            window.append(now)
+        return False
+
+    async def _call(self, method: str, params: dict) -> tuple[int, dict]:
+        self.requests += 1
+        self.calls[method] += 1
+        self.first_call.setdefault(method, time.perf_counter())
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": await self._get_updates(params)}
+
+        chat_id = int(params["chat_id"]) if "chat_id" in params else None
+        if method != "getMe" and self._flooded(chat_id):
+            self.flood_errors += 1
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+
+        if chat_id in self.blocked:
+            return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+        if self.unavailable.get(chat_id):
+            self.unavailable[chat_id] -= 1
+            return 502, {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Tutor", "username": "tutor_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            self._next_message_id += 1
+            self.sent.append((chat_id, params.get("text", "")))
+            result = {
+                "message_id": int(params.get("message_id", self._next_message_id)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return 200, {"ok": True, "result": result}
+
+
+class FakeMessage:
+    """A user's message passed to a handler, recording the replies to it (an edit replaces the last one).
+
+    Each reply or edit takes ``latency`` plus up to ``jitter`` seconds.
+    """
+
+    def __init__(self, user_id: int, text: str = "", latency: float = 0.01, jitter: float = 0.0):
+        self.from_user = SimpleNamespace(id=user_id, first_name=f"User {user_id}")
+        self.chat_id = user_id
+        self.text = text
+        self.latency = latency
+        self.jitter = jitter
+        self.replies: list[str] = []
+        self.edits = 0
+        # time.monotonic() when the first reply was sent
+        self.first_reply_at: float | None = None
+
+    async def reply_text(self, text: str, **kwargs) -> "FakeMessage":
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.first_reply_at is None:
+            self.first_reply_at = time.monotonic()
+        self.replies.append(text)
+        # Edits to the reply are recorded here too
+        return self
+
+    async def edit_text(self, text: str, **kwargs) -> None:
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        self.edits += 1
+        self.replies[-1] = text
+
+
+class FakeBot:
+    """``context.bot`` for a handler: records messages sent to chats; every call takes ``latency`` seconds."""
+
+    def __init__(self, latency: float = 0.01):
+        self.latency = latency
+        self.sent: list[tuple[int, str]] = []
+
+    async def send_chat_action(self, **kwargs) -> None:
+        await asyncio.sleep(self.latency)
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        await asyncio.sleep(self.latency)
+        self.sent.append((chat_id, text))
+
+
+def fake_update(user_id: int, text: str = "", **message_options) -> SimpleNamespace:
+    """An update carrying a private ``FakeMessage`` from ``user_id``."""
+    message = FakeMessage(user_id, text, **message_options)
+    return SimpleNamespace(message=message, effective_message=message, effective_user=message.from_user)
+
+
+def fake_context(args: list[str] | None = None, bot: FakeBot | None = None) -> SimpleNamespace:
+    """A handler's ``context`` with the command's ``args``."""
+    return SimpleNamespace(args=args or [], bot=bot or FakeBot())
@@ -0,0 +1,142 @@
+"""Exercise /healthz and /readyz on the status server: probe caching, failure detection and a wedged loop.
+
+Runs the threaded status server against a scratch SQLite database with short health thresholds, then checks
+that a burst of readiness probes costs only a handful of database pings, that stale polls and failing
+OpenAI requests make the bot unready, and that a blocked event loop fails liveness while every probe still
+gets an answer within the probe timeout:
+
+    python -m benchmarks.health_probes --probes 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def get(port: int, path: str) -> tuple[int, dict, float]:
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=10) as response:
+            status, body = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read()
+    return status, json.loads(body), time.perf_counter() - started
+
+
+async def run(probes: int) -> None:
+    from http.server import ThreadingHTTPServer
+
+    from sqlalchemy import event
+
+    from src import health
+    from src.async_db import dispose_engine, get_async_engine, init_db
+    from src.status_server import StatusPageHandler
+
+    await init_db()
+
+    pings = 0
+
+    def on_execute(conn, cursor, statement, *_):
+        nonlocal pings
+        pings += statement == "SELECT 1"
+
+    event.listen(get_async_engine().sync_engine, "before_cursor_execute", on_execute)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StatusPageHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    port = httpd.server_address[1]
+
+    async def probe(path: str) -> tuple[int, dict, float]:
+        return await asyncio.to_thread(get, port, path)
+
+    health.start_monitoring(polling=True)
+    await asyncio.sleep(0.1)
+
+    status, body, _ = await probe("/readyz")
+    print(f"before the first poll: /readyz {status} {body['checks']['telegram']}")
+    assert status == 503
+
+    health.record_telegram_success()
+    health.record_openai_result(ok=True)
+    await asyncio.sleep(health.HEALTH_CACHE_SECONDS)
+
+    # A burst of probes shares the cached result instead of pinging the database each time
+    pings = 0
+    started = time.perf_counter()
+    results = await asyncio.gather(*(probe("/readyz") for _ in range(probes)))
+    elapsed = time.perf_counter() - started
+    budget = int(elapsed / health.HEALTH_CACHE_SECONDS) + 2
+    print(f"{probes} /readyz probes in {elapsed:.2f}s: {pings} database pings (at most {budget} allowed)")
+    assert all(status == 200 for status, _, _ in results), results[0]
+    assert pings <= budget
+
+    await asyncio.sleep(health.HEALTH_TELEGRAM_MAX_AGE + health.HEALTH_CACHE_SECONDS)
+    status, body, _ = await probe("/readyz")
+    print(f"polls stopped: /readyz {status} {body['checks']['telegram']}")
+    assert status == 503
+    health.record_telegram_success()
+
+    health.record_openai_result(ok=False)
+    await asyncio.sleep(health.HEALTH_OPENAI_MAX_AGE + health.HEALTH_CACHE_SECONDS)
+    status, body, _ = await probe("/readyz")
+    print(f"OpenAI failing: /readyz {status} {body['checks']['openai']}")
+    assert status == 503
+    health.record_openai_result(ok=True)
+    health.record_telegram_success()
+
+    await asyncio.sleep(health.HEALTH_CACHE_SECONDS)
+    status, _, _ = await probe("/readyz")
+    assert status == 200, "the bot should be ready again once polls and OpenAI recover"
+
+    # Wedge the loop: the status server threads must keep answering, and report it
+    stall = health.HEALTH_LOOP_STALL_SECONDS + 1
+    wedged = {}
+
+    def probe_while_wedged() -> None:
+        time.sleep(stall - 0.5)
+        wedged["healthz"] = get(port, "/healthz")
+        wedged["readyz"] = get(port, "/readyz")
+
+    prober = threading.Thread(target=probe_while_wedged)
+    prober.start()
+    time.sleep(stall + health.HEALTH_PROBE_TIMEOUT + 1)  # Blocks the event loop on purpose
+    prober.join()
+
+    for path, (status, body, took) in wedged.items():
+        print(f"wedged loop: /{path} {status} {body['checks']} in {took:.2f}s")
+    assert wedged["healthz"][0] == 503
+    assert wedged["readyz"][0] == 503
+    assert wedged["readyz"][2] < health.HEALTH_PROBE_TIMEOUT + 2
+
+    await asyncio.sleep(health.HEALTH_HEARTBEAT_INTERVAL * 2)
+    status, _, _ = await probe("/healthz")
+    assert status == 200, "liveness should recover once the loop runs again"
+
+    health.stop_monitoring()
+    httpd.shutdown()
+    await dispose_engine()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--probes", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        os.environ.setdefault("HEALTH_CACHE_SECONDS", "0.5")
+        os.environ.setdefault("HEALTH_PROBE_TIMEOUT", "1")
+        os.environ.setdefault("HEALTH_LOOP_STALL_SECONDS", "2")
+        os.environ.setdefault("HEALTH_TELEGRAM_MAX_AGE", "1")
+        os.environ.setdefault("HEALTH_OPENAI_MAX_AGE", "1")
+        asyncio.run(run(args.probes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Check that queued daily deliveries survive a worker crash, and measure the job queue's throughput.
+
+Seeds a scratch SQLite database with ``--users`` users and queues a daily question for each (queueing them again
+must add nothing). A ``python -m src.worker`` process then works through the jobs against fake OpenAI and
+Telegram servers and is killed with SIGKILL a third of the way in, leaving jobs it had claimed in "running".
+Two fresh workers then finish the queue, reclaiming those jobs once their lease runs out; the lease is shorter
+than a delivery, so jobs still running are only kept from the other worker by renewing it. Every user must get
+their question, at most the jobs caught mid-delivery may be delivered twice, and the users who blocked the bot
+must end up dead-lettered after a single attempt. Some users' chats fail for longer than a delivery retries for,
+so their jobs are retried and must send the question the first attempt stored rather than make another one:
+
+    python -m benchmarks.job_queue --users 500 --workers 20 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+
+def worker_environment(openai_url: str, telegram_url: str, workers: int) -> dict[str, str]:
+    return os.environ | {
+        "OPENAI_BASE_URL": openai_url,
+        "TELEGRAM_BASE_URL": telegram_url,
+        "JOB_WORKERS": str(workers),
+        # Shorter than many deliveries take, so the running ones are only kept from a second worker by renewing
+        # their lease, and the killed worker's jobs are reclaimed within the run
+        "JOB_LEASE_SECONDS": "0.6",
+        "JOB_POLL_SECONDS": "0.2",
+        "JOB_RETRY_DELAY": "0.2",
+        "DAILY_QUESTION_RETRY_DELAY": "0.05",
+    }
+
+
+async def start_worker(env: dict[str, str], log) -> asyncio.subprocess.Process:
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "src.worker", cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+
+async def stop_worker(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(process.wait(), 10)
+        except TimeoutError:
+            process.kill()
+            await process.wait()
+
+
+async def run(users: int, workers: int, latency: float, timeout: float) -> None:
+    from benchmarks.fake_openai import FakeOpenAIServer
+    from benchmarks.fake_telegram import FakeTelegramServer
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:fake")
+
+    from sqlalchemy import func, select
+
+    from src.async_db import db_session, dispose_engine, init_db
+    from src.db import Job, TutorSession, User
+    from src.scheduler import DAILY_QUESTION_MAX_ATTEMPTS, enqueue_daily_questions
+
+    await init_db()
+    user_ids = range(4_000_000, 4_000_000 + users)
+    async with db_session() as db:
+        db.add_all(User(id=user_id, subject="algebra", memo="") for user_id in user_ids)
+        await db.commit()
+
+    queued = await enqueue_daily_questions()
+    requeued = await enqueue_daily_questions()
+
+    async def statuses() -> Counter:
+        async with db_session() as db:
+            # noinspection PyTypeChecker
+            return Counter(dict((await db.execute(select(Job.status, func.count()).group_by(Job.status))).all()))
+
+    async with (
+        FakeOpenAIServer(latency=latency, jitter=latency / 2) as openai_server,
+        FakeTelegramServer(latency=0.01, global_per_second=0) as telegram_server,
+    ):
+        telegram_server.blocked = set(user_ids[::50])
+        # Fails every attempt the first try at the job makes
+        flaky = set(user_ids[1::50])
+        telegram_server.unavailable = dict.fromkeys(flaky, DAILY_QUESTION_MAX_ATTEMPTS)
+        env = worker_environment(openai_server.base_url, telegram_server.base_url, workers)
+
+        with tempfile.TemporaryFile() as log:
+            started = time.perf_counter()
+            processes = [await start_worker(env, log)]
+            try:
+                while len(telegram_server.sent) < users // 3:
+                    if processes[0].returncode is not None or time.perf_counter() - started > timeout:
+                        log.seek(0)
+                        raise AssertionError(f"the worker stalled:\n{log.read().decode()[-3000:]}")
+                    await asyncio.sleep(0.01)
+                processes[0].kill()
+                await processes[0].wait()
+                at_kill = await statuses()
+
+                processes = [await start_worker(env, log) for _ in range(2)]
+                while (counts := await statuses())["pending"] or counts["running"]:
+                    if time.perf_counter() - started > timeout:
+                        log.seek(0)
+                        raise AssertionError(f"the queue did not drain: {counts}\n{log.read().decode()[-3000:]}")
+                    await asyncio.sleep(0.1)
+                elapsed = time.perf_counter() - started
+            finally:
+                for process in processes:
+                    await stop_worker(process)
+
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        jobs = (await db.scalars(select(Job))).all()
+        # noinspection PyTypeChecker
+        sessions = Counter((await db.scalars(select(TutorSession.user_id))).all())
+    await dispose_engine()
+
+    delivered = Counter(chat_id for chat_id, _ in telegram_server.sent)
+    duplicates = sum(count - 1 for count in delivered.values() if count > 1)
+    dead = [job for job in jobs if job.status == "dead"]
+    print(f"{queued} jobs queued, {requeued} more on queueing again")
+    print(f"killed the first worker with {at_kill['running']} jobs running and {at_kill['done']} done")
+    print(
+        f"{counts['done']} done and {counts['dead']} dead in {elapsed:.1f}s ({len(jobs) / elapsed:.0f} jobs/s); "
+        f"{duplicates} duplicate deliveries; {openai_server.requests} OpenAI requests"
+    )
+
+    assert queued == users and requeued == 0, (queued, requeued)
+    assert all(delivered[user_id] >= 1 for user_id in user_ids if user_id not in telegram_server.blocked)
+    assert duplicates <= at_kill["running"], (duplicates, at_kill)
+    # A retry sends the question the earlier attempt stored instead of storing another
+    assert max(sessions.values()) == 1, "a retried delivery should not store a second question"
+    assert all(delivered[user_id] >= 1 for user_id in flaky)
+    assert all(job.attempts > 1 for job in jobs if job.payload["user_id"] in flaky)
+    assert {job.payload["user_id"] for job in dead} == telegram_server.blocked
+    assert all("Forbidden" in job.last_error for job in dead)
+    assert all(job.status == "done" for job in jobs if job.payload["user_id"] not in telegram_server.blocked)
+    # Blocked users are not retried, except when the crash cut their only attempt short
+    assert sum(job.attempts > 1 for job in dead) <= at_kill["running"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=20, help="jobs each worker process runs at once")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake OpenAI latency in seconds")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # The fakes enforce no rate limits, so the client-side limiters would only measure themselves
+        os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "0")
+        os.environ.setdefault("TELEGRAM_GLOBAL_PER_SECOND", "0")
+        os.environ.setdefault("TELEGRAM_CHAT_PER_SECOND", "0")
+        # Every delivery generates its question, so each job makes one OpenAI request
+        os.environ.setdefault("QUESTION_POOL_SIZE", "0")
+        asyncio.run(run(args.users, args.workers, args.latency, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Check that exactly one replica runs the scheduler, and measure how fast another takes over.
+
+Runs ``--replicas`` elections for the scheduler lease against one scratch SQLite database, as that many bot
+replicas would, each with its own APScheduler ticking every 50ms while it leads. Samples who leads for a while,
+then stops the leader cleanly (it releases the lease) and later "crashes" the next one (it stops renewing without
+releasing), and reports how long the scheduler went without a leader each time:
+
+    python -m benchmarks.leader_election --replicas 3 --lease 1 --renew 0.25
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections import Counter
+
+
+async def run(replicas: int, lease: float, renew: float, observe: float) -> None:
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+    from src.async_db import dispose_engine, init_db
+    from src.leader import LeaderElection
+
+    await init_db()
+
+    ticks: Counter = Counter()
+    stray_ticks = 0
+    elections: list[LeaderElection] = []
+
+    def replica(index: int) -> LeaderElection:
+        scheduler = AsyncIOScheduler()
+
+        # A coroutine job runs on the event loop; a plain function would go to a thread pool and could still be
+        # running just after the scheduler paused
+        async def tick() -> None:
+            nonlocal stray_ticks
+            ticks[index] += 1
+            stray_ticks += not elections[index].is_leader
+
+        scheduler.add_job(tick, "interval", seconds=0.05)
+        scheduler.start(paused=True)
+        return LeaderElection("scheduler", scheduler.resume, scheduler.pause, lease_seconds=lease, renew_seconds=renew)
+
+    def leaders() -> list[LeaderElection]:
+        return [election for election in elections if election.is_leader]
+
+    async def wait_for_new_leader(previous: LeaderElection) -> float:
+        started = time.perf_counter()
+        while not [e for e in leaders() if e is not previous]:
+            await asyncio.sleep(0.005)
+        return time.perf_counter() - started
+
+    elections.extend(replica(i) for i in range(replicas))
+    for election in elections:
+        election.start()
+
+    most_at_once = 0
+    deadline = time.perf_counter() + observe
+    while time.perf_counter() < deadline:
+        most_at_once = max(most_at_once, len(leaders()))
+        await asyncio.sleep(0.01)
+    first = leaders()[0]
+
+    # A clean shutdown hands the lease over
+    await first.stop()
+    clean_failover = await wait_for_new_leader(first)
+    second = leaders()[0]
+
+    # A crash leaves the lease to expire
+    second._task.cancel()
+    second.is_leader = False
+    second.on_deposed()
+    crash_failover = await wait_for_new_leader(second)
+
+    for election in elections:
+        await election.stop()
+    await dispose_engine()
+
+    print(f"{replicas} replicas: at most {most_at_once} leader(s) at once over {observe:.0f}s")
+    print(f"scheduler ticks by replica: {dict(sorted(ticks.items()))}, {stray_ticks} outside leadership")
+    print(f"failover after a clean stop: {clean_failover * 1000:.0f}ms; after a crash: {crash_failover * 1000:.0f}ms")
+
+    assert most_at_once == 1, most_at_once
+    assert stray_ticks == 0
+    assert clean_failover < renew + 0.5, clean_failover
+    assert crash_failover < lease + renew + 0.5, crash_failover
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--lease", type=float, default=1.0, help="lease length in seconds")
+    parser.add_argument("--renew", type=float, default=0.25, help="renewal (and takeover poll) interval")
+    parser.add_argument("--observe", type=float, default=3.0, help="seconds to watch the leadership before failovers")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        asyncio.run(run(args.replicas, args.lease, args.renew, args.observe))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Check the per-request OpenAI usage records and measure what recording them costs.
+
+Drives the real handlers from ``main.create_bot`` for ``--users`` users (/start, /subject, /question, a text
+message, /hint, /solve and /giveup each) against a fake OpenAI server, then runs a daily question fan-out, with
+the usage writer running in the background. Checks that every request the server saw has a row in llm_usage,
+attributed to its function and user (and session, where there is one), that the rows were written in one batched
+INSERT per flush of the writer rather than one per request, and prints the per-function summary /usage_stats
+shows. Also times the bookkeeping a single request pays for tracing:
+
+    python -m benchmarks.llm_usage --users 50 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from benchmarks.fake_telegram import FakeBot, fake_context, fake_update
+
+SCRIPT = [
+    ("start", "/start"),
+    ("subject", "/subject algebra"),
+    ("question", "/question"),
+    ("message", "Should I multiply first?"),
+    ("hint", "/hint"),
+    ("solve", "/solve 42"),
+    ("giveup", "/giveup"),
+]
+
+
+def tracing_overhead(calls: int) -> float:
+    """Seconds of tracing bookkeeping per request, without the request."""
+    from src import llm_usage
+
+    usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20, total_tokens=120)
+    pending = list(llm_usage._pending)
+    started = time.perf_counter()
+    for _ in range(calls):
+        with llm_usage.trace_call("gpt-5") as call:
+            call.sent()
+            call.add_usage(usage)
+        # Keep the buffer from filling up (and records from being dropped) while timing
+        llm_usage._pending.clear()
+    elapsed = time.perf_counter() - started
+    llm_usage._pending.extend(pending)
+    llm_usage.stats.recorded -= calls
+    return elapsed / calls
+
+
+async def run(users: int, latency: float) -> None:
+    from benchmarks.fake_openai import FakeOpenAIServer
+
+    async with FakeOpenAIServer(latency=latency) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:fake")
+
+        from sqlalchemy import event, func, select
+
+        import main
+        from src import llm_usage
+        from src.async_db import db_session, dispose_engine, get_all_users_with_subject, get_async_engine, init_db
+        from src.db import LLMUsage, utcnow
+        from src.openai_handler import close_clients, wait_for_summaries
+        from src.scheduler import generate_daily_questions
+
+        await init_db()
+
+        inserts = 0
+
+        def on_execute(conn, cursor, statement, *_):
+            nonlocal inserts
+            if statement.startswith("INSERT INTO llm_usage"):
+                inserts += 1
+
+        event.listen(get_async_engine().sync_engine, "before_cursor_execute", on_execute)
+
+        application = main.create_bot()
+        callbacks = {}
+        for handler in application.handlers[0]:
+            key = sorted(handler.commands)[0] if hasattr(handler, "commands") else "message"
+            callbacks[key] = handler.callback
+
+        async def conversation(user_id: int) -> None:
+            for command, text in SCRIPT:
+                context = fake_context(text.split()[1:])
+                await callbacks[command](fake_update(user_id, text), context)
+
+        started = utcnow()
+        writer_started = time.perf_counter()
+        llm_usage.start_usage_writer()
+        try:
+            await asyncio.gather(*(conversation(3_000_000 + i) for i in range(users)))
+            async with db_session() as db:
+                fanout_users = await get_all_users_with_subject(db)
+            await generate_daily_questions(FakeBot(), fanout_users)
+            await wait_for_summaries()
+            await llm_usage.stop_usage_writer()
+            writer_seconds = time.perf_counter() - writer_started
+
+            async with db_session() as db:
+                # noinspection PyTypeChecker
+                rows = (await db.scalars(select(LLMUsage))).all()
+                # noinspection PyTypeChecker
+                users_seen = await db.scalar(select(func.count(func.distinct(LLMUsage.user_id))))
+            summary = await llm_usage.usage_summary(started)
+        finally:
+            # A handler that raised must not leave the writer, clients or pool running (and the script hanging)
+            await llm_usage.stop_usage_writer()
+            await close_clients()
+            await dispose_engine()
+
+    overhead = tracing_overhead(20_000)
+
+    print(f"{server.requests} OpenAI requests, {len(rows)} usage rows written in {inserts} INSERTs")
+    print(f"{'function':<24} {'calls':>6} {'tokens':>12} {'cost':>9} {'queued':>8} {'avg':>8} {'max':>8}")
+    for f in summary:
+        print(
+            f"{f.function:<24} {f.calls:>6} {f.prompt_tokens:>6}+{f.completion_tokens:<5} ${f.cost:>8.4f} "
+            f"{f.queue_wait * 1000:>6.1f}ms {f.latency * 1000:>6.0f}ms {f.max_latency * 1000:>6.0f}ms"
+        )
+    print(f"tracing bookkeeping: {overhead * 1e6:.1f}µs per request; writer {llm_usage.stats}")
+
+    functions = Counter(row.function for row in rows)
+    assert len(rows) == server.requests, (len(rows), server.requests)
+    # The writer flushes on its timer (or a full batch) and once more on stop, however many rows there are; a flush
+    # also writes what was recorded while its first INSERT ran, so allow it a second one
+    flushes = writer_seconds / llm_usage.LLM_USAGE_FLUSH_SECONDS + len(rows) / llm_usage.LLM_USAGE_BATCH_SIZE + 1
+    assert inserts <= llm_usage.stats.batches and inserts <= 2 * flushes, (inserts, flushes, llm_usage.stats)
+    assert llm_usage.stats.dropped == 0 and llm_usage.stats.errors == 0, llm_usage.stats
+    assert all(row.user_id is not None for row in rows), "every request is made for a user"
+    assert all(row.session_id is not None for row in rows if row.function != "chat_generate_question")
+    assert users_seen == users
+    assert all(row.outcome == "ok" and row.prompt_tokens > 0 and row.cost > 0 for row in rows)
+    assert {f.function: f.calls for f in summary} == dict(functions)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake OpenAI latency in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # The fake server has no rate limits, so the client-side limiters would only measure themselves
+        os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "0")
+        # Refills would still be making requests after the writer stops
+        os.environ.setdefault("QUESTION_POOL_SIZE", "0")
+        # Flush often enough that the writer runs (and batches) while the conversations are going on
+        os.environ.setdefault("LLM_USAGE_FLUSH_SECONDS", "0.5")
+        asyncio.run(run(args.users, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""End-to-end load test: the real bot, polling a fake Telegram Bot API and talking to a fake OpenAI server.
+
+Boots ``main.create_bot()`` against ``FakeTelegramServer`` (over real ``getUpdates`` long polling and Bot API
+calls) and ``FakeOpenAIServer``, both with configurable latency and jitter. ``--users`` scripted learners each
+go through /start, /subject, /question, a chat turn, /hint, /solve, another /question and /giveup, pausing up
+to ``--think`` seconds between steps; then everyone gets a daily question fan-out.
+
+A command's latency runs from the moment the learner sends it to the moment its handler returns, so it covers
+polling, the handler, the model and every reply. Reports throughput, p50/p95/p99 latency and database
+round-trips per command, the fan-out rate and the process's memory, and saves them as JSON so two commits can
+be compared:
+
+    python -m benchmarks.load_test --users 50 --latency 0.5 --jitter 0.5
+    python -m benchmarks.load_test --compare benchmarks/results/<earlier run>.json
+
+Set DATABASE_URL to run against Postgres instead of a scratch SQLite file. The fakes enforce no rate limits, so
+the bot's limiters are off unless their variables are set.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from datetime import UTC, datetime
+from pathlib import Path
+
+SCRIPT = [
+    ("/start", "/start"),
+    ("/subject", "/subject algebra"),
+    ("/question", "/question"),
+    ("chat", "Should I multiply first?"),
+    ("/hint", "/hint"),
+    ("/solve", "/solve 42"),
+    ("/question", "/question"),
+    ("/giveup", "/giveup"),
+]
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# The command whose handler (or background work it started) is running, for attributing database round-trips
+_command = contextvars.ContextVar("command", default="other")
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile; ``q`` in 0-100."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True)
+        return commit + ("-dirty" if dirty.stdout.strip() else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from benchmarks.fake_openai import FakeOpenAIServer
+    from benchmarks.fake_telegram import FakeTelegramServer
+
+    rss_before = peak_rss_mb()
+    rng = random.Random(args.seed)
+
+    async with (
+        FakeOpenAIServer(latency=args.latency, jitter=args.jitter) as openai_server,
+        FakeTelegramServer(
+            latency=args.telegram_latency, jitter=args.telegram_jitter, global_per_second=0
+        ) as telegram_server,
+    ):
+        os.environ["OPENAI_BASE_URL"] = openai_server.base_url
+        os.environ["TELEGRAM_BASE_URL"] = telegram_server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:fake")
+
+        from sqlalchemy import event
+
+        import main
+        from src.async_db import db_session, get_all_users_with_subject, get_async_engine
+        from src.scheduler import generate_daily_questions
+
+        # main configures INFO logging; a line per HTTP request and update would drown the report
+        logging.getLogger().setLevel(logging.WARNING)
+
+        db_calls: dict[str, dict[str, int]] = defaultdict(lambda: {"statements": 0, "commits": 0})
+
+        def on_execute(*_):
+            db_calls[_command.get()]["statements"] += 1
+
+        def on_commit(*_):
+            db_calls[_command.get()]["commits"] += 1
+
+        event.listen(get_async_engine().sync_engine, "before_cursor_execute", on_execute)
+        event.listen(get_async_engine().sync_engine, "commit", on_commit)
+
+        application = main.create_bot()
+
+        # Signal each update's completion to the learner waiting on it
+        handled: dict[int, asyncio.Future] = {}
+        commands: dict[int, str] = {}
+
+        def track(callback):
+            async def wrapper(update, context):
+                _command.set(commands.get(update.update_id, "other"))
+                try:
+                    result = await callback(update, context)
+                except Exception as e:
+                    if update.update_id in handled and not handled[update.update_id].done():
+                        handled[update.update_id].set_exception(e)
+                    raise
+                if update.update_id in handled and not handled[update.update_id].done():
+                    handled[update.update_id].set_result(None)
+                return result
+
+            return wrapper
+
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                handler.callback = track(handler.callback)
+
+        await application.initialize()
+        await application.post_init(application)
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+
+        latencies: dict[str, list[float]] = defaultdict(list)
+        errors: dict[str, int] = defaultdict(int)
+
+        async def learner(user_id: int) -> None:
+            await asyncio.sleep(rng.uniform(0, args.ramp))
+            for command, text in SCRIPT:
+                update_id = telegram_server.send_text(user_id, text)
+                commands[update_id] = command
+                handled[update_id] = asyncio.get_running_loop().create_future()
+                started = time.perf_counter()
+                try:
+                    await asyncio.wait_for(handled[update_id], args.timeout)
+                    latencies[command].append(time.perf_counter() - started)
+                except Exception:
+                    errors[command] += 1
+                await asyncio.sleep(rng.uniform(0, args.think))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(learner(6_000_000 + i) for i in range(args.users)))
+        interactive = time.perf_counter() - started
+
+        async with db_session() as db:
+            fanout_users = await get_all_users_with_subject(db)
+        _command.set("daily fan-out")
+        summary = await generate_daily_questions(application.bot, fanout_users)
+        _command.set("other")
+
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        await application.post_shutdown(application)
+
+    completed = sum(len(v) for v in latencies.values())
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(UTC).isoformat(timespec="seconds"),
+        "config": vars(args) | {"database": get_async_engine().url.get_backend_name()},
+        "interactive": {
+            "duration": interactive,
+            "commands": completed,
+            "throughput": completed / interactive,
+        },
+        "commands": {
+            command: {
+                "count": len(values),
+                "errors": errors[command],
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": max(values),
+                "db_statements": db_calls[command]["statements"] / len(values),
+                "db_commits": db_calls[command]["commits"] / len(values),
+            }
+            for command, values in latencies.items()
+        },
+        "fanout": {
+            "users": summary.total,
+            "sent": summary.sent,
+            "failed": summary.failed,
+            "duration": summary.duration,
+            "per_second": summary.sent / summary.duration if summary.duration else 0.0,
+            "db_statements": db_calls["daily fan-out"]["statements"],
+        },
+        "db": {
+            "statements": sum(c["statements"] for c in db_calls.values()),
+            "commits": sum(c["commits"] for c in db_calls.values()),
+        },
+        "openai_requests": openai_server.requests,
+        "telegram_calls": dict(telegram_server.calls),
+        "memory": {"rss_before_mb": rss_before, "peak_rss_mb": peak_rss_mb()},
+    }
+
+
+def report(results: dict, baseline: dict | None) -> None:
+    interactive, fanout, memory = results["interactive"], results["fanout"], results["memory"]
+    print(
+        f"{results['config']['users']} learners, {interactive['commands']} commands in {interactive['duration']:.1f}s "
+        f"({interactive['throughput']:.1f}/s) on {results['config']['database']} at {results['commit']}"
+    )
+    print(f"{'command':<12} {'count':>6} {'errors':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'db stmts':>9} {'commits':>8}")
+    for command, stats in results["commands"].items():
+        line = (
+            f"{command:<12} {stats['count']:>6} {stats['errors']:>6} {stats['p50'] * 1000:>6.0f}ms "
+            f"{stats['p95'] * 1000:>6.0f}ms {stats['p99'] * 1000:>6.0f}ms {stats['db_statements']:>9.1f} "
+            f"{stats['db_commits']:>8.1f}"
+        )
+        before = (baseline or {}).get("commands", {}).get(command)
+        if before:
+            line += (
+                f"   p50 {(stats['p50'] / before['p50'] - 1):+.0%}, p95 {(stats['p95'] / before['p95'] - 1):+.0%}"
+                f" vs {baseline['commit']}"
+            )
+        print(line)
+    print(
+        f"daily fan-out: {fanout['sent']}/{fanout['users']} sent in {fanout['duration']:.2f}s "
+        f"({fanout['per_second']:.1f}/s), {fanout['failed']} failed"
+    )
+    print(
+        f"database: {results['db']['statements']} statements, {results['db']['commits']} commits; "
+        f"OpenAI: {results['openai_requests']} requests; Telegram: {sum(results['telegram_calls'].values())} calls"
+    )
+    print(f"memory: peak RSS {memory['peak_rss_mb']:.0f}MB ({memory['rss_before_mb']:.0f}MB before the run)")
+    if baseline:
+        print(
+            f"throughput {interactive['throughput'] / baseline['interactive']['throughput'] - 1:+.0%}, "
+            f"fan-out rate {fanout['per_second'] / baseline['fanout']['per_second'] - 1:+.0%}, "
+            f"peak RSS {memory['peak_rss_mb'] - baseline['memory']['peak_rss_mb']:+.0f}MB vs {baseline['commit']}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5, help="fake OpenAI latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="extra random OpenAI latency, up to this much")
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--telegram-jitter", type=float, default=0.02)
+    parser.add_argument("--think", type=float, default=1.0, help="longest pause between a learner's commands")
+    parser.add_argument("--ramp", type=float, default=5.0, help="learners start spread over this many seconds")
+    parser.add_argument("--timeout", type=float, default=60.0, help="give up on a command after this long")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help=f"where to save the results (default: under {RESULTS_DIR})")
+    parser.add_argument("--compare", type=Path, help="results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # The fakes have no rate limits, so the client-side limiters would only measure themselves
+        for name in (
+            "OPENAI_REQUESTS_PER_MINUTE",
+            "OPENAI_TOKENS_PER_MINUTE",
+            "TELEGRAM_GLOBAL_PER_SECOND",
+            "TELEGRAM_CHAT_PER_SECOND",
+        ):
+            os.environ.setdefault(name, "0")
+        config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+        results = asyncio.run(run(argparse.Namespace(**config)))
+
+    output = args.output or RESULTS_DIR / f"{results['timestamp'].replace(':', '')}-{results['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+
+    report(results, baseline)
+    print(f"saved to {output}")
+
+    for command, stats in results["commands"].items():
+        assert stats["errors"] == 0, f"{stats['errors']} {command} commands failed or timed out"
+    assert sum(stats["count"] for stats in results["commands"].values()) == args.users * len(SCRIPT)
+    assert results["fanout"]["sent"] == args.users, results["fanout"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Check that conversation history reads back in insertion order and that timestamps come from the database.
+
+Writes ``--messages`` messages to each of ``--sessions`` sessions concurrently and as fast as possible, so
+many share a timestamp, then reads every history back through ``get_session_messages``. It also checks
+that ``updated_at`` moves on an update and that the history query is served by an index without a sort:
+
+    python -m benchmarks.message_order --sessions 50 --messages 40
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+
+async def run(sessions: int, messages: int) -> None:
+    from sqlalchemy import select, text
+
+    from src.async_db import (
+        create_message,
+        create_tutor_session,
+        db_session,
+        dispose_engine,
+        get_async_engine,
+        get_session_messages,
+        init_db,
+        update_session,
+    )
+    from src.db import Message, TutorSession
+
+    await init_db()
+
+    async with db_session() as db:
+        session_ids = [
+            (await create_tutor_session(db, i, "math", "", f"Question {i}", "", "", None)).id
+            for i in range(1, sessions + 1)
+        ]
+
+    async def write(session_id: int) -> None:
+        async with db_session() as db:
+            for n in range(messages):
+                await create_message(db, session_id, "user" if n % 2 == 0 else "assistant", str(n))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(write(session_id) for session_id in session_ids))
+    elapsed = time.perf_counter() - started
+
+    async with db_session() as db:
+        histories = [await get_session_messages(db, session_id) for session_id in session_ids]
+        distinct_timestamps = len({m.created_at for history in histories for m in history})
+
+        # The database fills created_at in, and it is loaded back on insert
+        message = await create_message(db, session_ids[0], "user", "timestamp check")
+        assert message.created_at is not None, "created_at should be returned by the insert"
+
+        tutor_session = await db.get(TutorSession, session_ids[0])
+        created, updated = tutor_session.created_at, tutor_session.updated_at
+        await asyncio.sleep(1.1)
+        tutor_session = await update_session(db, session_ids[0], attempted=1)
+        moved = tutor_session.updated_at > updated and tutor_session.created_at == created
+
+        query = select(Message).filter(Message.session_id == session_ids[0]).order_by(Message.id)
+        sql = str(query.compile(get_async_engine().sync_engine, compile_kwargs={"literal_binds": True}))
+        plan = " ".join(str(row) for row in (await db.execute(text(f"EXPLAIN QUERY PLAN {sql}"))).all())
+
+    await dispose_engine()
+
+    total = sessions * messages
+    print(f"{total} messages written in {elapsed:.2f}s with {distinct_timestamps} distinct created_at values")
+    print(f"updated_at moved on update: {moved}")
+    print(f"history query plan: {plan}")
+
+    for history in histories:
+        assert [m.content for m in history] == [str(n) for n in range(messages)], "history came back out of order"
+    assert moved, "updated_at should change when a session is written"
+    assert "TEMP B-TREE" not in plan, "history reads should not need a sort"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        asyncio.run(run(args.sessions, args.messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Drive the instrumented handlers and a daily fan-out, then scrape /metrics and show where the time went.
+
+Registers the real handlers from ``main.create_bot`` and feeds them fake updates for ``--users`` users
+(/start, /subject, /question and a text message each) against a fake OpenAI server, runs a daily question
+fan-out to the same users, then reads ``/metrics`` over HTTP from the webhook-mode web server:
+
+    python -m benchmarks.metrics_scrape --users 50 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.fake_telegram import FakeBot, fake_context, fake_update
+
+
+async def scrape(port: int) -> str:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 200"), head
+    return body.decode()
+
+
+def parse(text: str) -> dict[str, dict[str, float]]:
+    """Samples by metric name, keyed by their label string."""
+    samples = defaultdict(dict)
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        match = re.fullmatch(r"(\w+)(\{.*\})? (\S+)", line)
+        assert match, f"malformed sample line: {line!r}"
+        samples[match[1]][match[2] or ""] = float(match[3])
+    return samples
+
+
+def mean_by_label(samples: dict, name: str, label: str) -> dict[str, tuple[float, float]]:
+    """Count and mean of a histogram, per value of ``label``."""
+    result = {}
+    for labels, count in samples[f"{name}_count"].items():
+        value = re.search(rf'{label}="([^"]*)"', labels)[1]
+        result[value] = (count, samples[f"{name}_sum"][labels] / count if count else 0.0)
+    return result
+
+
+async def run(users: int, latency: float) -> None:
+    from benchmarks.fake_openai import FakeOpenAIServer
+
+    async with FakeOpenAIServer(latency=latency) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:fake")
+
+        import main
+        from src.async_db import db_session, dispose_engine, get_all_users_with_subject, init_db
+        from src.openai_handler import close_clients, wait_for_summaries
+        from src.scheduler import generate_daily_questions
+        from src.web_server import create_web_server
+
+        await init_db()
+
+        application = main.create_bot()
+        callbacks = {}
+        for handler in application.handlers[0]:
+            key = sorted(handler.commands)[0] if hasattr(handler, "commands") else "message"
+            callbacks[key] = handler.callback
+        context = fake_context(["algebra"])
+
+        async def conversation(user_id: int) -> None:
+            for command, text in (("start", "/start"), ("subject", "/subject algebra"), ("question", "/question")):
+                await callbacks[command](fake_update(user_id, text), context)
+            await callbacks["message"](fake_update(user_id, "Is it 42?"), context)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(conversation(2_000_000 + i) for i in range(users)))
+        async with db_session() as db:
+            fanout_users = await get_all_users_with_subject(db)
+        await generate_daily_questions(FakeBot(), fanout_users)
+        await wait_for_summaries()
+        elapsed = time.perf_counter() - started
+
+        web = create_web_server(lambda data: asyncio.sleep(0))
+        web.host, web.port = "127.0.0.1", 0
+        await web.start()
+        try:
+            scrape_started = time.perf_counter()
+            text = await scrape(web.port)
+            scrape_time = time.perf_counter() - scrape_started
+        finally:
+            await web.close()
+            await close_clients()
+            await dispose_engine()
+
+    samples = parse(text)
+    print(f"{users} conversations and a {len(fanout_users)}-user fan-out in {elapsed:.2f}s")
+    print(f"/metrics: {len(text.splitlines())} lines, scraped in {scrape_time * 1000:.1f}ms")
+    for title, name, label in (
+        ("handlers", "tutor_bot_handler_duration_seconds", "handler"),
+        ("OpenAI", "tutor_bot_openai_request_duration_seconds", "function"),
+        ("DB", "tutor_bot_db_query_duration_seconds", "statement"),
+    ):
+        print(f"{title}:")
+        for value, (count, mean) in sorted(mean_by_label(samples, name, label).items()):
+            print(f"  {value:<24} {count:>6.0f} calls, mean {mean * 1000:8.1f}ms")
+
+    handled = samples["tutor_bot_handler_requests_total"]
+    assert handled['{handler="question",outcome="ok"}'] == users, handled
+    assert samples["tutor_bot_updates_in_flight"][""] == 0
+    assert samples["tutor_bot_fanout_users_total"]['{outcome="sent"}'] == users
+    assert samples["tutor_bot_fanout_pending_users"][""] == 0
+    assert samples["tutor_bot_db_pool_checked_out"][""] == 0
+    assert samples["tutor_bot_db_pool_checkouts_total"][""] > 0
+    assert samples["tutor_bot_user_cache_requests_total"]['{outcome="hit"}'] > 0, "handlers should reuse cached users"
+    tokens = samples["tutor_bot_openai_tokens_total"]
+    assert tokens['{function="chat_message",kind="completion"}'] > 0, "streamed replies should report usage"
+    assert tokens['{function="chat_generate_question",kind="prompt"}'] > 0, tokens
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake OpenAI latency in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # The fake server has no rate limits, so the client-side limiters would only measure themselves
+        os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "0")
+        # Refills would make the question and fan-out OpenAI calls depend on timing
+        os.environ.setdefault("QUESTION_POOL_SIZE", "0")
+        asyncio.run(run(args.users, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Measure how much the question pool takes off /question latency.
+
+Seeds users in a scratch SQLite database, then asks each for a question twice: once with an empty
+pool (every request waits for the fake model) and once after the background refill has run (every
+request is a DB read). Requests arrive ``--interval`` seconds apart, as they would from real users;
+SQLite takes a file lock per write, so firing them all at the same instant measures lock contention
+rather than the pool. Finally, users change subject while their refill for the old one is still running, and
+their pools must end up holding only questions for the new subject:
+
+    python -m benchmarks.question_pool --users 50 --latency 2.0 --interval 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+
+async def run(users: int, latency: float, interval: float) -> None:
+    async with FakeOpenAIServer(latency=latency) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+        from sqlalchemy import func, select
+
+        from src.async_db import db_session, dispose_engine, init_db
+        from src.db import PooledQuestion, User
+        from src.metrics import QUESTION_POOL_REFILLED, QUESTION_POOL_REQUESTS
+        from src.openai_handler import generate_question_async
+        from src.question_pool import (
+            QUESTION_POOL_SIZE,
+            evict_user_pool,
+            schedule_refill,
+            stats,
+            stop_refills,
+            take_question,
+            wait_for_refills,
+        )
+
+        await init_db()
+
+        seeded = [User(id=i, subject="algebra", memo="fractions") for i in range(1, users + 1)]
+        async with db_session() as db:
+            db.add_all(seeded)
+            await db.commit()
+
+        async def ask(user: User) -> float:
+            await asyncio.sleep(user.id * interval)
+            started = time.monotonic()
+            if await take_question(user) is None:
+                await generate_question_async(user.subject, user.memo)
+            schedule_refill(user)
+            return time.monotonic() - started
+
+        cold = await asyncio.gather(*(ask(user) for user in seeded))
+
+        # Let the background refills from the cold round finish before the warm round
+        await wait_for_refills()
+        warm = await asyncio.gather(*(ask(user) for user in seeded))
+
+        # The warm round's refills are still generating algebra questions; switch everyone to geometry, as
+        # /subject does
+        async with db_session() as db:
+            for user in seeded:
+                user.subject = "geometry"
+                await db.merge(user)
+            await db.commit()
+            for user in seeded:
+                await evict_user_pool(db, user.id)
+                schedule_refill(user)
+        await wait_for_refills()
+        async with db_session() as db:
+            # noinspection PyTypeChecker
+            pooled = (
+                await db.execute(select(PooledQuestion.subject, func.count()).group_by(PooledQuestion.subject))
+            ).all()
+
+        await stop_refills()
+        await dispose_engine()
+
+    for name, timings in (("empty pool", cold), ("warm pool", warm)):
+        print(f"{name}: median {statistics.median(timings) * 1000:.0f}ms, max {max(timings) * 1000:.0f}ms")
+    print(f"hits {stats.hits}, misses {stats.misses}, hit rate {stats.hit_rate:.0%}, generated {stats.refilled}")
+    print(f"pooled after switching subject: {dict(pooled)}")
+
+    assert stats.hits == users and stats.misses == users
+    assert QUESTION_POOL_REQUESTS.value(outcome="hit") == stats.hits, "pool hits should be exported on /metrics"
+    assert QUESTION_POOL_REFILLED.value() == stats.refilled
+    assert dict(pooled) == {"geometry": users * QUESTION_POOL_SIZE}, "stale or missing refills after /subject"
+    assert max(warm) < latency / 2, "a pooled question should not wait for the model"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # The fake server has no rate limits, so the client-side limiters would only measure themselves
+        os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "0")
+        asyncio.run(run(args.users, args.latency, args.interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Run the daily question fan-out against rate-limited fakes, with and without the bot's rate limiters.
+
+The fake OpenAI server answers 429 beyond ``--openai-rps`` requests per second and the fake Telegram server
+answers flood-control 429s beyond ``--telegram-rps`` messages per second. Without limiters the fan-out
+finds those limits through errors (flood-waits fail the delivery, since only the limiter waits them out); with
+them it should queue instead and see none:
+
+    python -m benchmarks.rate_limits --users 300 --openai-rps 40 --telegram-rps 30
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+
+async def run(users: int, openai_rps: float, telegram_rps: float, latency: float) -> None:
+    from benchmarks.fake_openai import FakeOpenAIServer
+    from benchmarks.fake_telegram import FakeTelegramServer
+
+    async with (
+        FakeOpenAIServer(latency=latency, requests_per_second=openai_rps) as openai_server,
+        FakeTelegramServer(global_per_second=telegram_rps) as telegram_server,
+    ):
+        os.environ["OPENAI_BASE_URL"] = openai_server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+        from telegram.ext import ExtBot
+
+        import src.openai_handler as openai_handler
+        from src.async_db import db_session, dispose_engine, ensure_user_exists, init_db, update_user_subject
+        from src.metrics import RATE_LIMIT_WAIT
+        from src.rate_limit import TelegramRateLimiter
+        from src.scheduler import generate_daily_questions
+
+        await init_db()
+
+        async with db_session() as db:
+            fan_out_users = []
+            for i in range(users):
+                await ensure_user_exists(db, 4_000_000 + i)
+                fan_out_users.append(await update_user_subject(db, 4_000_000 + i, "algebra"))
+
+        results = {}
+        for limited in (False, True):
+            # Requests per minute at the fake's limit, with a little headroom
+            openai_handler.OPENAI_REQUESTS_PER_MINUTE = openai_rps * 60 * 0.95 if limited else 0
+            openai_handler.OPENAI_TOKENS_PER_MINUTE = 0
+            # The fake counts any one-second window, which a saved-up burst on top of the rate would overrun
+            openai_handler.OPENAI_RATE_LIMIT_BURST_SECONDS = 0
+            bot = ExtBot(
+                "123456:fake",
+                base_url=telegram_server.base_url,
+                rate_limiter=TelegramRateLimiter(global_per_second=telegram_rps * 0.95) if limited else None,
+            )
+            await bot.initialize()
+
+            openai_429s, floods = openai_server.rate_limited, telegram_server.flood_errors
+            wait_before = RATE_LIMIT_WAIT.count(limiter="telegram")
+            started = time.perf_counter()
+            summary = await generate_daily_questions(bot, fan_out_users)
+            elapsed = time.perf_counter() - started
+
+            await bot.shutdown()
+            await openai_handler.close_clients()
+            results[limited] = (
+                summary,
+                elapsed,
+                openai_server.rate_limited - openai_429s,
+                telegram_server.flood_errors - floods,
+                RATE_LIMIT_WAIT.count(limiter="telegram") - wait_before,
+            )
+
+        await dispose_engine()
+
+    for limited, (summary, elapsed, openai_429s, floods, queued) in results.items():
+        name = "limited" if limited else "unlimited"
+        print(
+            f"{name:>9}: {summary.sent} sent, {summary.failed} failed in {elapsed:.2f}s "
+            f"({summary.sent / elapsed:.1f}/s); OpenAI 429s: {openai_429s}, Telegram flood errors: {floods}"
+            + (f", {queued} Telegram calls through the limiter" if limited else "")
+        )
+
+    summary, _, openai_429s, floods, _ = results[True]
+    assert summary.sent == users and summary.failed == 0, summary
+    assert openai_429s == 0, "the OpenAI limiter should keep the fan-out under the request limit"
+    assert floods == 0, "the Telegram limiter should keep the fan-out under the flood limit"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--openai-rps", type=float, default=40)
+    parser.add_argument("--telegram-rps", type=float, default=30)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake OpenAI latency in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # Refills would add OpenAI calls of their own
+        os.environ.setdefault("QUESTION_POOL_SIZE", "0")
+        asyncio.run(run(args.users, args.openai_rps, args.telegram_rps, args.latency))
+
+
+if __name__ == "__main__":
+    main()
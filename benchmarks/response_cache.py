@@ -0,0 +1,134 @@
+"""Measure how many completions the response cache saves on /hint and /giveup.
+
+Seeds ``--users`` sessions whose questions repeat across ``--questions`` distinct problems (as they do when the
+model hands several learners of a subject the same question), then has every learner ask for a hint before any
+conversation and give up, against a fake OpenAI server. The first two learners on each question arrive together
+and with copies that differ only in whitespace, which the cache key ignores, so one completion serves both; the
+rest arrive afterwards, ``--interval`` seconds apart. Hits are plain reads, so the script also checks the cache
+table is written no more than once per entry while they are served:
+
+    python -m benchmarks.response_cache --users 60 --questions 6 --latency 1.0
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+async def run(users: int, questions: int, latency: float, interval: float) -> None:
+    from benchmarks.fake_openai import FakeOpenAIServer
+
+    async with FakeOpenAIServer(latency=latency) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+        from sqlalchemy import event, func, select
+
+        import src.response_cache as response_cache
+        from src.async_db import create_tutor_session, db_session, dispose_engine, get_async_engine, init_db
+        from src.db import CachedResponse
+        from src.openai_handler import chat_giveup_async, chat_message_async, close_clients
+
+        await init_db()
+
+        cache_writes = 0
+
+        def on_execute(conn, cursor, statement, *_):
+            nonlocal cache_writes
+            if statement.startswith(("INSERT INTO response_cache", "UPDATE response_cache")):
+                cache_writes += 1
+
+        event.listen(get_async_engine().sync_engine, "before_cursor_execute", on_execute)
+
+        sessions = []
+        async with db_session() as db:
+            for i in range(users):
+                # Every other copy of a question has stray whitespace, as regenerated text often does
+                padding = "  " if i // questions % 2 else ""
+                sessions.append(
+                    await create_tutor_session(
+                        db=db,
+                        user_id=5_000_000 + i,
+                        subject="algebra",
+                        memo="",
+                        question=f"What is {i % questions} +{padding} 1?",
+                        solving_process=f"Add one to {i % questions}.",
+                        expected_answer=str(i % questions + 1),
+                        thread_id=None,
+                    )
+                )
+
+        async def learner(index: int, delay: float = 0) -> tuple[float, float]:
+            await asyncio.sleep(delay)
+            session = sessions[index]
+            async with db_session() as db:
+                started = time.perf_counter()
+                await chat_message_async(session, "I need a hint.", db, cache=True)
+                hint = time.perf_counter() - started
+
+                started = time.perf_counter()
+                await chat_giveup_async(session, db)
+                giveup = time.perf_counter() - started
+            return hint, giveup
+
+        first = await asyncio.gather(*(learner(i) for i in range(2 * questions)))
+        rest = await asyncio.gather(*(learner(i, (i - 2 * questions) * interval) for i in range(2 * questions, users)))
+        completions = server.requests
+
+        async with db_session() as db:
+            # noinspection PyTypeChecker
+            entries = await db.scalar(select(func.count()).select_from(CachedResponse))
+
+        # Shrink the bound and prune, as a long-running bot would once the table outgrew it
+        response_cache.RESPONSE_CACHE_MAX_ENTRIES = questions
+        evicted = await response_cache.prune()
+
+        await close_clients()
+        await dispose_engine()
+
+    stats = response_cache.stats
+    requests = 2 * users
+    print(
+        f"{requests} hint and give-up requests: {completions} completions, {entries} cache entries, "
+        f"{cache_writes} cache writes"
+    )
+    print(f"hits {stats.hits}, misses {stats.misses}, hit rate {stats.hit_rate:.0%}, errors {stats.errors}")
+    for name, timings in (("first learners", first), ("later learners", rest)):
+        hints, giveups = [t[0] for t in timings], [t[1] for t in timings]
+        print(
+            f"{name}: hint median {statistics.median(hints) * 1000:.0f}ms, "
+            f"give-up median {statistics.median(giveups) * 1000:.0f}ms, max {max(hints + giveups) * 1000:.0f}ms"
+        )
+    print(f"pruned to {questions} entries: {evicted} evicted")
+
+    # One completion per distinct question for each of the two prompts, whatever the whitespace
+    assert completions == 2 * questions, completions
+    assert stats.misses == 2 * questions and stats.hits == requests - 2 * questions, stats
+    assert stats.errors == 0
+    # Each entry is stored once, and a hit within RESPONSE_CACHE_TOUCH_SECONDS of that leaves the row alone
+    assert cache_writes == entries, f"hits should not write to the cache table: {cache_writes} writes"
+    assert evicted == entries - questions
+    assert max(max(t) for t in rest) < latency / 2, "later learners should be served from the cache"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--questions", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--interval", type=float, default=0.02)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # The fake server has no rate limits, so the client-side limiters would only measure themselves
+        os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "0")
+        asyncio.run(run(args.users, args.questions, args.latency, args.interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Load test: hundreds of concurrent fake updates must return every pooled connection.
+
+Drives the real handlers from ``main.py`` with fake Telegram updates against a scratch SQLite
+database through aiosqlite (or whatever ``DATABASE_URL`` points at) and checks the engine's checked-out connection
+count is back to zero once they finish, including updates whose handler raised:
+
+    python -m benchmarks.session_scope --updates 500
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fake_telegram import fake_context
+from benchmarks.fake_telegram import fake_update as _fake_update
+
+# Replies take a random moment, so the handlers finish in a shuffled order
+fake_update = functools.partial(_fake_update, latency=0, jitter=0.01)
+
+
+async def run(updates: int) -> None:
+    import main
+    from src.async_db import dispose_engine, get_async_engine, init_db
+
+    await init_db()
+
+    engine = get_async_engine().sync_engine
+
+    checked_out = peak = 0
+
+    def on_checkout(*_):
+        nonlocal checked_out, peak
+        checked_out += 1
+        peak = max(peak, checked_out)
+
+    def on_checkin(*_):
+        nonlocal checked_out
+        checked_out -= 1
+
+    from sqlalchemy import event
+
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+
+    async def broken_handler(update, context, db):
+        await main.get_user_from_update(update, db)
+        raise RuntimeError("handler failed")
+
+    broken = main.with_db(broken_handler)
+
+    calls = []
+    for i in range(updates):
+        user_id = 1_000_000 + i
+        calls.append(main.start(fake_update(user_id, "/start"), fake_context([])))
+        calls.append(main.handle_subject(fake_update(user_id, "/subject"), fake_context(["algebra"])))
+        calls.append(main.handle_memo(fake_update(user_id, "/memo"), fake_context(["keep", "it", "short"])))
+        if i % 10 == 0:
+            calls.append(broken(fake_update(user_id, "boom"), fake_context([])))
+    random.shuffle(calls)
+
+    started = time.perf_counter()
+    try:
+        results = await asyncio.gather(*calls, return_exceptions=True)
+    finally:
+        elapsed = time.perf_counter() - started
+        checked_out_after = engine.pool.checkedout()
+        await dispose_engine()
+
+    failures = [r for r in results if isinstance(r, Exception)]
+    print(f"{len(calls)} updates in {elapsed:.2f}s ({len(failures)} raised on purpose)")
+    print(f"peak checked-out connections: {peak}, pool size: {engine.pool.size()}")
+    print(f"checked-out connections after the run: {checked_out_after}")
+
+    assert all(isinstance(r, RuntimeError) for r in failures), failures
+    assert checked_out_after == 0, "sessions leaked connections"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # Only the handlers' own sessions are under test; pool refills would call out to OpenAI
+        os.environ.setdefault("QUESTION_POOL_SIZE", "0")
+        asyncio.run(run(args.updates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Compare end-to-end /solve latency for the combined and two-call judge modes.
+
+Drives ``main.handle_solve`` with fake Telegram updates against the fake OpenAI server, so each
+model call costs ``--latency`` seconds. The combined judge should answer in about one call's time. Also checks
+that a judge reply missing its verdict gets the error message rather than failing the handler:
+
+    python -m benchmarks.solve_pipeline --users 20 --latency 1.0
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.fake_telegram import FakeBot, FakeMessage, fake_context, fake_update
+
+
+async def run(users: int, latency: float) -> None:
+    from benchmarks import fake_openai
+    from benchmarks.fake_openai import FakeOpenAIServer
+
+    async with FakeOpenAIServer(latency=latency) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+        from sqlalchemy import func, select
+
+        import main
+        from src.async_db import create_tutor_session, db_session, dispose_engine, init_db
+        from src.db import SolutionResponse, User
+        from src.openai_handler import close_clients
+
+        await init_db()
+
+        async with db_session() as db:
+            db.add_all(User(id=i, subject="math") for i in range(1, users + 1))
+            await db.commit()
+
+        async def solve(user_id: int) -> tuple[float, FakeMessage]:
+            update = fake_update(user_id, "/solve 42", latency=0)
+            started = time.monotonic()
+            await main.handle_solve(update, fake_context(["42"], FakeBot(latency=0)))
+            return time.monotonic() - started, update.message
+
+        results = {}
+        for mode in ("two_call", "combined"):
+            main.JUDGE_MODE = mode
+            async with db_session() as db:
+                for i in range(1, users + 1):
+                    await create_tutor_session(db, i, "math", "", "What is 6 x 7?", "Multiply.", "42", None)
+
+            before = server.requests
+            runs = await asyncio.gather(*(solve(i) for i in range(1, users + 1)))
+            results[mode] = ([t for t, _ in runs], (server.requests - before) / users)
+            assert all(len(m.replies) == 2 for _, m in runs), "each /solve should acknowledge and then answer"
+
+        # A combined reply without its "message" fails to parse
+        fake_openai.JUDGED_SOLUTION_JSON, judged = fake_openai.SOLUTION_JSON, fake_openai.JUDGED_SOLUTION_JSON
+        async with db_session() as db:
+            stored = await db.scalar(select(func.count()).select_from(SolutionResponse))
+            await create_tutor_session(db, 1, "math", "", "What is 6 x 7?", "Multiply.", "42", None)
+        _, failed = await solve(1)
+        fake_openai.JUDGED_SOLUTION_JSON = judged
+        async with db_session() as db:
+            stored_after = await db.scalar(select(func.count()).select_from(SolutionResponse))
+
+        await close_clients()
+        await dispose_engine()
+
+    for mode, (timings, calls) in results.items():
+        print(
+            f"{mode}: median {statistics.median(timings):.2f}s, max {max(timings):.2f}s, {calls:.0f} model calls per /solve"
+        )
+
+    assert failed.replies[-1] == main.TUTOR_ERROR_MESSAGE and len(failed.replies) == 2, failed.replies
+    assert stored_after == stored, "a failed judgement should not be stored"
+    assert statistics.median(results["combined"][0]) < statistics.median(results["two_call"][0]) * 0.75
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # The fake server has no rate limits, so the client-side limiters would only measure themselves
+        os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "0")
+        os.environ.setdefault("STREAM_REPLIES", "false")
+        os.environ.setdefault("QUESTION_POOL_SIZE", "0")
+        asyncio.run(run(args.users, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Compare when a tutor reply first becomes visible with and without streaming.
+
+Runs ``chat_giveup_async`` through ``StreamingReply`` against a fake OpenAI server that generates one
+word every ``--token-delay`` seconds, and a fake Telegram message that records sends and edits. A last run
+times out the first few edits; the whole reply must still be delivered and stored:
+
+    python -m benchmarks.streaming_replies --words 200 --latency 1.0 --token-delay 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from telegram.error import TimedOut
+
+from benchmarks.fake_telegram import FakeMessage
+
+
+class FlakyMessage(FakeMessage):
+    """A message whose first few edits time out, as they would on a flaky network."""
+
+    def __init__(self, *args, failures: int = 3, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+
+    async def edit_text(self, text: str, **kwargs) -> None:
+        if self.failures:
+            self.failures -= 1
+            await asyncio.sleep(self.latency)
+            raise TimedOut()
+        await super().edit_text(text, **kwargs)
+
+
+async def run(words: int, latency: float, token_delay: float) -> None:
+    reply = " ".join(f"word{i}" for i in range(words))
+
+    from benchmarks.fake_openai import FakeOpenAIServer
+
+    async with FakeOpenAIServer(latency=latency, token_delay=token_delay, reply=reply) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+        import src.openai_handler as openai_handler
+        from src.async_db import create_tutor_session, db_session, dispose_engine, get_session_messages, init_db
+        from src.utils import StreamingReply
+
+        await init_db()
+
+        results = {}
+        runs = (
+            ("buffered", False, FakeMessage(1, latency=0.05)),
+            ("streaming", True, FakeMessage(1, latency=0.05)),
+            ("flaky edits", True, FlakyMessage(1, latency=0.05)),
+        )
+        for name, streaming, message in runs:
+            openai_handler.STREAM_REPLIES = streaming
+            async with db_session() as db:
+                session = await create_tutor_session(db, 1, "math", "", "What is 6 x 7?", "Multiply.", "42", None)
+
+                started = time.monotonic()
+                streamed = StreamingReply(message)
+                response = await openai_handler.chat_giveup_async(session, db, on_text=streamed.update)
+                await streamed.finish(response)
+                total = time.monotonic() - started
+
+                stored = await get_session_messages(db, session.id)
+
+            assert message.replies[-1] == reply, "the final message should hold the whole reply"
+            assert [m.role for m in stored] == ["user", "assistant"], "the reply should be stored exactly once"
+            results[name] = (message.first_reply_at - started, total, message.edits)
+
+        await openai_handler.close_clients()
+        await dispose_engine()
+
+    for name, (first_visible, total, edits) in results.items():
+        print(f"{name}: first text after {first_visible:.2f}s, complete after {total:.2f}s, {edits} edits")
+
+    assert results["streaming"][0] < results["buffered"][0] / 2, "streaming should show the reply much earlier"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # The fake server has no rate limits, so the client-side limiters would only measure themselves
+        os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "0")
+        # Both runs give up on the same question; a cached explanation would skip the model the second time
+        os.environ.setdefault("RESPONSE_CACHE_MAX_ENTRIES", "0")
+        asyncio.run(run(args.words, args.latency, args.token_delay))
+
+
+if __name__ == "__main__":
+    main()
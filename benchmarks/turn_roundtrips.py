@@ -0,0 +1,143 @@
+"""Count database round-trips and commits per tutoring command, before and after turn-level persistence.
+
+"Before" replays what each command used to write, one helper call (and commit) per row. "After"
+stages the same rows on a ``Turn`` and saves it once. Statements are counted at the driver, so
+batched inserts count as the single round-trip they are, and every COMMIT is another round-trip
+(and an fsync). Saving a turn must take fewer round-trips than the old writes, in a single commit:
+
+    python -m benchmarks.turn_roundtrips --repeat 50
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+SOLUTION = {
+    "full_solution": "{}",
+    "summarized_solution": "6 x 7",
+    "feedback": "Nicely done.",
+    "is_correct": True,
+    "performance_explanation": "Quick and correct.",
+    "performance": 8,
+}
+
+
+async def run(repeat: int) -> None:
+    from sqlalchemy import event
+
+    from src.async_db import (
+        Turn,
+        create_message,
+        create_solution_response,
+        create_tutor_session,
+        db_session,
+        dispose_engine,
+        get_async_engine,
+        get_current_session,
+        init_db,
+        save_turn,
+        update_session,
+    )
+
+    await init_db()
+
+    counts = {"statements": 0, "commits": 0}
+
+    def on_execute(*_):
+        counts["statements"] += 1
+
+    def on_commit(*_):
+        counts["commits"] += 1
+
+    event.listen(get_async_engine().sync_engine, "before_cursor_execute", on_execute)
+    event.listen(get_async_engine().sync_engine, "commit", on_commit)
+
+    # Each command as it used to persist, and as it persists now
+    async def message_before(db, session):
+        await create_message(db, session.id, "user", "Is it 42?")
+        await create_message(db, session.id, "assistant", "What makes you think so?")
+
+    async def message_after(db, session):
+        turn = Turn(session)
+        turn.add_message("user", "Is it 42?")
+        turn.add_message("assistant", "What makes you think so?")
+        await save_turn(db, turn)
+
+    async def solve_before(db, session):
+        await create_message(db, session.id, "user", "[SOLUTION ATTEMPT] 42")
+        await create_message(db, session.id, "assistant", "[JUDGE FEEDBACK] {}")
+        await update_session(db, session.id, attempted=session.attempted + 1, correct=True, completed=True)
+        await create_solution_response(db, session_id=session.id, **SOLUTION)
+        await create_message(db, session.id, "assistant", "You got it!")
+
+    async def solve_after(db, session):
+        turn = Turn(session)
+        turn.add_message("user", "[SOLUTION ATTEMPT] 42")
+        turn.add_message("assistant", "[JUDGE FEEDBACK] {}")
+        turn.add_message("assistant", "You got it!")
+        turn.update_session(attempted=session.attempted + 1, correct=True, completed=True)
+        turn.add_solution_response(**SOLUTION)
+        await save_turn(db, turn)
+
+    async def giveup_before(db, session):
+        await create_message(db, session.id, "user", "I give up.")
+        await create_message(db, session.id, "assistant", "The answer is 42.")
+        await update_session(db, session.id, completed=True)
+
+    async def giveup_after(db, session):
+        turn = Turn(session)
+        turn.add_message("user", "I give up.")
+        turn.add_message("assistant", "The answer is 42.")
+        turn.update_session(completed=True)
+        await save_turn(db, turn)
+
+    commands = {
+        "text message": (message_before, message_after),
+        "/solve": (solve_before, solve_after),
+        "/giveup": (giveup_before, giveup_after),
+    }
+
+    async with db_session() as db:
+        await create_tutor_session(db, 1, "math", "", "What is 6 x 7?", "Multiply.", "42", None)
+
+    for name, variants in commands.items():
+        line = []
+        round_trips = {}
+        for label, persist in zip(("before", "after"), variants, strict=True):
+            counts.update(statements=0, commits=0)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                async with db_session() as db:
+                    session = await get_current_session(db, 1)
+                    # Only count the writes, not the lookup every handler already does
+                    counts["statements"] -= 1
+                    await persist(db, session)
+            elapsed = (time.perf_counter() - started) / repeat
+            statements, commits = counts["statements"] / repeat, counts["commits"] / repeat
+            round_trips[label] = (statements + commits, commits)
+            line.append(
+                f"{label} {statements + commits:.0f} round-trips ({statements:.0f} statements, {commits:.0f} commits),"
+                f" {elapsed * 1000:.1f}ms"
+            )
+        print(f"{name}: " + " | ".join(line))
+
+        assert round_trips["after"][0] < round_trips["before"][0], f"{name}: saving a turn should batch its writes"
+        assert round_trips["after"][1] == 1, f"{name}: a turn should be saved in exactly one commit"
+
+    await dispose_engine()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        asyncio.run(run(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Count user-row reads on the chat path with and without the user cache.
+
+Resolves the user for ``--updates`` fake updates spread over ``--users`` users through
+``main.get_user_from_update``, as every handler does, and counts the statements that hit the
+database. It also checks a /subject change is visible on the very next update, and, as a webhook replica,
+that a change made by another replica is picked up once the (short) webhook TTL has passed:
+
+    python -m benchmarks.user_cache --users 100 --updates 5000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fake_telegram import fake_update
+
+
+async def run(users: int, updates: int) -> None:
+    from sqlalchemy import event, update
+
+    import main
+    from src.async_db import db_session, dispose_engine, get_async_engine, init_db, update_user_subject
+    from src.db import User
+    from src.metrics import USER_CACHE_REQUESTS
+    from src.user_cache import user_cache
+
+    await init_db()
+
+    statements = 0
+
+    def on_execute(*_):
+        nonlocal statements
+        statements += 1
+
+    event.listen(get_async_engine().sync_engine, "before_cursor_execute", on_execute)
+
+    user_ids = [random.randint(1, users) for _ in range(updates)]
+
+    async def resolve_all() -> float:
+        started = time.perf_counter()
+        for user_id in user_ids:
+            async with db_session() as db:
+                await main.get_user_from_update(fake_update(user_id), db)
+        return time.perf_counter() - started
+
+    # Create every user first so both runs only read
+    await resolve_all()
+
+    results = {}
+    for name, size in (("no cache", 0), ("cache", user_cache.max_size)):
+        user_cache.clear()
+        user_cache.max_size = size
+        statements = 0
+        elapsed = await resolve_all()
+        results[name] = (statements, elapsed)
+
+    # A write must be visible straight away, not after the TTL
+    async with db_session() as db:
+        await update_user_subject(db, 1, "topology")
+    async with db_session() as db:
+        fresh = await main.get_user_from_update(fake_update(1), db)
+
+    # Another replica handles a /subject: this one's cached copy goes stale until its TTL runs out
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        await db.execute(update(User).filter(User.id == 1).values(subject="geometry"))
+        await db.commit()
+    await asyncio.sleep(user_cache.ttl)
+    async with db_session() as db:
+        replicated = await main.get_user_from_update(fake_update(1), db)
+
+    await dispose_engine()
+
+    for name, (count, elapsed) in results.items():
+        print(f"{name}: {count} statements for {updates} updates, {elapsed / updates * 1e6:.0f}us per lookup")
+    stats = user_cache.stats
+    print(f"cache hits {stats.hits}, misses {stats.misses}, hit rate {stats.hit_rate:.0%}, TTL {user_cache.ttl:.0f}s")
+
+    assert fresh.subject == "topology", "the cache served a stale subject after /subject"
+    assert replicated.subject == "geometry", "another replica's /subject was not picked up after the TTL"
+    assert results["cache"][0] <= users, "cached lookups should not read the user row again"
+    assert USER_CACHE_REQUESTS.value(outcome="hit") == stats.hits, "cache hits should be exported on /metrics"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--updates", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        os.environ.setdefault("BOT_MODE", "webhook")
+        asyncio.run(run(args.users, args.updates))
+
+
+if __name__ == "__main__":
+    main()
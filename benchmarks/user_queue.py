@@ -0,0 +1,116 @@
+"""Compare handling bursts of text messages in parallel, queued per chat, and queued with coalescing.
+
+Each of ``--users`` users sends ``--burst`` messages ``--gap`` seconds apart to the real ``handle_message``
+against a fake OpenAI server with some latency jitter. Reports model calls, prompt characters sent, wall time,
+and how many users ended up with their messages stored out of the order they sent them:
+
+    python -m benchmarks.user_queue --users 50 --burst 3 --gap 0.1
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.fake_telegram import fake_context, fake_update
+
+
+async def run(users: int, burst: int, gap: float, latency: float) -> None:
+    from benchmarks.fake_openai import FakeOpenAIServer
+
+    async with FakeOpenAIServer(latency=latency, jitter=latency) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:fake")
+
+        import main
+        from src.async_db import (
+            create_tutor_session,
+            db_session,
+            dispose_engine,
+            ensure_user_exists,
+            get_session_messages,
+            init_db,
+            update_user_subject,
+        )
+        from src.openai_handler import close_clients, wait_for_summaries
+        from src.user_queue import UserQueue
+
+        await init_db()
+
+        modes = {
+            "parallel": main.handle_message,
+            "queued": UserQueue(window=0).coalesce(main.handle_message),
+            "coalesced": UserQueue().coalesce(main.handle_message),
+        }
+        context = fake_context()
+
+        for run_index, (name, handler) in enumerate(modes.items()):
+            user_ids = [3_000_000 + run_index * users + i for i in range(users)]
+            sessions = {}
+            async with db_session() as db:
+                for user_id in user_ids:
+                    await ensure_user_exists(db, user_id)
+                    await update_user_subject(db, user_id, "algebra")
+                    session = await create_tutor_session(
+                        db, user_id, "algebra", "", "What is 6 x 7?", "Multiply.", "42", None
+                    )
+                    sessions[user_id] = session.id
+
+            async def send_burst(user_id: int, handler=handler) -> None:
+                tasks = []
+                for i in range(burst):
+                    if i:
+                        await asyncio.sleep(gap)
+                    # Like python-telegram-bot with block=False, each update gets its own task
+                    tasks.append(asyncio.create_task(handler(fake_update(user_id, f"message {i}"), context)))
+                await asyncio.gather(*tasks)
+
+            requests, chars = server.requests, len(server.prompt_chars)
+            started = time.perf_counter()
+            await asyncio.gather(*(send_burst(user_id) for user_id in user_ids))
+            elapsed = time.perf_counter() - started
+            await wait_for_summaries()
+            calls = server.requests - requests
+            prompt_chars = sum(server.prompt_chars[chars:])
+
+            out_of_order = 0
+            async with db_session() as db:
+                for user_id in user_ids:
+                    stored = await get_session_messages(db, sessions[user_id])
+                    sent = [line for m in stored if m.role == "user" for line in m.content.split("\n")]
+                    assert sorted(sent) == [f"message {i}" for i in range(burst)], sent
+                    out_of_order += sent != sorted(sent)
+
+            print(
+                f"{name:>9}: {calls} model calls, {prompt_chars} prompt chars, {elapsed:.2f}s, "
+                f"{out_of_order}/{users} users with messages stored out of order"
+            )
+            if name != "parallel":
+                assert out_of_order == 0, "queued messages must be stored in the order they were sent"
+            if name == "coalesced":
+                assert calls < users * burst, "bursts should share model calls"
+
+        await close_clients()
+        await dispose_engine()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--burst", type=int, default=3)
+    parser.add_argument("--gap", type=float, default=0.1, help="seconds between a user's messages")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake OpenAI latency in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # The fake server has no rate limits, so the client-side limiters would only measure themselves
+        os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "0")
+        asyncio.run(run(args.users, args.burst, args.gap, args.latency))
+
+
+if __name__ == "__main__":
+    main()
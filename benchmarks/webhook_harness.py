@@ -0,0 +1,150 @@
+"""Replay synthetic Telegram updates against the webhook endpoint over keep-alive connections.
+
+By default starts the webhook server in-process with an ``on_update`` that only counts updates, checks that it
+answers 200 for good updates, 403 for a wrong secret and 400 for a malformed body, and reports throughput:
+
+    python -m benchmarks.webhook_harness --updates 5000 --connections 20
+
+Point ``--url`` at a running bot (BOT_MODE=webhook) to drive it instead; every update is a /start from a
+distinct synthetic user, so pass the bot's WEBHOOK_SECRET with ``--secret``:
+
+    python -m benchmarks.webhook_harness --url http://localhost:8080/telegram --secret change-me
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+def fake_update(update_id: int) -> dict:
+    user = {"id": 1_000_000 + update_id, "is_bot": False, "first_name": f"User {update_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"},
+            "from": user,
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 client connection."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.opened = 0
+
+    async def post(self, path: str, body: bytes, secret: str | None) -> int:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.opened += 1
+
+        headers = {"Host": self.host, "Content-Type": "application/json", "Content-Length": str(len(body))}
+        if secret is not None:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+        head = f"POST {path} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+        self.writer.write(head.encode() + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        response_headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode().partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        await self.reader.readexactly(int(response_headers.get("content-length", 0)))
+
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def replay(host: str, port: int, path: str, secret: str | None, updates: int, connections: int) -> None:
+    next_id = iter(range(1, updates + 1))
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    pool = [Connection(host, port) for _ in range(connections)]
+
+    async def worker(connection: Connection) -> None:
+        for update_id in next_id:
+            started = time.perf_counter()
+            status = await connection.post(path, json.dumps(fake_update(update_id)).encode(), secret)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(c) for c in pool))
+    elapsed = time.perf_counter() - started
+
+    wrong_secret = await pool[0].post(path, json.dumps(fake_update(0)).encode(), "wrong-secret")
+    malformed = await pool[0].post(path, b"{not json", secret)
+    for connection in pool:
+        connection.close()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{updates} updates over {connections} connections in {elapsed:.2f}s ({updates / elapsed:.0f} updates/s)")
+    print(f"latency p50 {quantiles[49] * 1000:.1f} ms, p95 {quantiles[94] * 1000:.1f} ms")
+    print(f"statuses: {statuses}, connections opened: {sum(c.opened for c in pool)}")
+    print(f"wrong secret -> {wrong_secret}, malformed body -> {malformed}")
+
+    assert statuses == {200: updates}, statuses
+    assert sum(c.opened for c in pool) == connections, "connections were not kept alive"
+    if secret:
+        assert wrong_secret == 403, wrong_secret
+    assert malformed == 400, malformed
+
+
+async def run_local(updates: int, connections: int) -> None:
+    from src.web_server import WEBHOOK_PATH, create_web_server, webhook_handler
+
+    secret = "harness-secret"
+    received = []
+
+    async def on_update(data: dict) -> None:
+        received.append(data["update_id"])
+
+    server = create_web_server(on_update)
+    server.host, server.port = "127.0.0.1", 0
+    # Replace the webhook route with one that requires the harness secret, whatever WEBHOOK_SECRET is set to
+    server.route("POST", WEBHOOK_PATH, webhook_handler(on_update, secret))
+    await server.start()
+    try:
+        await replay(server.host, server.port, WEBHOOK_PATH, secret, updates, connections)
+    finally:
+        await server.close()
+
+    print(f"updates delivered to on_update: {len(received)}")
+    assert sorted(received) == list(range(1, updates + 1)), "updates were lost or duplicated"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--connections", type=int, default=20)
+    parser.add_argument("--url", help="webhook URL of a running bot; by default a local server is started")
+    parser.add_argument("--secret", help="WEBHOOK_SECRET of the bot at --url")
+    args = parser.parse_args()
+
+    if args.url:
+        url = urlsplit(args.url)
+        asyncio.run(replay(url.hostname, url.port or 80, url.path, args.secret, args.updates, args.connections))
+    else:
+        asyncio.run(run_local(args.updates, args.connections))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,72 @@
 import asyncio
 import logging
 import os
+import signal
 import threading
 import traceback
+from datetime import timedelta
 
 import pytz
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy.ext.asyncio import AsyncSession
 from telegram import BotCommand, Update
-from telegram.constants import ChatAction
+from telegram.constants import ChatAction, ParseMode
 from telegram.ext import Application, CallbackContext, CommandHandler, ContextTypes, MessageHandler, filters
 
-from src.db import (
-    Session,
-    TutorSession,
-    User,
-    create_solution_response,
+from src.async_db import (
     create_tutor_session,
-    create_user,
+    dispose_engine,
     ensure_user_exists,
     get_current_session,
     get_user,
-    update_session,
+    init_db,
+    invalidate_old_sessions,
+    release_connection,
+    save_turn,
     update_user_memo,
+    update_user_play_mode,
     update_user_subject,
+    update_user_timezone,
 )
+from src.db import DB_MIGRATE_ON_START, Turn, User, utcnow
+from src.health import PollingRequest, record_telegram_success, start_monitoring, stop_monitoring
+from src.jobs import JOB_WORKERS, job_counts, requeue_dead, start_job_workers, stop_job_workers
+from src.jobs import stats as job_stats
+from src.leader import start_leader_election, stop_leader_elections
+from src.llm_usage import start_usage_writer, stop_usage_writer, usage_summary
 from src.openai_handler import (
-    chat_generate_question,
-    chat_giveup,
-    chat_judge_response,
-    chat_message,
-    chat_play,
-    chat_solution_attempt,
+    JUDGE_MODE,
+    chat_generate_question_async,
+    chat_giveup_async,
+    chat_judge_response_async,
+    chat_message_async,
+    chat_play_async,
+    chat_solution_attempt_async,
+    close_clients,
+    wait_for_summaries,
+)
+from src.question_pool import evict_user_pool, schedule_refill, stats, stop_refills, take_question
+from src.rate_limit import TelegramRateLimiter
+from src.response_cache import stats as response_cache_stats
+from src.scheduler import (
+    DAILY_QUESTION_HOUR,
+    DEFAULT_TIMEZONE,
+    SCHEDULER_MODE,
+    SCHEDULER_TICK_SECONDS,
+    enqueue_daily_questions,
+    enqueue_due_questions,
+    generate_daily_questions,
+    next_delivery_time,
 )
-from src.scheduler import generate_daily_question_for_user, generate_daily_questions
 from src.status_server import run_status_server
 from src.strings import (
-    ADMIN_DELIVERED_DAILY_QUESTION,
+    ADMIN_DAILY_QUESTION_SUMMARY,
+    ADMIN_JOB_COUNTS,
+    ADMIN_JOB_STATS,
+    ADMIN_JOBS_REQUEUED,
+    ADMIN_LLM_USAGE_FUNCTION,
+    ADMIN_LLM_USAGE_SUMMARY,
+    ADMIN_QUESTION_POOL_STATS,
+    ADMIN_RESPONSE_CACHE_STATS,
     BOT_DESCRIPTION,
     BOT_MENU_GIVE_UP_DESCRIPTION,
     BOT_MENU_HINT_DESCRIPTION,
@@ -44,12 +75,15 @@ from src.strings import (
     BOT_MENU_QUESTION_DESCRIPTION,
     BOT_MENU_SOLVE_DESCRIPTION,
     BOT_MENU_SUBJECT_DESCRIPTION,
+    BOT_MENU_TIMEZONE_DESCRIPTION,
     BOT_NAME,
     BOT_SHORT_DESCRIPTION,
     CHECKING_SOLUTION_MESSAGE,
     CURRENT_MEMO_MESSAGE,
     CURRENT_SUBJECT_MESSAGE,
+    CURRENT_TIMEZONE_MESSAGE,
     GENERATING_QUESTION_MESSAGE,
+    INVALID_TIMEZONE_MESSAGE,
     MEMO_UPDATED_MESSAGE,
     NO_MEMO_MESSAGE,
     NO_SESSION_MESSAGE,
@@ -60,14 +94,33 @@ from src.strings import (
     START_MESSAGE,
     SUBJECT_SET_MESSAGE,
     SUBMIT_SOLUTION_PROMPT_MESSAGE,
+    TIMEZONE_SET_MESSAGE,
     TUTOR_ERROR_MESSAGE,
 )
-from src.utils import error_handler, get_db_context, send_typing
+from src.user_queue import message_text, serialize_handlers
+from src.utils import StreamingReply, error_handler, instrument_handlers, send_typing, with_db
+from src.web_server import WEBHOOK_PATH, WEBHOOK_SECRET, create_web_server
 
 # Load environment variables
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# A self-hosted Bot API server (or a fake one for load tests) instead of api.telegram.org
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "https://api.telegram.org/bot")
 DEVELOPER_CHAT_ID = os.getenv("DEVELOPER_CHAT_ID")
 
+# "polling" (one instance) or "webhook" (any number of replicas behind a load balancer at WEBHOOK_URL)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+
+# What a judged solution attempt must hold to be stored
+SOLUTION_VERDICT_KEYS = (
+    "full_solution",
+    "summarized_solution",
+    "feedback",
+    "is_correct",
+    "performance_explanation",
+    "performance",
+)
+
 # Enable logging
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 
@@ -78,33 +131,20 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("http.server").setLevel(logging.WARNING)
 
 
-def get_user_from_update(update: Update, db: Session | None = None) -> User:
-    if db is None:
-        db = get_db_context()
+async def get_user_from_update(update: Update, db: AsyncSession) -> User:
     user_id = update.message.from_user.id
-    return ensure_user_exists(db, user_id)
-
-
-# Add a function to update the user's play mode
-def update_user_play_mode(db: Session, user_id: int, play_mode: bool) -> None:
-    # noinspection PyTypeChecker
-    db.query(User).filter(User.id == user_id).update({"status": "playing" if play_mode else "active"})
-    db.commit()
-
-
-def invalidate_old_sessions(db: Session, user_id: int) -> None:
-    # Invalidate all the other sessions to not have multiple concurrent
-    # noinspection PyTypeChecker
-    db.query(TutorSession).filter(TutorSession.user_id == user_id).update({"archived": True}, synchronize_session=False)
+    user = await ensure_user_exists(db, user_id)
+    await release_connection(db)
+    return user
 
 
 # Command: /start
 # noinspection PyUnusedLocal
-async def start(update: Update, context: CallbackContext) -> None:
-    db = get_db_context()
+@with_db
+async def start(update: Update, context: CallbackContext, db: AsyncSession) -> None:
     user = update.message.from_user
-    if not get_user(db, user.id):
-        create_user(db, user.id)
+    await ensure_user_exists(db, user.id)
+    await release_connection(db)
 
     # Get the first name from telegram
     user_first_name = update.message.from_user.first_name
@@ -112,14 +152,19 @@ async def start(update: Update, context: CallbackContext) -> None:
 
 
 # Handle /subject command
-async def handle_subject(update: Update, context: CallbackContext) -> None:
-    db = get_db_context()
-    user = get_user_from_update(update, db)
+@with_db
+async def handle_subject(update: Update, context: CallbackContext, db: AsyncSession) -> None:
+    user = await get_user_from_update(update, db)
 
     if context.args:
         # If arguments are provided, update the subject
         subject = " ".join(context.args)
-        update_user_subject(db, user.id, subject)
+        user = await update_user_subject(db, user.id, subject)
+
+        # Questions pooled for the old subject are no longer useful; start preparing ones for the new subject
+        await evict_user_pool(db, user.id)
+        schedule_refill(user)
+
         await update.message.reply_text(SUBJECT_SET_MESSAGE.format(subject=subject))
     else:
         # If no arguments are provided, display the current subject
@@ -130,14 +175,19 @@ async def handle_subject(update: Update, context: CallbackContext) -> None:
 
 
 # Handle /memo command
-async def handle_memo(update: Update, context: CallbackContext) -> None:
-    db = get_db_context()
-    user = get_user_from_update(update, db)
+@with_db
+async def handle_memo(update: Update, context: CallbackContext, db: AsyncSession) -> None:
+    user = await get_user_from_update(update, db)
 
     if context.args:
         # If arguments are provided, update the context/notes
         memo = " ".join(context.args)
-        update_user_memo(db, user.id, memo)
+        user = await update_user_memo(db, user.id, memo)
+
+        # Pooled questions were written for the old memo
+        await evict_user_pool(db, user.id)
+        schedule_refill(user)
+
         await update.message.reply_text(MEMO_UPDATED_MESSAGE)
     else:
         # If no arguments are provided, display the current context/notes
@@ -147,13 +197,45 @@ async def handle_memo(update: Update, context: CallbackContext) -> None:
             await update.message.reply_text(NO_MEMO_MESSAGE)
 
 
+def format_delivery_time(user: User) -> str:
+    # Show the next delivery in the user's own time zone
+    delivery = next_delivery_time(user, utcnow()).replace(tzinfo=pytz.UTC)
+    return delivery.astimezone(pytz.timezone(user.timezone or DEFAULT_TIMEZONE)).strftime("%H:%M")
+
+
+# Handle /timezone command
+@with_db
+async def handle_timezone(update: Update, context: CallbackContext, db: AsyncSession) -> None:
+    user = await get_user_from_update(update, db)
+
+    if context.args:
+        # If arguments are provided, update the time zone and move the next delivery to match
+        timezone = context.args[0]
+        if timezone not in pytz.all_timezones_set:
+            await update.message.reply_text(INVALID_TIMEZONE_MESSAGE.format(timezone=timezone))
+            return
+
+        user.timezone = timezone
+        user = await update_user_timezone(db, user.id, timezone, next_delivery_time(user, utcnow()))
+        await update.message.reply_text(
+            TIMEZONE_SET_MESSAGE.format(timezone=timezone, delivery_time=format_delivery_time(user))
+        )
+    else:
+        # If no arguments are provided, display the current time zone
+        await update.message.reply_text(
+            CURRENT_TIMEZONE_MESSAGE.format(
+                timezone=user.timezone or DEFAULT_TIMEZONE, delivery_time=format_delivery_time(user)
+            )
+        )
+
+
 # Handle /hint command
-async def handle_hint(update: Update, context: CallbackContext) -> None:
+@with_db
+async def handle_hint(update: Update, context: CallbackContext, db: AsyncSession) -> None:
     # Send that the bot is typing so the user knows to wait
     await context.bot.send_chat_action(chat_id=update.effective_message.chat_id, action=ChatAction.TYPING)
 
-    db = get_db_context()
-    user = get_user_from_update(update, db)
+    user = await get_user_from_update(update, db)
 
     # Check if the user has set a subject
     if not user.subject:
@@ -161,50 +243,59 @@ async def handle_hint(update: Update, context: CallbackContext) -> None:
         return
 
     # Check if there is an active session
-    session = get_current_session(db, user.id)
+    session = await get_current_session(db, user.id)
     if not session:
         await update.message.reply_text(NO_SESSION_MESSAGE)
         return
 
     # If both checks pass, proceed with handling the solution attempt
     user_response = "I need a hint."
-    response = chat_message(session, user_response, db)
+    reply = StreamingReply(update.message)
+    response = await chat_message_async(session, user_response, db, on_text=reply.update, cache=True)
 
     # Return the feedback to the user
-    await update.message.reply_text(response)
+    await reply.finish(response)
 
 
 # Command: /question
-async def generate_new_question(update: Update, context: CallbackContext) -> None:
-    db = get_db_context()
-    user = get_user_from_update(update, db)
+@with_db
+async def generate_new_question(update: Update, context: CallbackContext, db: AsyncSession) -> None:
+    user = await get_user_from_update(update, db)
 
     if not user.subject:
         await update.message.reply_text(PROMPT_SET_SUBJECT_MESSAGE)
         return
 
-    # Let the user know we're getting a question
-    await update.message.reply_text(GENERATING_QUESTION_MESSAGE)
+    # Serve a pre-generated question when one is ready, and only wait for the model on a miss
+    question_data = await take_question(user)
 
-    # Send that the bot is typing so the user knows to wait
-    await context.bot.send_chat_action(chat_id=update.effective_message.chat_id, action=ChatAction.TYPING)
+    if question_data is None:
+        # Let the user know we're getting a question
+        await update.message.reply_text(GENERATING_QUESTION_MESSAGE)
 
-    # Ask the chat agent for a question
-    _, question_data = chat_generate_question(user.subject, user.memo)
+        # Send that the bot is typing so the user knows to wait
+        await context.bot.send_chat_action(chat_id=update.effective_message.chat_id, action=ChatAction.TYPING)
 
-    # Alert on an error since we just got text back
-    if isinstance(question_data, str):
-        await update.message.reply_text(QUESTION_GENERATION_FAILED_MESSAGE)
-        return
+        # Ask the chat agent for a question
+        await release_connection(db)
+        _, question_data = await chat_generate_question_async(user.subject, user.memo)
+
+        # Alert on an error since we just got text back
+        if isinstance(question_data, str):
+            await update.message.reply_text(QUESTION_GENERATION_FAILED_MESSAGE)
+            return
+
+    # Top the pool back up in the background for the next /question
+    schedule_refill(user)
 
     # Invalidate all the other sessions to not have multiple concurrent
-    invalidate_old_sessions(db, user.id)
+    await invalidate_old_sessions(db, user.id)
 
     # Disable the user from the schedule
-    update_user_play_mode(db, user.id, play_mode=False)
+    await update_user_play_mode(db, user.id, play_mode=False)
 
     # Logic to store question and start session
-    create_tutor_session(
+    await create_tutor_session(
         db=db,
         user_id=user.id,
         subject=user.subject,
@@ -222,11 +313,11 @@ async def generate_new_question(update: Update, context: CallbackContext) -> Non
 
 # Handle text messages (as solution attempts)
 # noinspection DuplicatedCode
-async def handle_message(update: Update, context: CallbackContext) -> None:
+@with_db
+async def handle_message(update: Update, context: CallbackContext, db: AsyncSession) -> None:
     await send_typing(update, context)
 
-    db = get_db_context()
-    user = get_user_from_update(update, db)
+    user = await get_user_from_update(update, db)
 
     # Check if the user has set a subject
     if not user.subject:
@@ -234,22 +325,23 @@ async def handle_message(update: Update, context: CallbackContext) -> None:
         return
 
     # Check if there is an active session
-    session = get_current_session(db, user.id)
+    session = await get_current_session(db, user.id)
     if not session:
         await update.message.reply_text(NO_SESSION_MESSAGE)
         return
 
     # If both checks pass, proceed with handling the solution attempt
-    user_response = update.message.text
-    response = chat_message(session, user_response, db)
+    user_response = message_text(update)
+    reply = StreamingReply(update.message)
+    response = await chat_message_async(session, user_response, db, on_text=reply.update)
 
     # Return the feedback to the user
-    await update.message.reply_text(response)
+    await reply.finish(response)
 
 
-async def handle_solve(update: Update, context: CallbackContext) -> None:
-    db = get_db_context()
-    user = get_user_from_update(update, db)
+@with_db
+async def handle_solve(update: Update, context: CallbackContext, db: AsyncSession) -> None:
+    user = await get_user_from_update(update, db)
 
     # Check if the user has set a subject
     if not user.subject:
@@ -257,7 +349,9 @@ async def handle_solve(update: Update, context: CallbackContext) -> None:
         return
 
     # Check if there is an active session
-    session = get_current_session(db, user.id)
+    session = await get_current_session(db, user.id)
+    # Nothing else is read before the judge call, so don't hold the connection across the replies below
+    await release_connection(db)
     if not session:
         await update.message.reply_text(NO_SESSION_MESSAGE)
         return
@@ -276,23 +370,25 @@ async def handle_solve(update: Update, context: CallbackContext) -> None:
     await context.bot.send_chat_action(chat_id=update.effective_message.chat_id, action=ChatAction.TYPING)
 
     # If both checks pass, proceed with handling the solution attempt
-    response = chat_solution_attempt(session, user_response, db)
+    # The attempt's messages, session update and solution response are saved together below
+    turn = Turn(session)
+    response = await chat_solution_attempt_async(
+        session, user_response, db, turn=turn, combined=JUDGE_MODE == "combined"
+    )
 
-    if response is None:
+    # A failed judge call (or a combined reply that did not parse) comes back with only an error in "feedback"
+    if response is None or any(key not in response for key in SOLUTION_VERDICT_KEYS):
         await update.message.reply_text(TUTOR_ERROR_MESSAGE)
+        return
 
-    update_session(
-        db,
-        session.id,
+    turn.update_session(
         attempted=session.attempted + 1,
         correct=response.get("is_correct"),
         completed=response.get("is_correct") or session.completed,
     )
 
     # Store the solution response in the database
-    create_solution_response(
-        db,
-        session_id=session.id,
+    turn.add_solution_response(
         full_solution=response["full_solution"],
         summarized_solution=response["summarized_solution"],
         feedback=response["feedback"],
@@ -300,20 +396,27 @@ async def handle_solve(update: Update, context: CallbackContext) -> None:
         performance_explanation=response["performance_explanation"],
         performance=response["performance"],
     )
+    await save_turn(db, turn)
+
+    # The combined judge already wrote the reply to the user
+    if "message" in response:
+        await update.message.reply_text(response["message"])
+        return
 
     # Get a nicer summary of the critical judge
-    judge_response = chat_judge_response(session, db)
+    reply = StreamingReply(update.message)
+    judge_response = await chat_judge_response_async(session, db, on_text=reply.update)
 
     # Return the feedback to the user
-    await update.message.reply_text(judge_response)
+    await reply.finish(judge_response)
 
 
 # noinspection DuplicatedCode
-async def handle_giveup(update: Update, context: CallbackContext) -> None:
+@with_db
+async def handle_giveup(update: Update, context: CallbackContext, db: AsyncSession) -> None:
     await send_typing(update, context)
 
-    db = get_db_context()
-    user = get_user_from_update(update, db)
+    user = await get_user_from_update(update, db)
 
     # Check if the user has set a subject
     if not user.subject:
@@ -321,35 +424,38 @@ async def handle_giveup(update: Update, context: CallbackContext) -> None:
         return
 
     # Check if there is an active session
-    session = get_current_session(db, user.id)
+    session = await get_current_session(db, user.id)
     if not session:
         await update.message.reply_text(NO_SESSION_MESSAGE)
         return
 
     # If both checks pass, proceed with handling giving up
-    response = chat_giveup(session, db)
+    reply = StreamingReply(update.message)
+    turn = Turn(session)
+    response = await chat_giveup_async(session, db, on_text=reply.update, turn=turn)
 
-    # Mark this as completed because they are done
-    update_session(db, session.id, completed=True)
+    # Mark this as completed because they are done, and save it with the give-up messages
+    turn.update_session(completed=True)
+    await save_turn(db, turn)
 
     # Return the feedback to the user
-    await update.message.reply_text(response)
+    await reply.finish(response)
 
 
-async def handle_play(update: Update, context: CallbackContext) -> None:
+@with_db
+async def handle_play(update: Update, context: CallbackContext, db: AsyncSession) -> None:
     await send_typing(update, context)
 
-    db = get_db_context()
-    user = get_user_from_update(update, db)
+    user = await get_user_from_update(update, db)
 
     # Invalidate all the other sessions to not have multiple concurrent
-    invalidate_old_sessions(db, user.id)
+    await invalidate_old_sessions(db, user.id)
 
     # Disable the user from the schedule
-    update_user_play_mode(db, user.id, play_mode=True)
+    await update_user_play_mode(db, user.id, play_mode=True)
 
     # Create session first so we have an ID
-    session = create_tutor_session(
+    session = await create_tutor_session(
         db=db,
         user_id=user.id,
         subject=user.subject,
@@ -360,14 +466,15 @@ async def handle_play(update: Update, context: CallbackContext) -> None:
         thread_id=None,
     )
 
-    _, response = chat_play(user.subject, user.memo, db, session.id)
+    reply = StreamingReply(update.message, parse_mode=ParseMode.MARKDOWN)
+    _, response = await chat_play_async(user.subject, user.memo, db, session.id, on_text=reply.update)
 
-    await update.message.reply_markdown(response)
+    await reply.finish(response)
 
 
-async def handle_send_daily_question(update: Update, context: CallbackContext) -> None:
-    db = get_db_context()
-    user = get_user_from_update(update, db)
+@with_db
+async def handle_send_daily_question(update: Update, context: CallbackContext, db: AsyncSession) -> None:
+    user = await get_user_from_update(update, db)
 
     if not user.is_admin:
         return
@@ -376,18 +483,117 @@ async def handle_send_daily_question(update: Update, context: CallbackContext) -
     await send_typing(update, context)
 
     # Get all users, or use provided user IDs
-    if len(context.args) == 0:
-        await generate_daily_questions(db, context.bot)
-        await update.message.reply_text(ADMIN_DELIVERED_DAILY_QUESTION)
+    users = None
+    if context.args:
+        users = [await get_user(db, int(x)) for x in context.args]
+        users = [u for u in users if u is not None]
+        await release_connection(db)
+
+    summary = await generate_daily_questions(context.bot, users)
+
+    # Notify admin of successes and failures
+    await update.message.reply_text(
+        ADMIN_DAILY_QUESTION_SUMMARY.format(
+            duration=summary.duration,
+            sent=summary.sent,
+            failed=summary.failed,
+            skipped=summary.skipped,
+            total=summary.total,
+        )
+    )
+
+
+@with_db
+async def handle_pool_stats(update: Update, context: CallbackContext, db: AsyncSession) -> None:
+    user = await get_user_from_update(update, db)
+
+    if not user.is_admin:
         return
 
-    users = [get_user(db, int(x)) for x in context.args]
+    await update.message.reply_text(
+        ADMIN_QUESTION_POOL_STATS.format(
+            hits=stats.hits,
+            misses=stats.misses,
+            hit_rate=stats.hit_rate,
+            refilled=stats.refilled,
+            refill_failures=stats.refill_failures,
+            evicted=stats.evicted,
+        )
+    )
+
 
-    tasks = [asyncio.create_task(generate_daily_question_for_user(db, context.bot, user)) for user in users]
-    await asyncio.gather(*tasks)
+@with_db
+async def handle_cache_stats(update: Update, context: CallbackContext, db: AsyncSession) -> None:
+    user = await get_user_from_update(update, db)
+
+    if not user.is_admin:
+        return
+
+    await update.message.reply_text(
+        ADMIN_RESPONSE_CACHE_STATS.format(
+            hits=response_cache_stats.hits,
+            misses=response_cache_stats.misses,
+            hit_rate=response_cache_stats.hit_rate,
+            stored=response_cache_stats.stored,
+            evicted=response_cache_stats.evicted,
+            errors=response_cache_stats.errors,
+        )
+    )
 
-    # Notify admin of successes and failures
-    await update.message.reply_text(ADMIN_DELIVERED_DAILY_QUESTION)
+
+@with_db
+async def handle_usage_stats(update: Update, context: CallbackContext, db: AsyncSession) -> None:
+    user = await get_user_from_update(update, db)
+
+    if not user.is_admin:
+        return
+
+    # Optional window in hours, e.g. /usage_stats 168 for the last week
+    try:
+        hours = float(context.args[0]) if context.args else 24.0
+    except ValueError:
+        hours = 24.0
+
+    functions = await usage_summary(utcnow() - timedelta(hours=hours))
+    lines = [
+        ADMIN_LLM_USAGE_SUMMARY.format(
+            hours=hours,
+            calls=sum(f.calls for f in functions),
+            tokens=sum(f.prompt_tokens + f.completion_tokens for f in functions),
+            cost=sum(f.cost for f in functions),
+        )
+    ]
+    lines.extend(ADMIN_LLM_USAGE_FUNCTION.format(**vars(f)) for f in functions)
+    await update.message.reply_text("\n".join(lines))
+
+
+@with_db
+async def handle_job_stats(update: Update, context: CallbackContext, db: AsyncSession) -> None:
+    user = await get_user_from_update(update, db)
+
+    if not user.is_admin:
+        return
+
+    await release_connection(db)
+    by_kind = {}
+    for (kind, status), count in sorted((await job_counts()).items()):
+        by_kind.setdefault(kind, []).append(f"{count} {status}")
+    lines = [ADMIN_JOB_STATS.format(**vars(job_stats))]
+    lines.extend(ADMIN_JOB_COUNTS.format(kind=kind, counts=", ".join(counts)) for kind, counts in by_kind.items())
+    await update.message.reply_text("\n".join(lines))
+
+
+@with_db
+async def handle_retry_jobs(update: Update, context: CallbackContext, db: AsyncSession) -> None:
+    user = await get_user_from_update(update, db)
+
+    if not user.is_admin:
+        return
+
+    await release_connection(db)
+    # Optional job kind, e.g. /retry_jobs daily_question
+    count = await requeue_dead(context.args[0] if context.args else None)
+    await update.message.reply_text(ADMIN_JOBS_REQUEUED.format(count=count))
 
 
 # Error handler
@@ -408,10 +614,15 @@ async def handle_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> No
 
 
 async def post_init(application: Application) -> None:
+    # The database is first touched here rather than on import, so a restart only waits on it once it has to
+    if DB_MIGRATE_ON_START:
+        await init_db()
+
     # Menu builder
     menu = [
         BotCommand(command="subject", description=BOT_MENU_SUBJECT_DESCRIPTION),
         BotCommand(command="memo", description=BOT_MENU_MEMO_DESCRIPTION),
+        BotCommand(command="timezone", description=BOT_MENU_TIMEZONE_DESCRIPTION),
         BotCommand(command="hint", description=BOT_MENU_HINT_DESCRIPTION),
         BotCommand(command="question", description=BOT_MENU_QUESTION_DESCRIPTION),
         BotCommand(command="solve", description=BOT_MENU_SOLVE_DESCRIPTION),
@@ -422,6 +633,26 @@ async def post_init(application: Application) -> None:
     # noinspection PyUnresolvedReferences
     await application.bot.set_my_commands(menu)
 
+    # Heartbeat for /healthz; /readyz also expects recent getUpdates polls unless updates come over a webhook
+    start_monitoring(polling=BOT_MODE != "webhook")
+    start_usage_writer()
+    # Run queued jobs here too; with JOB_WORKERS=0 only separate `python -m src.worker` processes run them
+    start_job_workers(application.bot, JOB_WORKERS)
+
+
+# noinspection PyUnusedLocal
+async def post_shutdown(application: Application) -> None:
+    # Hand the scheduler and running jobs over to other replicas, stop background pool refills and finish summaries, write out their usage
+    # records, then release the pooled OpenAI and database connections
+    stop_monitoring()
+    await stop_leader_elections()
+    await stop_job_workers()
+    await stop_refills()
+    await wait_for_summaries()
+    await stop_usage_writer()
+    await close_clients()
+    await dispose_engine()
+
 
 # noinspection PyUnresolvedReferences
 async def define_bot(application: Application) -> None:
@@ -432,12 +663,23 @@ async def define_bot(application: Application) -> None:
 
 def create_bot() -> Application:
     # Create the Application and pass it your bot's token
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).concurrent_updates(True).post_init(post_init).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(TELEGRAM_BASE_URL)
+        .concurrent_updates(True)
+        .get_updates_request(PollingRequest(connection_pool_size=1))
+        .rate_limiter(TelegramRateLimiter())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Handlers
     application.add_handler(CommandHandler("start", start, block=False))
     application.add_handler(CommandHandler("subject", handle_subject, block=False))
     application.add_handler(CommandHandler("memo", handle_memo, block=False))
+    application.add_handler(CommandHandler("timezone", handle_timezone, block=False))
     application.add_handler(CommandHandler("hint", handle_hint, block=False))
     application.add_handler(CommandHandler("question", generate_new_question, block=False))
     application.add_handler(CommandHandler("solve", handle_solve, block=False))
@@ -447,10 +689,34 @@ def create_bot() -> Application:
     # Admin handlers
     # Add a hidden slash command to trigger the daily question generation
     application.add_handler(CommandHandler("daily_question", handle_send_daily_question, block=False))
+    application.add_handler(CommandHandler("pool_stats", handle_pool_stats, block=False))
+    application.add_handler(CommandHandler("cache_stats", handle_cache_stats, block=False))
+    application.add_handler(CommandHandler("usage_stats", handle_usage_stats, block=False))
+    application.add_handler(CommandHandler("job_stats", handle_job_stats, block=False))
+    application.add_handler(CommandHandler("retry_jobs", handle_retry_jobs, block=False))
 
     # Message handler for non-command text (solution attempts)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message, block=False))
 
+    # Handle each chat's tutoring updates in order, answering rapid consecutive messages with one reply. Admin
+    # commands only report or kick off background work, and /daily_question runs a whole fan-out in place, so they
+    # do not hold the admin's chat queue
+    serialize_handlers(
+        application,
+        coalesce=[handle_message],
+        exempt=[
+            handle_send_daily_question,
+            handle_pool_stats,
+            handle_cache_stats,
+            handle_usage_stats,
+            handle_job_stats,
+            handle_retry_jobs,
+        ],
+    )
+
+    # Per-handler request counts and latency for /metrics
+    instrument_handlers(application)
+
     # Error handler
     application.add_error_handler(handle_error)
 
@@ -463,21 +729,39 @@ def run_bot(application: Application) -> None:
 
 
 async def run_scheduler(application: Application) -> None:
+    # Imported here, off the startup path, since only the long-running entry points schedule anything
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
     # Create an AsyncIOScheduler instance
     scheduler = AsyncIOScheduler()
 
-    # Schedule the generate_daily_questions function to run daily at 8am EST
-    # TODO: Run every minute and check when the user is scheduled to recieve theirs?
-    scheduler.add_job(
-        generate_daily_questions,
-        "cron",
-        hour=15,
-        minute=00,
-        timezone=pytz.timezone("US/Eastern"),
-        args=[get_db_context(), application],
-    )
-
-    scheduler.start()
+    if SCHEDULER_MODE == "cron":
+        # Everyone at once, once a day; a replica taking over as leader shortly after the hour still runs it, and
+        # the job keys keep a second run the same day from delivering twice
+        scheduler.add_job(
+            enqueue_daily_questions,
+            "cron",
+            hour=DAILY_QUESTION_HOUR,
+            minute=00,
+            timezone=pytz.timezone(DEFAULT_TIMEZONE),
+            misfire_grace_time=3600,
+            coalesce=True,
+        )
+    else:
+        # Tick often and queue deliveries to whoever is due, spreading the load across the day; the job workers
+        # deliver them, and pick up where they left off after a restart
+        scheduler.add_job(
+            enqueue_due_questions,
+            "interval",
+            seconds=SCHEDULER_TICK_SECONDS,
+            max_instances=1,
+            coalesce=True,
+        )
+
+    # Every replica runs the bot and the job workers, but only the elected one schedules; the rest keep their
+    # scheduler paused, ready to take over
+    scheduler.start(paused=True)
+    start_leader_election("scheduler", on_elected=scheduler.resume, on_deposed=scheduler.pause)
 
 
 async def run_status() -> None:
@@ -485,6 +769,56 @@ async def run_status() -> None:
     run_status_server()
 
 
+async def run_webhook(application: Application) -> None:
+    """Receive updates over a webhook, serving it and the status page from one HTTP server on this loop."""
+    if not WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL must be set when BOT_MODE=webhook")
+
+    async def enqueue_update(data: dict) -> None:
+        record_telegram_success()
+        await application.update_queue.put(Update.de_json(data, application.bot))
+
+    server = create_web_server(enqueue_update)
+
+    # run_polling() normally drives this lifecycle, including the post_* hooks
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+
+    try:
+        await define_bot(application)
+        logger.info("Bot properties defined")
+    except Exception as e:
+        logger.error(f"Failed to define bot: {e}")
+
+    # Every replica registers the same URL, so this is idempotent; the webhook is left in place on
+    # shutdown because other replicas may still be serving it
+    await application.bot.set_webhook(
+        url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES
+    )
+    await application.start()
+    await run_scheduler(application)
+    await server.start()
+    logger.info("Webhook server started")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await stop.wait()
+    finally:
+        # Stop taking new updates first, then let the application finish the queued ones
+        await server.close()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
 def main_bot_only() -> None:
     # We need the bot to start up before we can continue
     application = create_bot()
@@ -493,6 +827,11 @@ def main_bot_only() -> None:
 
 def main_with_extras() -> None:
     """Run bot with scheduler and status server."""
+    if BOT_MODE == "webhook":
+        # The webhook server also serves the status page, so no status thread is needed
+        asyncio.run(run_webhook(create_bot()))
+        return
+
     # Start the status server in a separate thread (it blocks)
     try:
         status_thread = threading.Thread(target=run_status_server, daemon=True)
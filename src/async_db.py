@@ -0,0 +1,301 @@
+import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from src.db import (
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    Base,
+    Message,
+    SolutionResponse,
+    Turn,
+    TutorSession,
+    User,
+    configure_sqlite,
+)
+from src.metrics import instrument_engine
+from src.migrations import apply_migrations
+from src.user_cache import user_cache
+
+# Async drivers for the sync URLs in src.db, so one DATABASE_URL configures both engines
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def _async_database_url(url: str):
+    parsed = make_url(url)
+    return parsed.set(drivername=ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername))
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_database_url(DATABASE_URL)
+
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+# Created on first use (which also imports the driver), so importing this module never touches the database
+_async_engine: AsyncEngine | None = None
+
+
+def get_async_engine() -> AsyncEngine:
+    """Return the shared async engine, creating it on first use."""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+        configure_sqlite(_async_engine.sync_engine)
+        instrument_engine(_async_engine.sync_engine)
+    return _async_engine
+
+
+async def dispose_engine() -> None:
+    """Close the async engine's pooled connections, e.g. on application shutdown."""
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+
+async def init_db() -> None:
+    """Create missing tables and apply pending migrations over the async engine, without a second (sync) pool."""
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(apply_migrations, Base.metadata)
+
+
+@asynccontextmanager
+async def db_session() -> AsyncIterator[AsyncSession]:
+    """Open an async session that is rolled back on error and always closed, returning its connection to the pool."""
+    db = AsyncSessionLocal(bind=get_async_engine())
+    try:
+        yield db
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        await db.close()
+
+
+async def release_connection(db: AsyncSession) -> None:
+    """End the open read transaction so its connection goes back to the pool while we await the network."""
+    await db.commit()
+
+
+# Helper functions, mirroring the synchronous ones in src.db
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.scalar(select(User).filter(User.id == user_id))
+
+
+async def get_all_users(db: AsyncSession):
+    return (await db.scalars(select(User))).all()
+
+
+async def get_all_users_with_subject(db: AsyncSession):
+    return (await db.scalars(select(User).filter(User.subject.is_not(None)))).all()
+
+
+async def create_user(db: AsyncSession, user_id: int):
+    new_user = User(id=user_id)
+    db.add(new_user)
+    await db.commit()
+    return new_user
+
+
+# Ensure user exists or create one. Served from the user cache when possible, so the returned
+# User may not be attached to ``db``; use the update_user_* helpers to change it.
+async def ensure_user_exists(db: AsyncSession, user_id: int):
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    user = await get_user(db, user_id)
+    if not user:
+        try:
+            user = await create_user(db, user_id)
+        except IntegrityError:
+            # Another update from the same user created the row first
+            await db.rollback()
+            user = await get_user(db, user_id)
+    user_cache.put(user)
+    return user
+
+
+async def update_user_subject(db: AsyncSession, user_id: int, subject: str):
+    user = await get_user(db, user_id)
+    if user:
+        user.subject = subject
+        await db.commit()
+        user_cache.put(user)
+    return user
+
+
+async def update_user_memo(db: AsyncSession, user_id: int, memo: str):
+    user = await get_user(db, user_id)
+    if user:
+        user.memo = memo
+        await db.commit()
+        user_cache.put(user)
+    return user
+
+
+async def update_user_timezone(db: AsyncSession, user_id: int, timezone: str, next_problem: datetime):
+    user = await get_user(db, user_id)
+    if user:
+        user.timezone = timezone
+        user.next_problem = next_problem
+        await db.commit()
+        user_cache.put(user)
+    return user
+
+
+# noinspection PyTypeChecker
+async def get_users_due(db: AsyncSession, now: datetime, limit: int):
+    # Served by the next_problem index; SKIP LOCKED keeps concurrent ticks from claiming the same users
+    return (
+        await db.scalars(
+            select(User)
+            .filter(User.subject.is_not(None), User.next_problem <= now)
+            .order_by(User.next_problem)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+    ).all()
+
+
+async def get_unscheduled_users(db: AsyncSession, limit: int):
+    return (
+        await db.scalars(select(User).filter(User.subject.is_not(None), User.next_problem.is_(None)).limit(limit))
+    ).all()
+
+
+async def update_user_play_mode(db: AsyncSession, user_id: int, play_mode: bool) -> None:
+    # noinspection PyTypeChecker
+    await db.execute(update(User).filter(User.id == user_id).values(status="playing" if play_mode else "active"))
+    await db.commit()
+    user_cache.invalidate(user_id)
+
+
+async def invalidate_old_sessions(db: AsyncSession, user_id: int) -> int:
+    # Invalidate all the other sessions to not have multiple concurrent.
+    # Only live sessions are rewritten (served by ix_sessions_active); archived ones stay untouched.
+    # noinspection PyTypeChecker
+    result = await db.execute(
+        update(TutorSession)
+        .filter(TutorSession.user_id == user_id, ~TutorSession.archived)
+        .values(archived=True)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+async def create_tutor_session(
+    db: AsyncSession,
+    user_id: int,
+    subject: str,
+    memo: str,
+    question: str,
+    solving_process: str,
+    expected_answer: str,
+    thread_id: str,
+    commit: bool = True,
+):
+    """Add a session; with ``commit=False`` it is only flushed (so it has its id), for the caller to commit."""
+    new_session = TutorSession(
+        user_id=user_id,
+        subject=subject,
+        memo=memo,
+        question=question,
+        solving_process=solving_process,
+        expected_answer=expected_answer,
+        thread_id=thread_id,
+    )
+    db.add(new_session)
+    if commit:
+        await db.commit()
+    else:
+        await db.flush()
+    return new_session
+
+
+# noinspection PyTypeChecker
+async def get_current_session(db: AsyncSession, user_id: int):
+    session = await db.scalar(
+        select(TutorSession)
+        .filter(TutorSession.user_id == user_id, ~TutorSession.archived)
+        .order_by(TutorSession.created_at.desc(), TutorSession.id.desc())
+        .limit(1)
+    )
+    if session is None:
+        raise ValueError(f"No current session found for user {user_id}")
+    return session
+
+
+# noinspection PyTypeChecker
+async def update_session(db: AsyncSession, session_id: int, **kwargs):
+    session = await db.scalar(select(TutorSession).filter(TutorSession.id == session_id))
+    if session:
+        for key, value in kwargs.items():
+            setattr(session, key, value)
+        await db.commit()
+    return session
+
+
+async def create_solution_response(
+    db: AsyncSession,
+    session_id: int,
+    full_solution: str,
+    summarized_solution: str,
+    feedback: str,
+    is_correct: bool,
+    performance_explanation: str | None,
+    performance: int | None,
+):
+    new_solution_response = SolutionResponse(
+        session_id=session_id,
+        full_solution=full_solution,
+        summarized_solution=summarized_solution,
+        feedback=feedback,
+        is_correct=is_correct,
+        performance_explanation=performance_explanation,
+        performance=performance,
+    )
+    db.add(new_solution_response)
+    await db.commit()
+    return new_solution_response
+
+
+async def create_message(db: AsyncSession, session_id: int, role: str, content: str):
+    new_message = Message(session_id=session_id, role=role, content=content)
+    db.add(new_message)
+    await db.commit()
+    return new_message
+
+
+async def save_turn(db: AsyncSession, turn: Turn) -> None:
+    """Persist a whole turn in one transaction: batched inserts, one UPDATE of the session, one commit."""
+    db.add_all(turn.objects())
+    await db.commit()
+
+
+async def get_session_messages(db: AsyncSession, session_id: int, after_id: int | None = None):
+    # Passing the session's summary_through_id skips messages already folded into its summary
+    query = select(Message).filter(Message.session_id == session_id)
+    if after_id is not None:
+        query = query.filter(Message.id > after_id)
+    return (await db.scalars(query.order_by(Message.id))).all()
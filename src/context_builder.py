@@ -0,0 +1,78 @@
+import os
+
+# Conversation history sent with each tutoring turn: the session summary, then every message it does not cover
+# verbatim. Messages are folded into the summary once they leave the recent window (the last CONTEXT_RECENT_TURNS
+# exchanges, trimmed further if they exceed CONTEXT_MAX_TOKENS), so the verbatim part stays about that size.
+CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "4"))
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+# Summarize once this many messages have fallen out of the window (or they push the history past
+# CONTEXT_MAX_TOKENS), so the summary is not rewritten every turn; until then they are still sent verbatim
+CONTEXT_SUMMARY_BATCH = int(os.getenv("CONTEXT_SUMMARY_BATCH", "4"))
+
+# Chat formatting adds a few tokens per message on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# The tiktoken encoding, loaded on the first count (not at import, which is slow); False if tiktoken is missing
+_encoding = None
+
+
+def _load_encoding():
+    global _encoding
+    try:
+        import tiktoken
+    except ImportError:  # Optional; token counts fall back to an estimate
+        _encoding = False
+    else:
+        _encoding = tiktoken.get_encoding("o200k_base")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken when it is installed, otherwise estimate about four characters per token."""
+    encoding = _encoding if _encoding is not None else _load_encoding()
+    if encoding is False:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: list[dict]) -> int:
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def recent_window(stored_messages, max_tokens: int = CONTEXT_MAX_TOKENS) -> list:
+    """The newest stored messages to send verbatim: at most CONTEXT_RECENT_TURNS exchanges and ``max_tokens``."""
+    history = [m for m in stored_messages if m.role != "system"]  # Don't include system messages from history
+    window = history[-CONTEXT_RECENT_TURNS * 2 :] if CONTEXT_RECENT_TURNS > 0 else []
+
+    # Drop the oldest messages until the rest fit the budget; the newest one is always kept
+    tokens = [count_tokens(m.content) + MESSAGE_OVERHEAD_TOKENS for m in window]
+    while len(window) > 1 and sum(tokens) > max_tokens:
+        window.pop(0)
+        tokens.pop(0)
+    return window
+
+
+def messages_to_summarize(stored_messages) -> list:
+    """Messages that have left the recent window and are not yet in the summary, once there are enough of them."""
+    history = [m for m in stored_messages if m.role != "system"]
+    older = history[: len(history) - len(recent_window(history))]
+    # A few long messages are worth folding in early, since they are sent verbatim until then
+    over_budget = older and count_message_tokens(_as_chat(history)) > CONTEXT_MAX_TOKENS
+    return older if len(older) >= CONTEXT_SUMMARY_BATCH or over_budget else []
+
+
+def _as_chat(stored_messages) -> list[dict]:
+    return [{"role": m.role, "content": m.content} for m in stored_messages if m.role != "system"]
+
+
+def build_history(session, stored_messages) -> list[dict]:
+    """Chat messages for the conversation so far: the rolling summary, then every message after it verbatim.
+
+    ``stored_messages`` must be the messages after ``session.summary_through_id``. Messages that have left the
+    recent window are kept until a summary update folds them in, so none is missing from both.
+    """
+    messages = []
+    if session.summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {session.summary}"})
+    messages.extend(_as_chat(stored_messages))
+    return messages
@@ -1,8 +1,29 @@
 import os
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from datetime import UTC, datetime
 
-from sqlalchemy import Boolean, Column, DateTime, Integer, String, create_engine
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    DateTime,
+    Engine,
+    Float,
+    Index,
+    Integer,
+    String,
+    create_engine,
+    event,
+    text,
+)
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.sql.expression import FunctionElement
+
+from src.migrations import migrate
 
 # Postgres setup
 db_user = os.getenv("DB_USER")
@@ -11,9 +32,88 @@ db_name = os.getenv("DB_NAME")
 db_host = os.getenv("DB_HOST", "localhost")
 db_port = os.getenv("DB_PORT", "5432")
 
-engine = create_engine(f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}")
+# DATABASE_URL overrides the individual settings above, e.g. to point benchmarks at a scratch database
+DATABASE_URL = os.getenv("DATABASE_URL", f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}")
+
+# Connection pool tuning
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# How long a SQLite connection (benchmarks, local runs) waits for another one's write lock before failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+
+# Apply pending migrations when the bot starts; turn off when a deploy step runs `python -m src.migrations` instead
+DB_MIGRATE_ON_START = os.getenv("DB_MIGRATE_ON_START", "true").lower() in ("1", "true", "yes")
+
 Base = declarative_base()
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Loaded rows stay usable after a commit, so handlers can release their connection before slow network calls
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+
+# Created on first use, so importing the models never connects to (or needs) the database
+_engine: Engine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """Return the shared synchronous engine, creating it on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine(
+                DATABASE_URL,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=DB_POOL_PRE_PING,
+            )
+            configure_sqlite(_engine)
+    return _engine
+
+
+def configure_sqlite(engine: Engine) -> None:
+    """On SQLite, let readers and the single writer run side by side (WAL) and make writers queue for the lock.
+
+    Without this, one connection committing blocks every reader and concurrent writers fail with "database is
+    locked", so a benchmark driving many chats at once measures lock timeouts instead of the bot.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    # noinspection PyUnusedLocal
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # WAL stays consistent without an fsync per commit; only a power cut can lose the last commits
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+
+def utcnow() -> datetime:
+    # The DateTime columns are naive and hold UTC; asyncpg rejects timezone-aware values for them
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+class UtcNow(FunctionElement):
+    """The database's current time as naive UTC, for server-side column defaults."""
+
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(UtcNow, "postgresql")
+def _utcnow_postgresql(element, compiler, **kw):
+    # now() is timestamptz; without the conversion a naive column would get the server's local time
+    return "timezone('utc', now())"
+
+
+@compiles(UtcNow)
+def _utcnow_default(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
 
 
 # Define the User model
@@ -23,7 +123,8 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     subject = Column(String, index=True)
     memo = Column(String)
-    next_problem = Column(DateTime)
+    next_problem = Column(DateTime, index=True)  # UTC time the next daily question is due
+    timezone = Column(String)  # IANA name; None means DEFAULT_TIMEZONE
     status = Column(String, default="active")
     is_admin = Column(Boolean, default=False)
 
@@ -31,6 +132,18 @@ class User(Base):
 # Define the Session model
 class TutorSession(Base):
     __tablename__ = "sessions"
+    # Read back database-generated timestamps on INSERT/UPDATE (via RETURNING), so they are loaded after a commit
+    __mapper_args__ = {"eager_defaults": True}
+    # Only a user's live sessions are indexed, so finding and archiving them touches about one row
+    __table_args__ = (
+        Index(
+            "ix_sessions_active",
+            "user_id",
+            "created_at",
+            postgresql_where=text("NOT archived"),
+            sqlite_where=text("archived = 0"),  # How SQLAlchemy renders ~archived on SQLite
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
@@ -46,13 +159,16 @@ class TutorSession(Base):
     performance = Column(Integer)
     completed = Column(Boolean, default=False)
     thread_id = Column(String)
-    created_at = Column(DateTime, default=datetime.now(UTC))
-    updated_at = Column(DateTime, default=datetime.now(UTC))
+    summary = Column(String)  # Rolling summary of the messages up to summary_through_id
+    summary_through_id = Column(Integer)
+    created_at = Column(DateTime, server_default=UtcNow())
+    updated_at = Column(DateTime, server_default=UtcNow(), onupdate=UtcNow())
 
 
 # Define the SolutionResponse model
 class SolutionResponse(Base):
     __tablename__ = "solution_responses"
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, index=True)
@@ -62,33 +178,158 @@ class SolutionResponse(Base):
     is_correct = Column(Boolean)
     performance_explanation = Column(String)
     performance = Column(Integer)
-    created_at = Column(DateTime, default=datetime.now(UTC))
+    created_at = Column(DateTime, server_default=UtcNow())
 
 
 # Define the Message model for conversation history
 class Message(Base):
     __tablename__ = "messages"
+    # History is read in id order, which is insertion order even when timestamps tie; the index also serves every
+    # lookup by session_id alone
+    __table_args__ = (Index("ix_messages_session_id_id", "session_id", "id"),)
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, index=True)
+    session_id = Column(Integer)
     role = Column(String)  # 'system', 'user', 'assistant'
     content = Column(String)
-    created_at = Column(DateTime, default=datetime.now(UTC))
+    created_at = Column(DateTime, server_default=UtcNow())
+
 
+# Pre-generated questions waiting to be handed out by /question or the daily delivery
+class PooledQuestion(Base):
+    __tablename__ = "question_pool"
+    __table_args__ = (Index("ix_question_pool_key", "user_id", "subject", "memo_hash"),)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer)
+    subject = Column(String)
+    memo_hash = Column(String)
+    question = Column(String)
+    solving_process = Column(String)
+    expected_answer = Column(String)
+    created_at = Column(DateTime, server_default=UtcNow())
+
+
+# Replies to prompts that only depend on the question, e.g. /giveup, shared by every session that asks them
+class CachedResponse(Base):
+    __tablename__ = "response_cache"
+
+    key = Column(String, primary_key=True)  # Hash of the normalized prompt messages
+    function = Column(String)
+    response = Column(String)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, server_default=UtcNow())
+    last_used_at = Column(DateTime, index=True)
+    expires_at = Column(DateTime, index=True)
+
+
+# One row per OpenAI request, buffered and written in batches by src.llm_usage
+class LLMUsage(Base):
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, index=True)  # When the request was made, not when the row was written
+    function = Column(String)  # The chat_* function that made it
+    model = Column(String)
+    user_id = Column(Integer)
+    session_id = Column(Integer)
+    prompt_tokens = Column(Integer)
+    completion_tokens = Column(Integer)
+    cost = Column(Float)  # Estimated, in US dollars
+    queue_wait = Column(Float)  # Seconds spent waiting for the rate limiters and an in-flight slot
+    latency = Column(Float)  # Seconds from sending the request to the end of the response
+    outcome = Column(String)  # "ok" or the exception's class name
+
+
+# Durable background work run by src.jobs workers in any process; see there for the life cycle
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_run_at", "status", "run_at"),)
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String)
+    key = Column(String, unique=True)  # Idempotency key; enqueueing another job with it is a no-op
+    payload = Column(JSON)
+    status = Column(String, default="pending")  # pending, running, done or dead
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer)
+    run_at = Column(DateTime)  # Not claimed before this UTC time
+    locked_by = Column(String)  # The worker running it
+    locked_until = Column(DateTime)  # Reclaimed by another worker after this, e.g. when its worker died
+    last_error = Column(String)
+    created_at = Column(DateTime, server_default=UtcNow())
+    finished_at = Column(DateTime)
+
+
+# A role only one process may hold at a time, such as running the scheduler; see src.leader
+class Lease(Base):
+    __tablename__ = "leases"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String)  # The process holding it
+    expires_at = Column(DateTime)  # UTC time after which another process may take it over
+
+
+@dataclass
+class Turn:
+    """Everything one tutoring turn writes, staged in memory and persisted together by ``save_turn``.
+
+    ``session`` should be loaded in the database session the turn is saved with, so its changes
+    are written as a plain UPDATE without reading it again.
+    """
+
+    session: TutorSession
+    messages: list[Message] = field(default_factory=list)
+    solution_response: SolutionResponse | None = None
+
+    def add_message(self, role: str, content: str) -> Message:
+        message = Message(session_id=self.session.id, role=role, content=content)
+        self.messages.append(message)
+        return message
+
+    def update_session(self, **kwargs) -> None:
+        for key, value in kwargs.items():
+            setattr(self.session, key, value)
 
+    def add_solution_response(self, **kwargs) -> SolutionResponse:
+        self.solution_response = SolutionResponse(session_id=self.session.id, **kwargs)
+        return self.solution_response
 
-# Dependency to get the DB session
-def get_db():
-    db = SessionLocal()
+    def objects(self) -> list:
+        # Messages are flushed in this order, so their ids follow the conversation
+        return [self.session, *self.messages, *([self.solution_response] if self.solution_response else [])]
+
+
+def init_db() -> None:
+    """Create missing tables and apply pending migrations."""
+    migrate(get_engine(), Base.metadata)
+
+
+@contextmanager
+def db_session() -> Iterator[Session]:
+    """Open a session that is rolled back on error and always closed, returning its connection to the pool."""
+    db = SessionLocal(bind=get_engine())
     try:
         yield db
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
 
+def release_connection(db: Session) -> None:
+    """End the open read transaction so its connection goes back to the pool while we await the network."""
+    db.commit()
+
+
+# Dependency to get the DB session
+def get_db():
+    with db_session() as db:
+        yield db
+
+
 # Helper functions
 def get_user(db, user_id):
     return db.query(User).filter(User.id == user_id).first()
@@ -106,7 +347,6 @@ def create_user(db, user_id):
     new_user = User(id=user_id)
     db.add(new_user)
     db.commit()
-    db.refresh(new_user)
     return new_user
 
 
@@ -123,7 +363,6 @@ def update_user_subject(db, user_id, subject):
     if user:
         user.subject = subject
         db.commit()
-        db.refresh(user)
     return user
 
 
@@ -132,7 +371,6 @@ def update_user_memo(db, user_id, memo):
     if user:
         user.memo = memo
         db.commit()
-        db.refresh(user)
     return user
 
 
@@ -157,7 +395,6 @@ def create_tutor_session(
     )
     db.add(new_session)
     db.commit()
-    db.refresh(new_session)
     return new_session
 
 
@@ -166,7 +403,7 @@ def get_current_session(db: Session, user_id: int):
     session = (
         db.query(TutorSession)
         .filter(TutorSession.user_id == user_id, ~TutorSession.archived)
-        .order_by(TutorSession.created_at.desc())
+        .order_by(TutorSession.created_at.desc(), TutorSession.id.desc())
         .first()
     )
     if session is None:
@@ -181,7 +418,6 @@ def update_session(db: Session, session_id: int, **kwargs):
         for key, value in kwargs.items():
             setattr(session, key, value)
         db.commit()
-        db.refresh(session)
     return session
 
 
@@ -206,7 +442,6 @@ def create_solution_response(
     )
     db.add(new_solution_response)
     db.commit()
-    db.refresh(new_solution_response)
     return new_solution_response
 
 
@@ -214,9 +449,17 @@ def create_message(db: Session, session_id: int, role: str, content: str):
     new_message = Message(session_id=session_id, role=role, content=content)
     db.add(new_message)
     db.commit()
-    db.refresh(new_message)
     return new_message
 
 
-def get_session_messages(db: Session, session_id: int):
-    return db.query(Message).filter(Message.session_id == session_id).order_by(Message.created_at).all()
+def save_turn(db: Session, turn: Turn) -> None:
+    """Persist a whole turn in one transaction: batched inserts, one UPDATE of the session, one commit."""
+    db.add_all(turn.objects())
+    db.commit()
+
+
+def get_session_messages(db: Session, session_id: int, after_id: int | None = None):
+    query = db.query(Message).filter(Message.session_id == session_id)
+    if after_id is not None:
+        query = query.filter(Message.id > after_id)
+    return query.order_by(Message.id).all()
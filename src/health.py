@@ -0,0 +1,179 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import time
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Liveness: the bot's event loop bumps a heartbeat; if it stops for HEALTH_LOOP_STALL_SECONDS the loop is wedged
+HEALTH_HEARTBEAT_INTERVAL = float(os.getenv("HEALTH_HEARTBEAT_INTERVAL", "1"))
+HEALTH_LOOP_STALL_SECONDS = float(os.getenv("HEALTH_LOOP_STALL_SECONDS", "10"))
+# Readiness results are reused for this long, so frequent probes do not each hit the database
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "5"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "3"))
+# Long polling succeeds every few seconds even when nobody writes to the bot
+HEALTH_TELEGRAM_MAX_AGE = float(os.getenv("HEALTH_TELEGRAM_MAX_AGE", "120"))
+# OpenAI is only considered down once requests keep failing with no success for this long
+HEALTH_OPENAI_MAX_AGE = float(os.getenv("HEALTH_OPENAI_MAX_AGE", "600"))
+
+# State recorded on the bot's event loop; the status server reads it from its own threads
+_loop: asyncio.AbstractEventLoop | None = None
+_heartbeat_task: asyncio.Task | None = None
+_heartbeat: float | None = None
+_polling = True
+_started = time.monotonic()
+_telegram_success: float | None = None
+_openai_success: float | None = None
+_openai_failure: float | None = None
+
+_ready_cache: tuple[float, bool, dict] | None = None
+_ready_task: asyncio.Task | None = None
+
+
+def record_telegram_success() -> None:
+    """Note a successful getUpdates poll, or an update received over the webhook."""
+    global _telegram_success
+    _telegram_success = time.monotonic()
+
+
+def record_openai_result(ok: bool) -> None:
+    global _openai_success, _openai_failure
+    if ok:
+        _openai_success = time.monotonic()
+    else:
+        _openai_failure = time.monotonic()
+
+
+class PollingRequest(HTTPXRequest):
+    """The request object used for getUpdates, recording every successful poll for the readiness check."""
+
+    async def do_request(self, *args, **kwargs) -> tuple[int, bytes]:
+        status, payload = await super().do_request(*args, **kwargs)
+        if status < 300:
+            record_telegram_success()
+        return status, payload
+
+
+async def _beat() -> None:
+    global _heartbeat
+    while True:
+        _heartbeat = time.monotonic()
+        await asyncio.sleep(HEALTH_HEARTBEAT_INTERVAL)
+
+
+def start_monitoring(polling: bool) -> None:
+    """Start the event-loop heartbeat; call on the bot's loop. Webhook mode has no polls to check."""
+    global _loop, _heartbeat_task, _polling
+    _loop = asyncio.get_running_loop()
+    _polling = polling
+    if _heartbeat_task is None:
+        _heartbeat_task = asyncio.create_task(_beat())
+
+
+def stop_monitoring() -> None:
+    global _heartbeat_task
+    if _heartbeat_task is not None:
+        _heartbeat_task.cancel()
+        _heartbeat_task = None
+
+
+def _age(timestamp: float | None) -> float | None:
+    return None if timestamp is None else round(time.monotonic() - timestamp, 1)
+
+
+def liveness() -> tuple[bool, dict]:
+    """Whether the event loop is still running callbacks. Safe to call from any thread."""
+    if _heartbeat is None:
+        # Still starting up; failing here would only get the process restarted before it is ready
+        return True, {"loop": "starting"}
+    age = _age(_heartbeat)
+    return age < HEALTH_LOOP_STALL_SECONDS, {"loop_heartbeat_age": age}
+
+
+async def _check_database() -> str | None:
+    from sqlalchemy import text
+
+    from src.async_db import get_async_engine
+
+    try:
+        async with asyncio.timeout(HEALTH_PROBE_TIMEOUT):
+            async with get_async_engine().connect() as conn:
+                await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def _check_telegram() -> str | None:
+    if not _polling:
+        return None
+    if _telegram_success is None:
+        return "no successful poll yet"
+    if _age(_telegram_success) > HEALTH_TELEGRAM_MAX_AGE:
+        return f"last successful poll {_age(_telegram_success)}s ago"
+    return None
+
+
+def _check_openai() -> str | None:
+    if _openai_failure is None or (_openai_success is not None and _openai_success > _openai_failure):
+        return None
+    since = _openai_success if _openai_success is not None else _started
+    if time.monotonic() - since > HEALTH_OPENAI_MAX_AGE:
+        return "requests keep failing"
+    return None
+
+
+async def _probe() -> tuple[bool, dict]:
+    global _ready_cache
+    failures = {
+        "database": await _check_database(),
+        "telegram": _check_telegram(),
+        "openai": _check_openai(),
+    }
+    checks = {name: error or "ok" for name, error in failures.items()}
+    checks["telegram_last_success_age"] = _age(_telegram_success)
+    checks["openai_last_success_age"] = _age(_openai_success)
+    ready = not any(failures.values())
+    if not ready:
+        logger.warning(f"Not ready: {checks}")
+    _ready_cache = (time.monotonic(), ready, checks)
+    return ready, checks
+
+
+async def readiness() -> tuple[bool, dict]:
+    """Probe the database and check Telegram and OpenAI activity; call on the bot's loop.
+
+    Results are cached for HEALTH_CACHE_SECONDS and concurrent callers share a single probe.
+    """
+    global _ready_task
+    cached = _ready_cache
+    if cached is not None and time.monotonic() - cached[0] < HEALTH_CACHE_SECONDS:
+        return cached[1], cached[2]
+
+    if _ready_task is None or _ready_task.done():
+        _ready_task = asyncio.create_task(_probe())
+    return await asyncio.shield(_ready_task)
+
+
+def readiness_from_thread() -> tuple[bool, dict]:
+    """``readiness`` for the status server's threads; a loop that cannot answer in time is not ready."""
+    cached = _ready_cache
+    if cached is not None and time.monotonic() - cached[0] < HEALTH_CACHE_SECONDS:
+        return cached[1], cached[2]
+    if _loop is None:
+        return False, {"loop": "starting"}
+
+    future = asyncio.run_coroutine_threadsafe(readiness(), _loop)
+    try:
+        return future.result(HEALTH_PROBE_TIMEOUT + 1)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        return False, {"loop": "not responding"}
+
+
+def health_body(ok: bool, checks: dict) -> bytes:
+    return json.dumps({"status": "ok" if ok else "fail", "checks": checks}).encode()
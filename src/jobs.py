@@ -0,0 +1,362 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram.ext import ExtBot as Bot
+
+from src.async_db import db_session, get_async_engine
+from src.db import Job, utcnow
+from src.locks import holder_id
+from src.metrics import JOB_DURATION, JOBS_PROCESSED, JOBS_RUNNING
+from src.rate_limit import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+# Work that must survive a restart (the daily delivery) is stored in the jobs table and run by workers in the bot
+# process and in any number of `python -m src.worker` processes. A worker claims pending jobs with
+# SELECT ... FOR UPDATE SKIP LOCKED, so workers never run the same job at once, and leases each for
+# JOB_LEASE_SECONDS, renewing the lease every third of that while the job runs; a job whose worker died is claimed
+# again once its lease runs out. Failed jobs are retried with exponential backoff from JOB_RETRY_DELAY seconds; after
+# JOB_MAX_ATTEMPTS attempts (or a failure not worth retrying) they are kept as "dead" for inspection.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "20"))  # Jobs run at once per process (0 runs none in the bot process)
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))
+# Finished jobs (and their idempotency keys) are kept this long
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+# Rows per INSERT when enqueueing; keeps SQLite under its bound parameter limit
+ENQUEUE_CHUNK = 500
+PRUNE_INTERVAL = 3600
+
+JobHandler = Callable[[Bot, Job], Awaitable[None]]
+
+
+@dataclass
+class JobKind:
+    handler: JobHandler
+    # Whether a failure is worth another attempt; anything else is dead at once
+    retryable: Callable[[Exception], bool]
+
+
+_kinds: dict[str, JobKind] = {}
+
+
+def job_handler(kind: str, retryable: Callable[[Exception], bool] = lambda e: True):
+    """Register the decorated ``async def handler(bot, job)`` to run jobs of ``kind``."""
+
+    def decorator(handler: JobHandler) -> JobHandler:
+        _kinds[kind] = JobKind(handler, retryable)
+        return handler
+
+    return decorator
+
+
+async def enqueue(
+    db: AsyncSession,
+    kind: str,
+    jobs: Iterable[tuple[str | None, dict]],
+    run_at: datetime | None = None,
+    max_attempts: int = JOB_MAX_ATTEMPTS,
+) -> int:
+    """Add ``(key, payload)`` jobs in ``db``'s transaction, for the caller to commit; returns how many were added.
+
+    Jobs whose key is already in the table, finished or not, are skipped, so enqueueing is idempotent per key.
+    """
+    if get_async_engine().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    run_at = run_at or utcnow()
+    rows = [
+        {
+            "kind": kind,
+            "key": key,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_at": run_at,
+        }
+        for key, payload in jobs
+    ]
+    added = 0
+    for start in range(0, len(rows), ENQUEUE_CHUNK):
+        statement = insert(Job.__table__).values(rows[start : start + ENQUEUE_CHUNK])
+        result = await db.execute(statement.on_conflict_do_nothing(index_elements=["key"]))
+        added += result.rowcount
+    return added
+
+
+async def update_payload(db: AsyncSession, job: Job, **values) -> None:
+    """Add ``values`` to ``job``'s payload in ``db``'s transaction, for the caller to commit.
+
+    A handler records its progress this way, in the transaction that makes it, so a retry of the job after a
+    failure or a crash can pick up where the earlier attempt left off. Raises when the job's lease has run out and
+    another worker may be running it, so the caller rolls back instead of doing the work twice.
+    """
+    payload = {**job.payload, **values}
+    # noinspection PyTypeChecker
+    result = await db.execute(
+        update(Job).filter(Job.id == job.id, Job.locked_by == job.locked_by).values(payload=payload)
+    )
+    if result.rowcount == 0:
+        raise RuntimeError(f"Lost the lease on job {job.id}")
+    job.payload = payload
+
+
+async def claim(worker_id: str, limit: int) -> list[Job]:
+    """Take up to ``limit`` due jobs, including ones whose worker's lease ran out, and lease them to ``worker_id``."""
+    now = utcnow()
+    # noinspection PyTypeChecker
+    claimable = (
+        select(Job.id)
+        .filter(
+            or_(
+                and_(Job.status == "pending", Job.run_at <= now),
+                and_(Job.status == "running", Job.locked_until < now),
+            )
+        )
+        .order_by(Job.run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        jobs = await db.scalars(
+            update(Job)
+            .filter(Job.id.in_(claimable))
+            .values(
+                status="running",
+                attempts=Job.attempts + 1,
+                locked_by=worker_id,
+                locked_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+            )
+            .returning(Job),
+            execution_options={"synchronize_session": False},
+        )
+        jobs = jobs.all()
+        await db.commit()
+    return jobs
+
+
+async def renew_leases(worker_id: str) -> int:
+    """Extend the lease on every job ``worker_id`` is running; returns how many it still holds."""
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        result = await db.execute(
+            update(Job)
+            .filter(Job.locked_by == worker_id, Job.status == "running")
+            .values(locked_until=utcnow() + timedelta(seconds=JOB_LEASE_SECONDS))
+        )
+        await db.commit()
+    return result.rowcount
+
+
+async def _finish(job: Job, worker_id: str, **values) -> None:
+    # Only while the lease is still ours; after it ran out, another worker may have claimed the job
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        await db.execute(
+            update(Job)
+            .filter(Job.id == job.id, Job.locked_by == worker_id)
+            .values(locked_by=None, locked_until=None, **values)
+        )
+        await db.commit()
+
+
+async def prune() -> int:
+    """Delete finished jobs older than JOB_RETENTION_DAYS; dead ones are kept until requeued or deleted by hand."""
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        result = await db.execute(
+            delete(Job).filter(Job.status == "done", Job.finished_at < utcnow() - timedelta(days=JOB_RETENTION_DAYS))
+        )
+        await db.commit()
+    return result.rowcount
+
+
+async def requeue_dead(kind: str | None = None) -> int:
+    """Give dead jobs (of ``kind``, or all) a fresh set of attempts; returns how many."""
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        result = await db.execute(
+            update(Job)
+            .filter(Job.status == "dead", *([Job.kind == kind] if kind else []))
+            .values(status="pending", attempts=0, run_at=utcnow(), finished_at=None)
+        )
+        await db.commit()
+    return result.rowcount
+
+
+async def job_counts() -> dict[tuple[str, str], int]:
+    """Jobs in the table by ``(kind, status)``."""
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        rows = await db.execute(select(Job.kind, Job.status, func.count()).group_by(Job.kind, Job.status))
+        return {(kind, status): count for kind, status, count in rows}
+
+
+@dataclass
+class JobStats:
+    claimed: int = 0
+    done: int = 0
+    retried: int = 0
+    dead: int = 0
+    released: int = 0
+
+
+stats = JobStats()
+
+
+class JobWorker:
+    """Claims jobs and runs up to ``concurrency`` of them at a time on the current event loop."""
+
+    def __init__(self, bot: Bot, concurrency: int = JOB_WORKERS, poll_interval: float = JOB_POLL_SECONDS):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.id = holder_id()
+        self._running: set[asyncio.Task] = set()
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._renewer: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._dispatch())
+        self._renewer = asyncio.create_task(self._renew_leases())
+
+    async def stop(self) -> None:
+        """Stop claiming and hand the running jobs back, so another worker can pick them up without a lease wait."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for task in self._running:
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        if self._renewer is not None:
+            self._renewer.cancel()
+            await asyncio.gather(self._renewer, return_exceptions=True)
+            self._renewer = None
+
+    def wake(self) -> None:
+        """Look for jobs now instead of at the next poll, e.g. right after enqueueing some."""
+        self._wake.set()
+
+    async def _dispatch(self) -> None:
+        next_prune = time.monotonic()
+        while True:
+            free = self.concurrency - len(self._running)
+            jobs = []
+            if free > 0:
+                try:
+                    jobs = await claim(self.id, free)
+                except Exception:
+                    logger.exception("Failed to claim jobs")
+            stats.claimed += len(jobs)
+            for job in jobs:
+                task = asyncio.create_task(self._execute(job))
+                self._running.add(task)
+                task.add_done_callback(self._finished)
+
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + PRUNE_INTERVAL
+                try:
+                    await prune()
+                except Exception:
+                    logger.exception("Failed to prune finished jobs")
+
+            # A full batch means there may be more waiting: go again as soon as a slot frees up
+            if free > 0 and len(jobs) == free:
+                continue
+            self._wake.clear()
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+
+    async def _renew_leases(self) -> None:
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            if not self._running:
+                continue
+            try:
+                await renew_leases(self.id)
+            except Exception as e:
+                logger.warning(f"Failed to renew job leases: {type(e).__name__}: {e}")
+
+    def _finished(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        self._wake.set()
+
+    async def _execute(self, job: Job) -> None:
+        kind = _kinds.get(job.kind)
+        JOBS_RUNNING.inc()
+        started = time.perf_counter()
+        try:
+            if job.attempts > job.max_attempts:
+                # Its workers kept dying before it finished
+                raise RuntimeError(f"Job lease expired after {job.max_attempts} attempts")
+            if kind is None:
+                raise LookupError(f"No handler for {job.kind} jobs")
+            await kind.handler(self.bot, job)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back without using up an attempt
+            await _finish(job, self.id, status="pending", run_at=utcnow(), attempts=job.attempts - 1)
+            stats.released += 1
+            JOBS_PROCESSED.inc(kind=job.kind, outcome="released")
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if kind is not None and kind.retryable(e) and job.attempts < job.max_attempts:
+                delay = backoff_delay(JOB_RETRY_DELAY, job.attempts)
+                logger.warning(f"Job {job.id} ({job.key}) failed, retrying in {delay:.0f}s: {error}")
+                await _finish(
+                    job, self.id, status="pending", last_error=error, run_at=utcnow() + timedelta(seconds=delay)
+                )
+                stats.retried += 1
+                JOBS_PROCESSED.inc(kind=job.kind, outcome="retry")
+            else:
+                logger.error(f"Job {job.id} ({job.key}) failed after {job.attempts} attempts: {error}")
+                await _finish(job, self.id, status="dead", last_error=error, finished_at=utcnow())
+                stats.dead += 1
+                JOBS_PROCESSED.inc(kind=job.kind, outcome="dead")
+        else:
+            await _finish(job, self.id, status="done", last_error=None, finished_at=utcnow())
+            stats.done += 1
+            JOBS_PROCESSED.inc(kind=job.kind, outcome="done")
+        finally:
+            JOB_DURATION.observe(time.perf_counter() - started, kind=job.kind)
+            JOBS_RUNNING.dec()
+
+
+# The workers running in this process
+_workers: list[JobWorker] = []
+
+
+def start_job_workers(bot: Bot, concurrency: int = JOB_WORKERS) -> None:
+    """Start running jobs in this process; call on the bot's loop. A no-op with a concurrency of 0."""
+    if concurrency > 0 and not _workers:
+        worker = JobWorker(bot, concurrency)
+        worker.start()
+        _workers.append(worker)
+
+
+async def stop_job_workers() -> None:
+    for worker in _workers:
+        await worker.stop()
+    _workers.clear()
+
+
+def notify_workers() -> None:
+    """Have this process's workers look for jobs now; call after committing new ones."""
+    for worker in _workers:
+        worker.wake()
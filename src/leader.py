@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import time
+from collections.abc import Callable
+from datetime import timedelta
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from src.async_db import db_session
+from src.db import Lease, utcnow
+from src.locks import holder_id
+from src.metrics import LEADER
+
+logger = logging.getLogger(__name__)
+
+# Every replica runs an election for the scheduler; the one holding the lease row schedules, the rest stand by.
+# The leader renews its lease every LEADER_RENEW_SECONDS, and a replica takes over once LEADER_LEASE_SECONDS pass
+# without a renewal (at once when the leader shuts down cleanly). Lease times come from each replica's clock, so
+# the clocks must agree to well within the renewal interval.
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "15"))
+LEADER_RENEW_SECONDS = float(os.getenv("LEADER_RENEW_SECONDS", "5"))
+
+
+async def acquire_lease(name: str, holder: str, seconds: float) -> bool:
+    """Take or renew the ``name`` lease for ``holder`` unless someone else holds an unexpired one."""
+    now = utcnow()
+    expires_at = now + timedelta(seconds=seconds)
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        result = await db.execute(
+            update(Lease)
+            .filter(Lease.name == name, or_(Lease.holder == holder, Lease.expires_at < now))
+            .values(holder=holder, expires_at=expires_at)
+        )
+        await db.commit()
+        if result.rowcount:
+            return True
+
+    # Either someone else holds it or nobody ever has; only the first insert of the row can succeed
+    try:
+        async with db_session() as db:
+            db.add(Lease(name=name, holder=holder, expires_at=expires_at))
+            await db.commit()
+    except IntegrityError:
+        return False
+    return True
+
+
+async def release_lease(name: str, holder: str) -> None:
+    """Give up the ``name`` lease if ``holder`` has it, so another process can take it without waiting."""
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        await db.execute(
+            update(Lease).filter(Lease.name == name, Lease.holder == holder).values(holder=None, expires_at=utcnow())
+        )
+        await db.commit()
+
+
+class LeaderElection:
+    """Holds the ``name`` lease whenever it can, calling ``on_elected`` on winning it and ``on_deposed`` on losing it."""
+
+    def __init__(
+        self,
+        name: str,
+        on_elected: Callable[[], None],
+        on_deposed: Callable[[], None],
+        lease_seconds: float = LEADER_LEASE_SECONDS,
+        renew_seconds: float = LEADER_RENEW_SECONDS,
+    ):
+        self.name = name
+        self.on_elected = on_elected
+        self.on_deposed = on_deposed
+        self.lease_seconds = lease_seconds
+        self.renew_seconds = renew_seconds
+        self.id = holder_id()
+        self.is_leader = False
+        # time.monotonic() until which the last lease we got is certainly still ours
+        self._valid_until = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop campaigning and hand the lease over at once if we hold it."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            self._set_leader(False)
+            try:
+                await release_lease(self.name, self.id)
+            except Exception:
+                logger.exception(f"Failed to release the {self.name} lease; it expires on its own")
+
+    def _set_leader(self, leader: bool) -> None:
+        self.is_leader = leader
+        LEADER.set(1 if leader else 0, role=self.name)
+        if leader:
+            logger.info(f"Elected {self.name} leader as {self.id}")
+            self.on_elected()
+        else:
+            logger.info(f"No longer the {self.name} leader")
+            self.on_deposed()
+
+    async def _run(self) -> None:
+        LEADER.set(0, role=self.name)
+        while True:
+            started = time.monotonic()
+            try:
+                acquired = await acquire_lease(self.name, self.id, self.lease_seconds)
+            except Exception as e:
+                # E.g. the database is down, or not migrated yet on a fresh start: keep leading only while the
+                # lease we already have lasts
+                logger.warning(f"Failed to renew the {self.name} lease: {type(e).__name__}: {e}")
+                acquired = None
+
+            if acquired:
+                self._valid_until = started + self.lease_seconds
+                if not self.is_leader:
+                    self._set_leader(True)
+            elif self.is_leader and (acquired is False or time.monotonic() >= self._valid_until):
+                self._set_leader(False)
+
+            delay = self.renew_seconds
+            if self.is_leader:
+                # Retry a failed renewal in time to step down before another process can take over
+                delay = min(delay, max(self._valid_until - time.monotonic(), 0))
+            await asyncio.sleep(delay)
+
+
+# The elections this process runs
+_elections: list[LeaderElection] = []
+
+
+def start_leader_election(name: str, on_elected: Callable[[], None], on_deposed: Callable[[], None]) -> None:
+    """Run ``on_elected`` only while this process is the ``name`` leader; call on the bot's loop."""
+    election = LeaderElection(name, on_elected, on_deposed)
+    election.start()
+    _elections.append(election)
+
+
+async def stop_leader_elections() -> None:
+    for election in _elections:
+        await election.stop()
+    _elections.clear()
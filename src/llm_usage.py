@@ -0,0 +1,240 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from collections import deque
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from src.metrics import (
+    OPENAI_COST,
+    OPENAI_QUEUE_WAIT,
+    current_openai_caller,
+    current_openai_function,
+    record_openai_usage,
+)
+
+logger = logging.getLogger(__name__)
+
+# Every OpenAI request is recorded in the llm_usage table with what it was for, its tokens, cost and timings. Records
+# are buffered and written in batches every LLM_USAGE_FLUSH_SECONDS (sooner once LLM_USAGE_BATCH_SIZE are waiting),
+# so a request never waits on the database for them; past LLM_USAGE_MAX_PENDING unwritten records, new ones are dropped
+LLM_USAGE_TRACING = os.getenv("LLM_USAGE_TRACING", "true").lower() in ("1", "true", "yes")
+LLM_USAGE_FLUSH_SECONDS = float(os.getenv("LLM_USAGE_FLUSH_SECONDS", "5"))
+LLM_USAGE_BATCH_SIZE = int(os.getenv("LLM_USAGE_BATCH_SIZE", "500"))
+LLM_USAGE_MAX_PENDING = int(os.getenv("LLM_USAGE_MAX_PENDING", "10000"))
+
+# US dollars per million tokens, for the estimated cost of each request (the defaults are gpt-5's list prices)
+OPENAI_PROMPT_PRICE_PER_MILLION = float(os.getenv("OPENAI_PROMPT_PRICE_PER_MILLION", "1.25"))
+OPENAI_COMPLETION_PRICE_PER_MILLION = float(os.getenv("OPENAI_COMPLETION_PRICE_PER_MILLION", "10"))
+
+
+@dataclass
+class UsageWriterStats:
+    recorded: int = 0
+    written: int = 0
+    dropped: int = 0
+    batches: int = 0
+    errors: int = 0
+
+
+stats = UsageWriterStats()
+
+
+@dataclass
+class LLMCall:
+    """One OpenAI request, filled in while it runs; durations are in seconds."""
+
+    function: str
+    model: str
+    user_id: int | None
+    session_id: int | None
+    created_at: datetime
+    started: float = field(default_factory=time.perf_counter)
+    queue_wait: float = 0.0
+    latency: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    outcome: str = "ok"
+
+    @property
+    def cost(self) -> float:
+        return (
+            self.prompt_tokens * OPENAI_PROMPT_PRICE_PER_MILLION
+            + self.completion_tokens * OPENAI_COMPLETION_PRICE_PER_MILLION
+        ) / 1_000_000
+
+    def sent(self) -> None:
+        """Mark the end of the wait for the rate limiters and an in-flight slot."""
+        self.queue_wait = time.perf_counter() - self.started
+        OPENAI_QUEUE_WAIT.observe(self.queue_wait, function=self.function)
+
+    def add_usage(self, usage) -> None:
+        """Take the token counts from a completion's ``usage`` (absent on some responses and stream chunks)."""
+        record_openai_usage(usage)
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+
+
+# Records waiting to be written. Synchronous chat_* calls append from worker threads, which deque allows.
+_pending: deque[dict] = deque()
+_loop: asyncio.AbstractEventLoop | None = None
+_writer_task: asyncio.Task | None = None
+_flush_requested: asyncio.Event | None = None
+
+
+@contextlib.contextmanager
+def trace_call(model: str) -> Iterator[LLMCall]:
+    """Record the OpenAI request made inside the block, attributed to the current function, user and session."""
+    from src.db import utcnow
+
+    user_id, session_id = current_openai_caller()
+    call = LLMCall(
+        function=current_openai_function(), model=model, user_id=user_id, session_id=session_id, created_at=utcnow()
+    )
+    try:
+        yield call
+    except BaseException as e:
+        call.outcome = type(e).__name__
+        raise
+    finally:
+        record(call)
+
+
+def record(call: LLMCall) -> None:
+    """Queue ``call`` for the next batch written to the llm_usage table."""
+    OPENAI_COST.inc(call.cost, function=call.function)
+    if not LLM_USAGE_TRACING:
+        return
+    if len(_pending) >= LLM_USAGE_MAX_PENDING:
+        stats.dropped += 1
+        return
+
+    _pending.append(
+        {
+            "created_at": call.created_at,
+            "function": call.function,
+            "model": call.model,
+            "user_id": call.user_id,
+            "session_id": call.session_id,
+            "prompt_tokens": call.prompt_tokens,
+            "completion_tokens": call.completion_tokens,
+            "cost": call.cost,
+            "queue_wait": call.queue_wait,
+            "latency": call.latency,
+            "outcome": call.outcome,
+        }
+    )
+    stats.recorded += 1
+    if len(_pending) >= LLM_USAGE_BATCH_SIZE and _loop is not None and _flush_requested is not None:
+        _loop.call_soon_threadsafe(_flush_requested.set)
+
+
+async def flush() -> int:
+    """Write every buffered record, a batch per INSERT; returns how many were written.
+
+    A batch that fails (or is cancelled) is put back to be retried with the next flush.
+    """
+    from sqlalchemy import insert
+
+    from src.async_db import db_session
+    from src.db import LLMUsage
+
+    written = 0
+    while _pending:
+        batch = [_pending.popleft() for _ in range(min(len(_pending), LLM_USAGE_BATCH_SIZE))]
+        try:
+            async with db_session() as db:
+                # A Core insert on the table is one executemany; the ORM's bulk insert would split the batch by
+                # which of its values are None
+                await db.execute(insert(LLMUsage.__table__), batch)
+                await db.commit()
+        except asyncio.CancelledError:
+            _pending.extendleft(reversed(batch))
+            raise
+        except Exception:
+            stats.errors += 1
+            logger.exception(f"Failed to write {len(batch)} LLM usage records")
+            _pending.extendleft(reversed(batch))
+            break
+        written += len(batch)
+        stats.written += len(batch)
+        stats.batches += 1
+    return written
+
+
+async def _write_periodically() -> None:
+    while True:
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(_flush_requested.wait(), LLM_USAGE_FLUSH_SECONDS)
+        _flush_requested.clear()
+        await flush()
+
+
+def start_usage_writer() -> None:
+    """Start writing usage records in the background; call on the bot's loop."""
+    global _loop, _writer_task, _flush_requested
+    if _writer_task is None and LLM_USAGE_TRACING:
+        _loop = asyncio.get_running_loop()
+        _flush_requested = asyncio.Event()
+        _writer_task = asyncio.create_task(_write_periodically())
+
+
+async def stop_usage_writer() -> None:
+    """Stop the background writer and write whatever is still buffered."""
+    global _loop, _writer_task, _flush_requested
+    if _writer_task is not None:
+        _writer_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _writer_task
+        _loop = _writer_task = _flush_requested = None
+    await flush()
+
+
+@dataclass
+class FunctionUsage:
+    """Totals over the recorded requests of one chat_* function; durations are averages in seconds."""
+
+    function: str
+    calls: int
+    errors: int
+    prompt_tokens: int
+    completion_tokens: int
+    cost: float
+    queue_wait: float
+    latency: float
+    max_latency: float
+
+
+async def usage_summary(since: datetime) -> list[FunctionUsage]:
+    """Per-function totals of the requests made since ``since`` (naive UTC), the most expensive first."""
+    from sqlalchemy import case, func, select
+
+    from src.async_db import db_session
+    from src.db import LLMUsage
+
+    # Include the records still waiting for the writer
+    await flush()
+
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        rows = await db.execute(
+            select(
+                LLMUsage.function,
+                func.count(),
+                func.sum(case((LLMUsage.outcome != "ok", 1), else_=0)),
+                func.sum(LLMUsage.prompt_tokens),
+                func.sum(LLMUsage.completion_tokens),
+                func.sum(LLMUsage.cost),
+                func.avg(LLMUsage.queue_wait),
+                func.avg(LLMUsage.latency),
+                func.max(LLMUsage.latency),
+            )
+            .filter(LLMUsage.created_at >= since)
+            .group_by(LLMUsage.function)
+            .order_by(func.sum(LLMUsage.cost).desc())
+        )
+        return [FunctionUsage(*row) for row in rows]
@@ -0,0 +1,39 @@
+import asyncio
+import os
+import socket
+import uuid
+from collections.abc import AsyncIterator, Hashable
+from contextlib import asynccontextmanager
+
+
+class KeyedLocks:
+    """An ``asyncio.Lock`` per key, kept only while a task holds or waits for it, so idle keys cost nothing.
+
+    Waiters for a key are woken in FIFO order.
+    """
+
+    def __init__(self):
+        # Lock per key and the number of tasks holding or waiting for it
+        self._locks: dict[Hashable, tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+
+def holder_id() -> str:
+    """A new id for a lock or lease holder in the database, naming the host and process for whoever inspects it."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
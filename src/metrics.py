@@ -0,0 +1,451 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import math
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Counters, gauges and histograms rendered in the Prometheus text format on /metrics. The bot records them on the
+# event loop while the status server renders them from its own thread, so every metric guards its values with a lock.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bucket bounds in seconds: Telegram handlers and DB queries are fast, OpenAI calls take seconds to minutes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """A value that goes up and down; with ``function``, it is read from that callable at scrape time instead."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        function: Callable[[], float] | None = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        if self.function is not None:
+            yield f"{self.name} {_format_value(self.function())}"
+            return
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count per bucket (plus +Inf), the sum and the count
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts, strict=True):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: M) -> M:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = Registry()
+
+
+@dataclass
+class HitStats:
+    """In-process hit and miss counts of a cache, for the admin stats commands; subclasses add their own counts."""
+
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+
+# Telegram updates, labelled with the command (or handler name for plain messages)
+HANDLER_REQUESTS = registry.register(
+    Counter("tutor_bot_handler_requests_total", "Updates handled, by handler and outcome.", ("handler", "outcome"))
+)
+HANDLER_DURATION = registry.register(
+    Histogram("tutor_bot_handler_duration_seconds", "Time spent handling an update.", ("handler",), SLOW_BUCKETS)
+)
+UPDATES_IN_FLIGHT = registry.register(Gauge("tutor_bot_updates_in_flight", "Updates currently being handled."))
+USER_QUEUE_WAIT = registry.register(
+    Histogram("tutor_bot_user_queue_wait_seconds", "Time an update waited behind earlier updates from its chat.")
+)
+COALESCED_MESSAGES = registry.register(
+    Counter("tutor_bot_coalesced_messages_total", "Text messages answered together with an earlier one.")
+)
+
+# OpenAI calls, labelled with the chat_* function that made them
+OPENAI_REQUESTS = registry.register(
+    Counter("tutor_bot_openai_requests_total", "OpenAI requests, by function and outcome.", ("function", "outcome"))
+)
+OPENAI_DURATION = registry.register(
+    Histogram("tutor_bot_openai_request_duration_seconds", "OpenAI request latency.", ("function",), SLOW_BUCKETS)
+)
+OPENAI_TOKENS = registry.register(
+    Counter("tutor_bot_openai_tokens_total", "Tokens used, by function and kind.", ("function", "kind"))
+)
+OPENAI_QUEUE_WAIT = registry.register(
+    Histogram(
+        "tutor_bot_openai_queue_wait_seconds",
+        "Time OpenAI requests waited for the rate limiters and an in-flight slot.",
+        ("function",),
+    )
+)
+OPENAI_COST = registry.register(
+    Counter("tutor_bot_openai_cost_usd_total", "Estimated OpenAI spend in US dollars, by function.", ("function",))
+)
+
+# Cached replies served instead of a completion
+RESPONSE_CACHE_REQUESTS = registry.register(
+    Counter(
+        "tutor_bot_response_cache_requests_total",
+        "Response cache lookups, by function and outcome.",
+        ("function", "outcome"),
+    )
+)
+
+# Pre-generated questions (src.question_pool)
+QUESTION_POOL_REQUESTS = registry.register(
+    Counter("tutor_bot_question_pool_requests_total", "Question pool lookups, by outcome.", ("outcome",))
+)
+QUESTION_POOL_REFILLED = registry.register(
+    Counter("tutor_bot_question_pool_refilled_total", "Questions generated and stored in the pool.")
+)
+QUESTION_POOL_REFILL_FAILURES = registry.register(
+    Counter("tutor_bot_question_pool_refill_failures_total", "Background pool refills that failed.")
+)
+QUESTION_POOL_EVICTED = registry.register(
+    Counter(
+        "tutor_bot_question_pool_evicted_total",
+        "Pooled questions dropped for another subject or memo, or for their age.",
+    )
+)
+
+# Cached user rows (src.user_cache)
+USER_CACHE_REQUESTS = registry.register(
+    Counter("tutor_bot_user_cache_requests_total", "User cache lookups, by outcome.", ("outcome",))
+)
+USER_CACHE_REMOVALS = registry.register(
+    Counter(
+        "tutor_bot_user_cache_removals_total",
+        "User rows dropped from the cache, by reason (evicted or invalidated).",
+        ("reason",),
+    )
+)
+
+# Rate limiters in front of OpenAI and Telegram
+RATE_LIMIT_QUEUE_DEPTH = registry.register(
+    Gauge("tutor_bot_rate_limit_queue_depth", "Calls waiting for a rate limiter.", ("limiter",))
+)
+RATE_LIMIT_WAIT = registry.register(
+    Histogram("tutor_bot_rate_limit_wait_seconds", "Time calls waited for a rate limiter.", ("limiter",))
+)
+RATE_LIMIT_HITS = registry.register(
+    Counter("tutor_bot_rate_limit_hits_total", "Rate limit responses (429 / flood control) received.", ("limiter",))
+)
+
+# Durable jobs (src.jobs)
+JOBS_PROCESSED = registry.register(
+    Counter(
+        "tutor_bot_jobs_processed_total",
+        "Job attempts, by kind and outcome (done, retry, dead or released).",
+        ("kind", "outcome"),
+    )
+)
+JOB_DURATION = registry.register(
+    Histogram("tutor_bot_job_duration_seconds", "Time spent running a job attempt.", ("kind",), SLOW_BUCKETS)
+)
+JOBS_RUNNING = registry.register(Gauge("tutor_bot_jobs_running", "Jobs running in this process."))
+
+# Leader election (src.leader)
+LEADER = registry.register(
+    Gauge("tutor_bot_leader", "1 while this process holds the named role (e.g. the scheduler), else 0.", ("role",))
+)
+
+# Database
+DB_QUERY_DURATION = registry.register(
+    Histogram("tutor_bot_db_query_duration_seconds", "Time spent executing a statement.", ("statement",))
+)
+DB_POOL_CHECKOUTS = registry.register(
+    Counter("tutor_bot_db_pool_checkouts_total", "Connections checked out of the async engine's pool.")
+)
+
+# Daily question fan-out
+FANOUT_USERS = registry.register(
+    Counter("tutor_bot_fanout_users_total", "Daily question deliveries, by outcome.", ("outcome",))
+)
+FANOUT_PENDING = registry.register(
+    Gauge("tutor_bot_fanout_pending_users", "Users queued in running fan-outs and not processed yet.")
+)
+FANOUT_DURATION = registry.register(
+    Histogram("tutor_bot_fanout_duration_seconds", "Duration of a daily question fan-out.", (), SLOW_BUCKETS)
+)
+
+# The chat_* function an OpenAI request is made for, set by @openai_function
+_openai_function: contextvars.ContextVar[str] = contextvars.ContextVar("openai_function", default="other")
+# The user and tutoring session it is made for, when known
+_openai_caller: contextvars.ContextVar[tuple[int | None, int | None]] = contextvars.ContextVar(
+    "openai_caller", default=(None, None)
+)
+
+
+def current_openai_function() -> str:
+    return _openai_function.get()
+
+
+def current_openai_caller() -> tuple[int | None, int | None]:
+    """The ``(user_id, session_id)`` the current OpenAI request is made for; either may be None."""
+    return _openai_caller.get()
+
+
+@contextmanager
+def openai_caller(user_id: int | None = None, session_id: int | None = None) -> Iterator[None]:
+    """Attribute the OpenAI requests made inside the block to a user and session.
+
+    Either one left as None keeps the value set by an enclosing block.
+    """
+    current_user_id, current_session_id = _openai_caller.get()
+    token = _openai_caller.set(
+        (
+            current_user_id if user_id is None else user_id,
+            current_session_id if session_id is None else session_id,
+        )
+    )
+    try:
+        yield
+    finally:
+        _openai_caller.reset(token)
+
+
+def _caller_arguments(signature: inspect.Signature, args: tuple, kwargs: dict) -> dict:
+    # chat_* functions take the tutoring session as ``session``, or just its id as ``session_id``
+    arguments = signature.bind_partial(*args, **kwargs).arguments
+    session = arguments.get("session")
+    if session is not None:
+        return {"user_id": getattr(session, "user_id", None), "session_id": getattr(session, "id", None)}
+    return {"session_id": arguments.get("session_id")}
+
+
+def openai_function(name: str):
+    """Attribute the OpenAI requests made inside the decorated (sync or async) function to ``name``.
+
+    A ``session`` or ``session_id`` argument also attributes them to that session (and its user).
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                token = _openai_function.set(name)
+                try:
+                    with openai_caller(**_caller_arguments(signature, args, kwargs)):
+                        return await func(*args, **kwargs)
+                finally:
+                    _openai_function.reset(token)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _openai_function.set(name)
+            try:
+                with openai_caller(**_caller_arguments(signature, args, kwargs)):
+                    return func(*args, **kwargs)
+            finally:
+                _openai_function.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+def record_openai_usage(usage) -> None:
+    """Count the tokens of a completion's ``usage`` (absent on some responses) against the current function."""
+    if usage is None:
+        return
+    function = current_openai_function()
+    OPENAI_TOKENS.inc(usage.prompt_tokens, function=function, kind="prompt")
+    OPENAI_TOKENS.inc(usage.completion_tokens, function=function, kind="completion")
+
+
+def _statement_type(statement: str) -> str:
+    words = statement.split(None, 1)
+    return words[0].upper() if words else "OTHER"
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time every statement and count pool checkouts on ``engine`` (an AsyncEngine's ``sync_engine``)."""
+
+    # noinspection PyUnusedLocal
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    # noinspection PyUnusedLocal
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_DURATION.observe(time.perf_counter() - started, statement=_statement_type(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def on_error(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+    # noinspection PyUnusedLocal
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.inc()
+
+    registry.register(
+        Gauge(
+            "tutor_bot_db_pool_checked_out",
+            "Connections currently checked out of the async engine's pool.",
+            function=engine.pool.checkedout,
+        )
+    )
@@ -0,0 +1,99 @@
+import logging
+
+from sqlalchemy import Connection, Engine, MetaData, inspect, text
+
+logger = logging.getLogger(__name__)
+
+# Versioned schema changes for databases created before a column or index existed.
+# A fresh database gets the whole schema from the models and is stamped with every version.
+MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (
+        1,
+        "Per-user delivery time zone and due-time index",
+        [
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS timezone VARCHAR",
+            "CREATE INDEX IF NOT EXISTS ix_users_next_problem ON users (next_problem)",
+        ],
+    ),
+    (
+        2,
+        "Rolling conversation summary per session",
+        [
+            "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS summary VARCHAR",
+            "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS summary_through_id INTEGER",
+        ],
+    ),
+    (
+        3,
+        "Partial index over each user's live sessions",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_sessions_active ON sessions (user_id, created_at) WHERE NOT archived",
+        ],
+    ),
+    (
+        4,
+        "Database-side UTC timestamps and id-ordered message history",
+        [
+            "ALTER TABLE sessions ALTER COLUMN created_at SET DEFAULT timezone('utc', now())",
+            "ALTER TABLE sessions ALTER COLUMN updated_at SET DEFAULT timezone('utc', now())",
+            "ALTER TABLE solution_responses ALTER COLUMN created_at SET DEFAULT timezone('utc', now())",
+            "ALTER TABLE messages ALTER COLUMN created_at SET DEFAULT timezone('utc', now())",
+            "CREATE INDEX IF NOT EXISTS ix_messages_session_id_id ON messages (session_id, id)",
+        ],
+    ),
+    (
+        5,
+        "Drop the message index covered by ix_messages_session_id_id",
+        [
+            "DROP INDEX IF EXISTS ix_messages_session_id",
+        ],
+    ),
+]
+
+
+def apply_migrations(conn: Connection, metadata: MetaData) -> None:
+    """Create missing tables and apply any pending migrations in the connection's transaction.
+
+    Takes a plain ``Connection`` so the async engine can run it with ``AsyncConnection.run_sync``.
+    """
+    if conn.dialect.name == "postgresql":
+        # Serialize migrations between replicas starting at the same time
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('daily_tutor_bot_migrations'))"))
+
+    fresh = not inspect(conn).has_table("users")
+    metadata.create_all(bind=conn)
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations "
+            "(version INTEGER PRIMARY KEY, description VARCHAR, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        )
+    )
+
+    applied = set(conn.scalars(text("SELECT version FROM schema_migrations")))
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        if not fresh:
+            logger.info(f"Applying migration {version}: {description}")
+            for statement in statements:
+                conn.execute(text(statement))
+        conn.execute(
+            text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+            {"version": version, "description": description},
+        )
+
+
+def migrate(engine: Engine, metadata: MetaData) -> None:
+    """Create missing tables and apply any pending migrations."""
+    with engine.begin() as conn:
+        apply_migrations(conn, metadata)
+
+
+if __name__ == "__main__":
+    # Run as a deploy step (python -m src.migrations) when replicas start with DB_MIGRATE_ON_START=false
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+
+    from src.db import init_db
+
+    init_db()
+    logger.info("Database schema is up to date")
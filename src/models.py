@@ -9,6 +9,11 @@ class SolutionResponse(BaseModel):
     performance: int | None
 
 
+class JudgedSolutionResponse(SolutionResponse):
+    # The friendly reply shown to the learner, written in the same call as the verdict
+    message: str
+
+
 class QuestionGeneration(BaseModel):
     possible_topics: list[str]
     topic: str
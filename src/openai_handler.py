@@ -1,12 +1,60 @@
+import asyncio
+import logging
 import os
+import threading
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from typing import TYPE_CHECKING
 
-from openai import OpenAI
+import httpx
 
-from src.models import QuestionGeneration, SolutionResponse
+from src.context_builder import build_history, count_message_tokens, messages_to_summarize
+from src.health import record_openai_result
+from src.llm_usage import LLMCall, trace_call
+from src.metrics import OPENAI_DURATION, OPENAI_REQUESTS, openai_function
+from src.rate_limit import TokenBucket
+
+if TYPE_CHECKING:
+    # openai and the pydantic models take a few hundred milliseconds to import, so they are imported on first use
+    from openai import AsyncOpenAI, OpenAI, RateLimitError
+
+    from src.db import Turn
+    from src.models import QuestionGeneration
+
+logger = logging.getLogger(__name__)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 MODEL_NAME = "gpt-5"  # Using GPT-5 (released in 2025)
 
+# Connection pooling and concurrency limits for the shared OpenAI clients
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "50"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+
+# Stay under the account's rate limits instead of finding them through 429s (0 disables either limit). Requests
+# reserve their prompt plus OPENAI_COMPLETION_TOKENS_ESTIMATE tokens, corrected once the response reports usage.
+# The API enforces limits over windows shorter than a minute, so at most OPENAI_RATE_LIMIT_BURST_SECONDS' worth
+# of the budget goes out at once (e.g. 8 requests at 500 per minute) and the rest is paced evenly.
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+OPENAI_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "500000"))
+OPENAI_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("OPENAI_COMPLETION_TOKENS_ESTIMATE", "1000"))
+OPENAI_RATE_LIMIT_BURST_SECONDS = float(os.getenv("OPENAI_RATE_LIMIT_BURST_SECONDS", "1"))
+# How long to hold all requests after a 429 without a Retry-After header
+OPENAI_RATE_LIMIT_PAUSE = float(os.getenv("OPENAI_RATE_LIMIT_PAUSE", "1"))
+
+# "combined" judges a /solve attempt and writes the learner-facing reply in one call;
+# "two_call" keeps the separate judge and summary requests
+JUDGE_MODE = os.getenv("JUDGE_MODE", "combined")
+
+# Stream free-text tutor replies so the user sees the first words instead of waiting for the whole answer
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() in ("1", "true", "yes")
+
+# Called with the reply text received so far while a completion streams in
+OnText = Callable[[str], Awaitable[None]]
+
 # System prompts for different assistant types
 # These are the ORIGINAL instructions from the OpenAI Assistants that were previously configured
 
@@ -77,6 +125,18 @@ Return your response as a JSON object with this structure:
     "performance": 1-10
 }"""
 
+COMBINED_JUDGE_SYSTEM_PROMPT = (
+    JUDGE_SYSTEM_PROMPT.removesuffix("""
+    "performance": 1-10
+}""")
+    + """
+    "performance": 1-10,
+    "message": "your_reply_to_the_student"
+}
+
+The message is what the student reads, so write it as their tutor rather than as the judge. Summarize the feedback in a friendly, conversational way. If they got it right, congratulate them! If not, give them an encouraging hint about what to work on next, but never reveal the expected answer. Be polite and a little playful, like a friendly tutor about 30 years old. Do not use LaTeX formatting for math in the message, use Markdown instead."""
+)
+
 GIVEUP_SYSTEM_PROMPT = """You are a helpful tutor assisting a learner in improving their understanding. Your role is to help them solve a problem they supply and to give constructive feedback on their solutions. The person has given up on their answer, and you must let them know the correct answer. You can help them understand what they were missing, or what else they could have done to reach that conclusion.
 
 You can suggest they try again with /question
@@ -96,11 +156,14 @@ Be polite and a little playful, but keep your professionalism. Be like a friendl
 
 Format all responses in Markdown. Do not use LaTeX formatting for math, use Markdown instead."""
 
+SUMMARY_SYSTEM_PROMPT = """You keep running notes on a tutoring conversation so the tutor can continue it without the full transcript.
 
-def chat_with_history(messages: list[dict], model: str = MODEL_NAME, response_format=None) -> str:
-    """Make a chat completion request with conversation history."""
-    client = OpenAI(api_key=OPENAI_API_KEY)
+You will be given the current notes (which may be empty) and the messages that followed them. Rewrite the notes to cover everything: what the learner has tried, what they understood or misunderstood, hints already given, and anything they asked the tutor to remember.
+
+Write in plain prose, in the third person, in at most 150 words. Never include the expected answer unless the tutor already revealed it."""
 
+
+def _completion_kwargs(messages: list[dict], model: str, response_format) -> dict:
     kwargs = {
         "model": model,
         "messages": messages,
@@ -109,22 +172,332 @@ def chat_with_history(messages: list[dict], model: str = MODEL_NAME, response_fo
     if response_format:
         kwargs["response_format"] = response_format
 
-    response = client.chat.completions.create(**kwargs)
+    return kwargs
+
+
+# Process-wide clients, created on first use so every request reuses the same keep-alive connection pool
+_client: "OpenAI | None" = None
+_async_client: "AsyncOpenAI | None" = None
+_client_lock = threading.Lock()
+_sync_in_flight = threading.BoundedSemaphore(OPENAI_MAX_IN_FLIGHT)
+_async_in_flight: asyncio.Semaphore | None = None
+_request_limiter: TokenBucket | None = None
+_token_limiter: TokenBucket | None = None
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_client() -> "OpenAI":
+    """Return the shared synchronous OpenAI client."""
+    from openai import DefaultHttpxClient, OpenAI
+
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OpenAI(
+                api_key=OPENAI_API_KEY,
+                timeout=OPENAI_TIMEOUT,
+                http_client=DefaultHttpxClient(limits=_http_limits()),
+            )
+    return _client
+
+
+def get_async_client() -> "AsyncOpenAI":
+    """Return the shared asynchronous OpenAI client."""
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    global _async_client, _async_in_flight, _request_limiter, _token_limiter
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            timeout=OPENAI_TIMEOUT,
+            http_client=DefaultAsyncHttpxClient(limits=_http_limits()),
+        )
+        _async_in_flight = asyncio.Semaphore(OPENAI_MAX_IN_FLIGHT)
+        _request_limiter = _minute_limiter("openai_requests", OPENAI_REQUESTS_PER_MINUTE)
+        _token_limiter = _minute_limiter("openai_tokens", OPENAI_TOKENS_PER_MINUTE)
+    return _async_client
+
+
+def _minute_limiter(name: str, per_minute: float) -> TokenBucket:
+    rate = per_minute / 60
+    return TokenBucket(name, rate, max(1.0, rate * OPENAI_RATE_LIMIT_BURST_SECONDS))
+
+
+async def close_clients() -> None:
+    """Close the shared clients and their connection pools, e.g. on application shutdown."""
+    global _client, _async_client, _async_in_flight, _request_limiter, _token_limiter
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+        _async_in_flight = None
+        _request_limiter = _token_limiter = None
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+@contextmanager
+def _observed_request(call: LLMCall) -> Iterator[None]:
+    """Record the latency and outcome of one OpenAI request against the calling chat_* function.
+
+    Entered once the request has its rate limit budget and in-flight slot, so the time before counts as queueing.
+    """
+    function = call.function
+    call.sent()
+    try:
+        with OPENAI_DURATION.time(function=function):
+            yield
+    except BaseException as e:
+        OPENAI_REQUESTS.inc(function=function, outcome=type(e).__name__)
+        if isinstance(e, Exception):
+            record_openai_result(ok=False)
+        raise
+    finally:
+        call.latency = time.perf_counter() - call.started - call.queue_wait
+    OPENAI_REQUESTS.inc(function=function, outcome="ok")
+    record_openai_result(ok=True)
+
+
+def _retry_after(error: "RateLimitError") -> float:
+    headers = error.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        return float(headers.get("retry-after", OPENAI_RATE_LIMIT_PAUSE))
+    except ValueError:
+        return OPENAI_RATE_LIMIT_PAUSE
+
+
+@asynccontextmanager
+async def _rate_limited(messages: list[dict]) -> AsyncIterator[Callable[[object], None]]:
+    """Wait for the request and token budgets, then hold an in-flight slot while the request runs.
+
+    Yields a callback that settles the token reservation with the ``usage`` the response reports.
+    """
+    from openai import RateLimitError
+
+    estimate = count_message_tokens(messages) + OPENAI_COMPLETION_TOKENS_ESTIMATE
+    await _request_limiter.acquire()
+    await _token_limiter.acquire(estimate)
+
+    def settle(usage) -> None:
+        if usage is not None:
+            _token_limiter.debit(usage.total_tokens - estimate)
+
+    async with _async_in_flight:
+        try:
+            yield settle
+        except RateLimitError as e:
+            # The client already retried this request; hold everyone else back for as long as the API asked
+            _request_limiter.pause(_retry_after(e))
+            raise
+
+
+def chat_with_history(messages: list[dict], model: str = MODEL_NAME, response_format=None) -> str:
+    """Make a chat completion request with conversation history."""
+    client = get_client()
+
+    with trace_call(model) as call:
+        with _sync_in_flight, _observed_request(call):
+            response = client.chat.completions.create(**_completion_kwargs(messages, model, response_format))
+        call.add_usage(response.usage)
+    return response.choices[0].message.content
+
+
+async def chat_with_history_async(messages: list[dict], model: str = MODEL_NAME, response_format=None) -> str:
+    """Make a chat completion request with conversation history without blocking the event loop."""
+    client = get_async_client()
+
+    with trace_call(model) as call:
+        async with _rate_limited(messages) as settle:
+            with _observed_request(call):
+                response = await client.chat.completions.create(**_completion_kwargs(messages, model, response_format))
+        settle(response.usage)
+        call.add_usage(response.usage)
     return response.choices[0].message.content
 
 
+async def stream_chat_with_history_async(messages: list[dict], model: str = MODEL_NAME) -> AsyncIterator[str]:
+    """Stream a chat completion, yielding content deltas as they arrive."""
+    client = get_async_client()
+
+    with trace_call(model) as call:
+        async with _rate_limited(messages) as settle:
+            with _observed_request(call):
+                stream = await client.chat.completions.create(
+                    **_completion_kwargs(messages, model, None), stream=True, stream_options={"include_usage": True}
+                )
+                async with stream:
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+                        # Requested with include_usage, the last chunk carries the usage and no choices
+                        settle(chunk.usage)
+                        call.add_usage(chunk.usage)
+
+
+async def _reply_text_async(messages: list[dict], on_text: OnText | None) -> str:
+    """Get a free-text reply, streaming it through ``on_text`` when the caller can show partial text."""
+    if on_text is None or not STREAM_REPLIES:
+        return await chat_with_history_async(messages)
+
+    text = ""
+    async for delta in stream_chat_with_history_async(messages):
+        text += delta
+        await on_text(text)
+    return text
+
+
+async def _cached_reply_text_async(messages: list[dict], on_text: OnText | None) -> str:
+    """Like ``_reply_text_async``, for prompts that repeat across sessions; repeats are served from the cache."""
+    from src.response_cache import cached_reply
+
+    return await cached_reply(messages, MODEL_NAME, lambda: _reply_text_async(messages, on_text))
+
+
+def _question_messages(subject: str, memo: str) -> list[dict]:
+    return [
+        {"role": "system", "content": GENERATION_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": f"Give me a new problem for a learner in the subject: {subject}. They had the following note: {memo}. They will not see your response, so do not repeat it later.",
+        },
+    ]
+
+
+def _conversation_messages(session, stored_messages, user_response: str) -> list[dict]:
+    # Build message list with system prompt and history
+    messages = [{"role": "system", "content": MESSAGE_SYSTEM_PROMPT}]
+
+    # Add context about the question on every turn, since the turn that introduced it may be summarized away.
+    # Free conversation sessions have no question to anchor.
+    if session.expected_answer:
+        initial_context = f"""The student is working on this question: {session.question}
+
+Expected answer: {session.expected_answer}
+Solving process: {session.solving_process}
+
+Help guide them to the solution without giving it away directly."""
+        messages.append({"role": "system", "content": initial_context})
+
+    # Add the summary of older turns and every turn since verbatim; summary updates keep the latter bounded
+    messages.extend(build_history(session, stored_messages))
+
+    # Add current user message
+    messages.append({"role": "user", "content": user_response})
+    return messages
+
+
+def _summary_messages(summary: str | None, stored_messages) -> list[dict]:
+    transcript = "\n".join(f"{m.role}: {m.content}" for m in stored_messages)
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Current notes: {summary or '(none)'}\n\nMessages since then:\n{transcript}"},
+    ]
+
+
+def _solution_attempt_messages(session, user_response: str, combined: bool = False) -> list[dict]:
+    return [
+        {"role": "system", "content": COMBINED_JUDGE_SYSTEM_PROMPT if combined else JUDGE_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": f"""Question: {session.question}
+
+Expected answer: {session.expected_answer}
+Solving process: {session.solving_process}
+
+Student's solution: {user_response}
+
+Please evaluate this solution and provide feedback.""",
+        },
+    ]
+
+
+def _solution_result(response_text: str, combined: bool = False) -> dict:
+    from src.models import JudgedSolutionResponse, SolutionResponse
+
+    solution_data = (JudgedSolutionResponse if combined else SolutionResponse).model_validate_json(response_text)
+    result = {
+        "summarized_solution": solution_data.summarized_solution,
+        "is_correct": solution_data.is_correct,
+        "feedback": solution_data.feedback,
+        "performance_explanation": solution_data.performance_explanation,
+        "performance": solution_data.performance,
+        "full_solution": response_text,
+    }
+    if combined:
+        result["message"] = solution_data.message
+    return result
+
+
+def _judge_response_messages(session, stored_messages) -> list[dict]:
+    messages = [{"role": "system", "content": MESSAGE_SYSTEM_PROMPT}]
+
+    # Add context
+    context = f"""The student just submitted a solution and received feedback from a judge.
+
+Question: {session.question}
+
+Your role is to summarize the judge's feedback in a friendly, conversational way. If they got it right, congratulate them! If not, give them an encouraging hint about what to work on next."""
+    messages.append({"role": "system", "content": context})
+
+    # Add recent conversation history (last 5 messages)
+    for msg in stored_messages[-5:]:
+        if msg.role != "system":
+            messages.append({"role": msg.role, "content": msg.content})
+
+    # Request a summary
+    messages.append(
+        {
+            "role": "user",
+            "content": "Let me look at what the judge said. I'll only confirm if you are correct, but give you a hint if you are wrong.",
+        }
+    )
+    return messages
+
+
+def _giveup_messages(session) -> list[dict]:
+    return [
+        {"role": "system", "content": GIVEUP_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": f"""I'm giving up on this problem. Can you explain the solution?
+
+Question: {session.question}
+
+Expected answer: {session.expected_answer}
+Solving process: {session.solving_process}
+
+Please provide a complete, clear explanation of the solution.""",
+        },
+    ]
+
+
+def _play_messages(subject: str, memo: str) -> list[dict]:
+    return [
+        {"role": "system", "content": PLAY_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": f"I want to talk about: {subject}. Remember this note: {memo}. I may have something to talk about, but in case I don't, give me a couple of recommended topics.",
+        },
+    ]
+
+
+@openai_function("chat_generate_question")
 def chat_generate_question(subject: str, memo: str):
     """Generate a new question using the Chat Completions API."""
+    from src.models import QuestionGeneration
+
     try:
-        messages = [
-            {"role": "system", "content": GENERATION_SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": f"Give me a new problem for a learner in the subject: {subject}. They had the following note: {memo}. They will not see your response, so do not repeat it later.",
-            },
-        ]
-
-        response_text = chat_with_history(messages, response_format={"type": "json_object"})
+        response_text = chat_with_history(_question_messages(subject, memo), response_format={"type": "json_object"})
         question_data = QuestionGeneration.model_validate_json(response_text)
 
         # Return session_id (which will be set later) and question data
@@ -134,120 +507,63 @@ def chat_generate_question(subject: str, memo: str):
         return None, f"Error generating question: {str(e)}"
 
 
+@openai_function("chat_message")
 def chat_message(session, user_response: str, db):
     """Handle conversational messages using stored message history."""
-    from src.db import create_message, get_session_messages
+    from src.db import Turn, get_session_messages, save_turn
 
     try:
-        # Get conversation history
-        stored_messages = get_session_messages(db, session.id)
-
-        # Build message list with system prompt and history
-        messages = [{"role": "system", "content": MESSAGE_SYSTEM_PROMPT}]
-
-        # Add initial context about the question
-        if not stored_messages:
-            initial_context = f"""The student is working on this question: {session.question}
-
-Expected answer: {session.expected_answer}
-Solving process: {session.solving_process}
-
-Help guide them to the solution without giving it away directly."""
-            messages.append({"role": "system", "content": initial_context})
-
-        # Add conversation history
-        for msg in stored_messages:
-            if msg.role != "system":  # Don't include system messages from history
-                messages.append({"role": msg.role, "content": msg.content})
-
-        # Add current user message
-        messages.append({"role": "user", "content": user_response})
+        # Get conversation history not yet covered by the session summary
+        stored_messages = get_session_messages(db, session.id, after_id=session.summary_through_id)
 
         # Get response from OpenAI
-        response_text = chat_with_history(messages)
+        response_text = chat_with_history(_conversation_messages(session, stored_messages, user_response))
 
         # Store both messages in database
-        create_message(db, session.id, "user", user_response)
-        create_message(db, session.id, "assistant", response_text)
+        turn = Turn(session)
+        turn.add_message("user", user_response)
+        turn.add_message("assistant", response_text)
+        save_turn(db, turn)
 
         return response_text
     except Exception as e:
         return f"Whoops! I had a problem: {str(e)}"
 
 
+@openai_function("chat_solution_attempt")
 def chat_solution_attempt(session, user_response: str, db):
     """Evaluate a solution attempt using the judge system prompt."""
-    from src.db import create_message
+    from src.db import Turn, save_turn
 
     try:
-        messages = [
-            {"role": "system", "content": JUDGE_SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": f"""Question: {session.question}
-
-Expected answer: {session.expected_answer}
-Solving process: {session.solving_process}
-
-Student's solution: {user_response}
-
-Please evaluate this solution and provide feedback.""",
-            },
-        ]
-
-        response_text = chat_with_history(messages, response_format={"type": "json_object"})
+        response_text = chat_with_history(
+            _solution_attempt_messages(session, user_response), response_format={"type": "json_object"}
+        )
 
         # Parse the response
-        solution_data = SolutionResponse.model_validate_json(response_text)
+        result = _solution_result(response_text)
 
         # Store the evaluation in message history
-        create_message(db, session.id, "user", f"[SOLUTION ATTEMPT] {user_response}")
-        create_message(db, session.id, "assistant", f"[JUDGE FEEDBACK] {response_text}")
-
-        return {
-            "summarized_solution": solution_data.summarized_solution,
-            "is_correct": solution_data.is_correct,
-            "feedback": solution_data.feedback,
-            "performance_explanation": solution_data.performance_explanation,
-            "performance": solution_data.performance,
-            "full_solution": response_text,
-        }
+        turn = Turn(session)
+        turn.add_message("user", f"[SOLUTION ATTEMPT] {user_response}")
+        turn.add_message("assistant", f"[JUDGE FEEDBACK] {response_text}")
+        save_turn(db, turn)
+
+        return result
     except Exception as e:
         return {"feedback": f"Whoops! The judge seems to be having an issue: {str(e)}"}
 
 
+@openai_function("chat_judge_response")
 def chat_judge_response(session, db):
     """Get a conversational summary of the judge's feedback."""
     from src.db import create_message, get_session_messages
 
     try:
         # Get recent messages to find the judge feedback
-        stored_messages = get_session_messages(db, session.id)
-
-        messages = [{"role": "system", "content": MESSAGE_SYSTEM_PROMPT}]
+        stored_messages = get_session_messages(db, session.id, after_id=session.summary_through_id)
 
-        # Add context
-        context = f"""The student just submitted a solution and received feedback from a judge.
-
-Question: {session.question}
-
-Your role is to summarize the judge's feedback in a friendly, conversational way. If they got it right, congratulate them! If not, give them an encouraging hint about what to work on next."""
-        messages.append({"role": "system", "content": context})
-
-        # Add recent conversation history (last 5 messages)
-        for msg in stored_messages[-5:]:
-            if msg.role != "system":
-                messages.append({"role": msg.role, "content": msg.content})
-
-        # Request a summary
-        messages.append(
-            {
-                "role": "user",
-                "content": "Let me look at what the judge said. I'll only confirm if you are correct, but give you a hint if you are wrong.",
-            }
-        )
-
-        response_text = chat_with_history(messages)
+        response_text = chat_with_history(_judge_response_messages(session, stored_messages))
 
         # Store the response
         create_message(db, session.id, "assistant", response_text)
@@ -257,61 +573,238 @@ Your role is to summarize the judge's feedback in a friendly, conversational way
         return f"Error: {str(e)}"
 
 
+@openai_function("chat_giveup")
 def chat_giveup(session, db):
     """Provide the complete solution when a student gives up."""
-    from src.db import create_message
+    from src.db import Turn, save_turn
 
     try:
-        messages = [
-            {"role": "system", "content": GIVEUP_SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": f"""I'm giving up on this problem. Can you explain the solution?
-
-Question: {session.question}
-
-Expected answer: {session.expected_answer}
-Solving process: {session.solving_process}
-
-Please provide a complete, clear explanation of the solution.""",
-            },
-        ]
-
-        response_text = chat_with_history(messages)
+        response_text = chat_with_history(_giveup_messages(session))
 
         # Store in message history
-        create_message(db, session.id, "user", "I give up.")
-        create_message(db, session.id, "assistant", response_text)
+        turn = Turn(session)
+        turn.add_message("user", "I give up.")
+        turn.add_message("assistant", response_text)
+        save_turn(db, turn)
 
         return response_text
     except Exception as e:
         return f"Giving up did not complete successfully: {str(e)}"
 
 
+@openai_function("chat_play")
 def chat_play(subject: str, memo: str, db, session_id: int):
     """Start a freeform conversation about a subject."""
-    from src.db import create_message
+    from src.db import Turn, TutorSession, save_turn
 
     try:
-        messages = [
-            {"role": "system", "content": PLAY_SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": f"I want to talk about: {subject}. Remember this note: {memo}. I may have something to talk about, but in case I don't, give me a couple of recommended topics.",
-            },
-        ]
-
-        response_text = chat_with_history(messages)
+        response_text = chat_with_history(_play_messages(subject, memo))
 
         # Store initial messages
-        create_message(
-            db,
-            session_id,
-            "user",
-            f"I want to talk about: {subject}. Remember this note: {memo}.",
+        turn = Turn(db.get(TutorSession, session_id))
+        turn.add_message("user", f"I want to talk about: {subject}. Remember this note: {memo}.")
+        turn.add_message("assistant", response_text)
+        save_turn(db, turn)
+
+        return None, response_text
+    except Exception as e:
+        return None, f"Error: {str(e)}"
+
+
+# Async variants of the chat_* API. These await the completion instead of blocking, so the
+# Telegram handlers can keep serving other users while one conversation waits on the model.
+
+
+@openai_function("chat_generate_question")
+async def generate_question_async(subject: str, memo: str) -> "QuestionGeneration":
+    """Generate a new question, raising on API or parsing errors so callers can decide whether to retry."""
+    from src.models import QuestionGeneration
+
+    response_text = await chat_with_history_async(
+        _question_messages(subject, memo), response_format={"type": "json_object"}
+    )
+    return QuestionGeneration.model_validate_json(response_text)
+
+
+@openai_function("chat_generate_question")
+async def chat_generate_question_async(subject: str, memo: str):
+    """Generate a new question without blocking the event loop."""
+    try:
+        question_data = await generate_question_async(subject, memo)
+        return None, question_data
+    except Exception as e:
+        return None, f"Error generating question: {str(e)}"
+
+
+@openai_function("chat_message")
+async def chat_message_async(session, user_response: str, db, on_text: OnText | None = None, cache: bool = False):
+    """Handle conversational messages using stored message history without blocking the event loop.
+
+    With ``cache``, a message sent before any conversation (such as /hint's) depends only on the question, so the
+    reply is shared through the response cache.
+    """
+    from src.async_db import Turn, get_session_messages, release_connection, save_turn
+
+    try:
+        stored_messages = await get_session_messages(db, session.id, after_id=session.summary_through_id)
+
+        await release_connection(db)
+        messages = _conversation_messages(session, stored_messages, user_response)
+        if cache and not stored_messages and not session.summary:
+            response_text = await _cached_reply_text_async(messages, on_text)
+        else:
+            response_text = await _reply_text_async(messages, on_text)
+
+        turn = Turn(session)
+        turn.add_message("user", user_response)
+        turn.add_message("assistant", response_text)
+        await save_turn(db, turn)
+
+        # Fold turns that left the recent window into the summary, off the reply path
+        schedule_summary(session.id)
+
+        return response_text
+    except Exception as e:
+        return f"Whoops! I had a problem: {str(e)}"
+
+
+@openai_function("chat_solution_attempt")
+async def chat_solution_attempt_async(
+    session, user_response: str, db, turn: "Turn | None" = None, combined: bool = False
+):
+    """Evaluate a solution attempt without blocking the event loop.
+
+    With ``combined``, the same call also writes the reply for the learner (``result["message"]``), so no
+    follow-up ``chat_judge_response_async`` is needed. When a ``Turn`` is passed, the messages are staged on
+    it for the caller to save along with the rest of the turn; otherwise they are saved right away.
+    """
+    from src.async_db import Turn, release_connection, save_turn
+
+    try:
+        await release_connection(db)
+        response_text = await chat_with_history_async(
+            _solution_attempt_messages(session, user_response, combined), response_format={"type": "json_object"}
         )
-        create_message(db, session_id, "assistant", response_text)
+
+        result = _solution_result(response_text, combined)
+
+        staged = turn or Turn(session)
+        staged.add_message("user", f"[SOLUTION ATTEMPT] {user_response}")
+        staged.add_message("assistant", f"[JUDGE FEEDBACK] {response_text}")
+        if combined:
+            # Stored like the reply chat_judge_response_async would have written
+            staged.add_message("assistant", result["message"])
+        if turn is None:
+            await save_turn(db, staged)
+
+        return result
+    except Exception as e:
+        return {"feedback": f"Whoops! The judge seems to be having an issue: {str(e)}"}
+
+
+@openai_function("chat_judge_response")
+async def chat_judge_response_async(session, db, on_text: OnText | None = None):
+    """Get a conversational summary of the judge's feedback without blocking the event loop."""
+    from src.async_db import create_message, get_session_messages, release_connection
+
+    try:
+        stored_messages = await get_session_messages(db, session.id, after_id=session.summary_through_id)
+
+        await release_connection(db)
+        response_text = await _reply_text_async(_judge_response_messages(session, stored_messages), on_text)
+
+        await create_message(db, session.id, "assistant", response_text)
+
+        return response_text
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+
+@openai_function("chat_giveup")
+async def chat_giveup_async(session, db, on_text: OnText | None = None, turn: "Turn | None" = None):
+    """Provide the complete solution when a student gives up, without blocking the event loop.
+
+    Like ``chat_solution_attempt_async``, a passed ``Turn`` is left for the caller to save.
+    """
+    from src.async_db import Turn, release_connection, save_turn
+
+    try:
+        await release_connection(db)
+        # The explanation only depends on the question, so sessions that got the same one share it
+        response_text = await _cached_reply_text_async(_giveup_messages(session), on_text)
+
+        staged = turn or Turn(session)
+        staged.add_message("user", "I give up.")
+        staged.add_message("assistant", response_text)
+        if turn is None:
+            await save_turn(db, staged)
+
+        return response_text
+    except Exception as e:
+        return f"Giving up did not complete successfully: {str(e)}"
+
+
+@openai_function("chat_play")
+async def chat_play_async(subject: str, memo: str, db, session_id: int, on_text: OnText | None = None):
+    """Start a freeform conversation about a subject without blocking the event loop."""
+    from src.async_db import Turn, TutorSession, release_connection, save_turn
+
+    try:
+        await release_connection(db)
+        response_text = await _reply_text_async(_play_messages(subject, memo), on_text)
+
+        # The handler just created the session in this database session, so this is an identity-map hit
+        turn = Turn(await db.get(TutorSession, session_id))
+        turn.add_message("user", f"I want to talk about: {subject}. Remember this note: {memo}.")
+        turn.add_message("assistant", response_text)
+        await save_turn(db, turn)
 
         return None, response_text
     except Exception as e:
         return None, f"Error: {str(e)}"
+
+
+# Sessions whose summary is being updated, and the tasks doing it (kept referenced until they finish)
+_summarizing: set[int] = set()
+_summary_tasks: set[asyncio.Task] = set()
+
+
+async def wait_for_summaries() -> None:
+    """Let in-flight summary updates finish, e.g. before closing the clients on shutdown."""
+    await asyncio.gather(*_summary_tasks, return_exceptions=True)
+
+
+def schedule_summary(session_id: int) -> None:
+    """Update a session's rolling summary in the background; a no-op while one is already running for it."""
+    if session_id in _summarizing:
+        return
+    _summarizing.add(session_id)
+    task = asyncio.create_task(update_session_summary_async(session_id))
+    _summary_tasks.add(task)
+    task.add_done_callback(_summary_tasks.discard)
+
+
+@openai_function("update_session_summary")
+async def update_session_summary_async(session_id: int) -> bool:
+    """Fold the messages that have left the recent window into the session summary. Returns True if it changed."""
+    from src.async_db import db_session, get_session_messages, release_connection, update_session
+    from src.db import TutorSession
+
+    try:
+        async with db_session() as db:
+            session = await db.get(TutorSession, session_id)
+            stored_messages = await get_session_messages(db, session_id, after_id=session.summary_through_id)
+            older = messages_to_summarize(stored_messages)
+            if not older:
+                return False
+
+            await release_connection(db)
+            summary = await chat_with_history_async(_summary_messages(session.summary, older))
+
+            await update_session(db, session_id, summary=summary, summary_through_id=older[-1].id)
+            return True
+    except Exception:
+        logger.exception(f"Failed to update the summary of session {session_id}")
+        return False
+    finally:
+        _summarizing.discard(session_id)
@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from datetime import timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.async_db import db_session
+from src.db import PooledQuestion, User, utcnow
+from src.metrics import (
+    QUESTION_POOL_EVICTED,
+    QUESTION_POOL_REFILL_FAILURES,
+    QUESTION_POOL_REFILLED,
+    QUESTION_POOL_REQUESTS,
+    HitStats,
+    openai_caller,
+)
+from src.openai_handler import generate_question_async
+
+logger = logging.getLogger(__name__)
+
+# How many ready questions to keep per user and subject, and how long one stays usable
+QUESTION_POOL_SIZE = int(os.getenv("QUESTION_POOL_SIZE", "2"))
+QUESTION_POOL_MAX_AGE_HOURS = float(os.getenv("QUESTION_POOL_MAX_AGE_HOURS", "168"))
+QUESTION_POOL_REFILL_CONCURRENCY = int(os.getenv("QUESTION_POOL_REFILL_CONCURRENCY", "4"))
+
+
+@dataclass
+class PoolStats(HitStats):
+    refilled: int = 0
+    refill_failures: int = 0
+    evicted: int = 0
+
+
+stats = PoolStats()
+
+# Users waiting for a refill with the (subject, memo) it is for, refills to queue once a user's pending one is done
+# (their subject or memo changed meanwhile), and the background workers generating for them
+_refill_queue: asyncio.Queue[tuple[int, str, str | None]] | None = None
+_pending_refills: dict[int, tuple[str, str | None]] = {}
+_next_refills: dict[int, tuple[str, str | None]] = {}
+_refill_workers: list[asyncio.Task] = []
+
+
+def memo_hash(memo: str | None) -> str:
+    return hashlib.sha256((memo or "").encode()).hexdigest()[:16]
+
+
+def _max_age_cutoff():
+    return utcnow() - timedelta(hours=QUESTION_POOL_MAX_AGE_HOURS)
+
+
+async def take_question(user: User) -> PooledQuestion | None:
+    """Pop a ready question for the user's current subject and memo, or None when the pool is empty.
+
+    The returned row has the same ``question``/``solving_process``/``expected_answer`` fields as
+    ``QuestionGeneration``, so callers can use either.
+    """
+    if QUESTION_POOL_SIZE <= 0:
+        return None
+
+    # Claim and remove the oldest matching entry in one statement; SKIP LOCKED lets concurrent takes pass each other
+    # noinspection PyTypeChecker
+    oldest = (
+        select(PooledQuestion.id)
+        .filter(
+            PooledQuestion.user_id == user.id,
+            PooledQuestion.subject == user.subject,
+            PooledQuestion.memo_hash == memo_hash(user.memo),
+            PooledQuestion.created_at >= _max_age_cutoff(),
+        )
+        .order_by(PooledQuestion.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    async with db_session() as db:
+        entry = await db.scalar(delete(PooledQuestion).filter(PooledQuestion.id == oldest).returning(PooledQuestion))
+        await db.commit()
+
+    if entry is None:
+        stats.misses += 1
+        QUESTION_POOL_REQUESTS.inc(outcome="miss")
+    else:
+        stats.hits += 1
+        QUESTION_POOL_REQUESTS.inc(outcome="hit")
+    return entry
+
+
+async def evict_user_pool(db: AsyncSession, user_id: int) -> None:
+    """Drop a user's pooled questions, e.g. after their subject or memo changed."""
+    if QUESTION_POOL_SIZE <= 0:
+        return
+    # noinspection PyTypeChecker
+    result = await db.execute(delete(PooledQuestion).filter(PooledQuestion.user_id == user_id))
+    await db.commit()
+    stats.evicted += result.rowcount
+    QUESTION_POOL_EVICTED.inc(result.rowcount)
+
+
+def schedule_refill(user: User) -> None:
+    """Queue a background top-up of the user's pool; a no-op if one for the same subject and memo is pending.
+
+    A refill pending for another subject or memo is followed by this one once it finishes.
+    """
+    global _refill_queue
+    if QUESTION_POOL_SIZE <= 0 or user.subject is None:
+        return
+
+    target = (user.subject, user.memo)
+    if user.id in _pending_refills:
+        if _pending_refills[user.id] == target:
+            _next_refills.pop(user.id, None)
+        else:
+            _next_refills[user.id] = target
+        return
+
+    if _refill_queue is None:
+        _refill_queue = asyncio.Queue()
+        _refill_workers.extend(asyncio.create_task(_refill_worker()) for _ in range(QUESTION_POOL_REFILL_CONCURRENCY))
+
+    _pending_refills[user.id] = target
+    _refill_queue.put_nowait((user.id, *target))
+
+
+async def _refill_worker() -> None:
+    while True:
+        user_id, subject, memo = await _refill_queue.get()
+        try:
+            await refill(user_id, subject, memo)
+        except Exception:
+            stats.refill_failures += 1
+            QUESTION_POOL_REFILL_FAILURES.inc()
+            logger.exception(f"Failed to refill the question pool for user {user_id}")
+        finally:
+            _pending_refills.pop(user_id, None)
+            if user_id in _next_refills:
+                _pending_refills[user_id] = _next_refills.pop(user_id)
+                _refill_queue.put_nowait((user_id, *_pending_refills[user_id]))
+            _refill_queue.task_done()
+
+
+async def refill(user_id: int, subject: str, memo: str | None) -> int:
+    """Generate questions until the user has QUESTION_POOL_SIZE ready ones; returns how many were added."""
+    key = memo_hash(memo)
+    async with db_session() as db:
+        # Anything for another subject/memo or past its age is stale
+        # noinspection PyTypeChecker
+        result = await db.execute(
+            delete(PooledQuestion).filter(
+                PooledQuestion.user_id == user_id,
+                (PooledQuestion.subject != subject)
+                | (PooledQuestion.memo_hash != key)
+                | (PooledQuestion.created_at < _max_age_cutoff()),
+            )
+        )
+        stats.evicted += result.rowcount
+        QUESTION_POOL_EVICTED.inc(result.rowcount)
+        # noinspection PyTypeChecker
+        ready = await db.scalar(select(func.count()).filter(PooledQuestion.user_id == user_id))
+        await db.commit()
+
+    missing = QUESTION_POOL_SIZE - ready
+    if missing <= 0:
+        return 0
+
+    with openai_caller(user_id=user_id):
+        questions = await asyncio.gather(*(generate_question_async(subject, memo) for _ in range(missing)))
+
+    async with db_session() as db:
+        # The user may have changed subject or memo (and had their pool evicted) while these were generated
+        user = await db.get(User, user_id)
+        if user is None or (user.subject, memo_hash(user.memo)) != (subject, key):
+            stats.evicted += len(questions)
+            QUESTION_POOL_EVICTED.inc(len(questions))
+            return 0
+
+        db.add_all(
+            PooledQuestion(
+                user_id=user_id,
+                subject=subject,
+                memo_hash=key,
+                question=q.question,
+                solving_process=q.solving_process,
+                expected_answer=q.expected_answer,
+            )
+            for q in questions
+        )
+        await db.commit()
+
+    stats.refilled += len(questions)
+    QUESTION_POOL_REFILLED.inc(len(questions))
+    return len(questions)
+
+
+async def wait_for_refills() -> None:
+    """Block until every queued refill has finished."""
+    if _refill_queue is not None:
+        await _refill_queue.join()
+
+
+async def stop_refills() -> None:
+    """Cancel the background refill workers, e.g. on application shutdown."""
+    global _refill_queue
+    for task in _refill_workers:
+        task.cancel()
+    await asyncio.gather(*_refill_workers, return_exceptions=True)
+    _refill_workers.clear()
+    _pending_refills.clear()
+    _next_refills.clear()
+    _refill_queue = None
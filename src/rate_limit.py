@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Coroutine
+from datetime import timedelta
+from typing import Any
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from src.metrics import RATE_LIMIT_HITS, RATE_LIMIT_QUEUE_DEPTH, RATE_LIMIT_WAIT
+
+logger = logging.getLogger(__name__)
+
+# Telegram's documented limits: about 30 messages per second overall, one per second in a chat (short bursts
+# are tolerated) and 20 per minute in a group
+TELEGRAM_GLOBAL_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_PER_SECOND", "30"))
+TELEGRAM_CHAT_PER_SECOND = float(os.getenv("TELEGRAM_CHAT_PER_SECOND", "1"))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_GROUP_PER_MINUTE = float(os.getenv("TELEGRAM_GROUP_PER_MINUTE", "20"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+# Per-chat buckets are dropped least-recently-used first beyond this many chats
+TELEGRAM_CHAT_BUCKETS = int(os.getenv("TELEGRAM_CHAT_BUCKETS", "10000"))
+
+
+class TokenBucket:
+    """An async token bucket: ``acquire`` waits, first come first served, until enough tokens have accrued.
+
+    ``rate`` is in tokens per second and ``capacity`` bounds the burst; a rate of 0 disables the limit. In any
+    one-second window at most ``capacity + rate`` tokens go out, so a capacity of 1 paces calls evenly.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        if self.rate <= 0:
+            return
+        # A request larger than the bucket waits for a full bucket and leaves it in debt, delaying the next ones
+        needed = min(amount, self.capacity)
+
+        RATE_LIMIT_QUEUE_DEPTH.inc(limiter=self.name)
+        started = time.perf_counter()
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = max(self.paused_until - now, (needed - self.tokens) / self.rate)
+                    if wait <= 0:
+                        self.tokens -= amount
+                        return
+                    await asyncio.sleep(wait)
+        finally:
+            RATE_LIMIT_QUEUE_DEPTH.dec(limiter=self.name)
+            RATE_LIMIT_WAIT.observe(time.perf_counter() - started, limiter=self.name)
+
+    def debit(self, amount: float) -> None:
+        """Correct an earlier ``acquire`` once the real cost is known; may go negative (or refund)."""
+        if self.rate > 0:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for ``seconds``, e.g. after the provider answered with Retry-After."""
+        RATE_LIMIT_HITS.inc(limiter=self.name)
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+
+def backoff_delay(base: float, attempt: int) -> float:
+    """Seconds to wait after the ``attempt``-th (1-based) failure: exponential from ``base``, jittered.
+
+    The jitter keeps failures from many workers from retrying in lockstep.
+    """
+    return base * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+
+class TelegramRateLimiter(BaseRateLimiter[int]):
+    """Keep Bot API calls under Telegram's global and per-chat limits, and wait out flood control.
+
+    Calls queue for a global bucket and, when they target a chat, for that chat's bucket. A ``RetryAfter``
+    pauses every call for the requested time before the call is retried (up to ``max_retries`` times,
+    or the ``rate_limit_args`` passed to the call). This is the only place flood-waits are retried; callers
+    treat a ``RetryAfter`` that gets past it as a failure.
+    """
+
+    def __init__(
+        self,
+        global_per_second: float = TELEGRAM_GLOBAL_PER_SECOND,
+        chat_per_second: float = TELEGRAM_CHAT_PER_SECOND,
+        chat_burst: int = TELEGRAM_CHAT_BURST,
+        group_per_minute: float = TELEGRAM_GROUP_PER_MINUTE,
+        max_retries: int = TELEGRAM_MAX_RETRIES,
+    ):
+        self.global_per_second = global_per_second
+        self.chat_per_second = chat_per_second
+        self.chat_burst = chat_burst
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self._global: TokenBucket | None = None
+        self._chats: OrderedDict[int | str, TokenBucket] = OrderedDict()
+
+    async def initialize(self) -> None:
+        # Created here, on the application's event loop; paced evenly, as Telegram counts over short windows
+        self._global = TokenBucket("telegram", self.global_per_second, 1)
+        self._chats.clear()
+
+    async def shutdown(self) -> None:
+        self._chats.clear()
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Negative ids (and @usernames) are groups and channels, which have the stricter per-minute limit
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = TokenBucket("telegram_group", self.group_per_minute / 60, 1)
+            else:
+                bucket = TokenBucket("telegram_chat", self.chat_per_second, self.chat_burst)
+            self._chats[chat_id] = bucket
+            while len(self._chats) > TELEGRAM_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+        self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, bool | dict[str, Any] | list[dict[str, Any]]]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: int | None,
+    ) -> bool | dict[str, Any] | list[dict[str, Any]]:
+        max_retries = rate_limit_args if rate_limit_args is not None else self.max_retries
+
+        chat_id = data.get("chat_id")
+        if isinstance(chat_id, str) and chat_id.lstrip("-").isdigit():
+            chat_id = int(chat_id)
+        chat_bucket = self._chat_bucket(chat_id) if chat_id is not None else None
+
+        for attempt in range(max_retries + 1):
+            if chat_bucket is not None:
+                await chat_bucket.acquire()
+            await self._global.acquire()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == max_retries:
+                    raise
+                delay = retry_after_seconds(e)
+                logger.info(f"Telegram flood control on {endpoint}; pausing all requests for {delay:.1f}s")
+                self._global.pause(delay)
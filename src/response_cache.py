@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+import os
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import timedelta
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from src.async_db import db_session
+from src.db import CachedResponse, utcnow
+from src.locks import KeyedLocks
+from src.metrics import RESPONSE_CACHE_REQUESTS, HitStats, current_openai_function
+
+logger = logging.getLogger(__name__)
+
+# Replies to prompts built only from the question (/giveup, a /hint before any conversation) are stored in the
+# database, so every replica and every session that gets the same question shares them (0 entries disables)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+RESPONSE_CACHE_TTL_HOURS = float(os.getenv("RESPONSE_CACHE_TTL_HOURS", "168"))
+# Expired and least recently used entries are pruned after every this many writes (0 or 1 prunes after each one)
+RESPONSE_CACHE_PRUNE_EVERY = max(1, int(os.getenv("RESPONSE_CACHE_PRUNE_EVERY", "100")))
+# Hits are served by a plain read; an entry's last_used_at (its LRU recency) and hit count are only written back
+# once it is this many seconds stale, so a hot entry costs one write per interval instead of one per hit
+RESPONSE_CACHE_TOUCH_SECONDS = float(os.getenv("RESPONSE_CACHE_TOUCH_SECONDS", "60"))
+
+
+@dataclass
+class ResponseCacheStats(HitStats):
+    stored: int = 0
+    evicted: int = 0
+    errors: int = 0
+
+
+stats = ResponseCacheStats()
+
+# Identical misses run one at a time, so the later ones find the first one's reply in the cache
+_locks = KeyedLocks()
+_writes = 0
+# Hits per key not yet added to its row's hit count
+_pending_hits: dict[str, int] = {}
+
+
+def _normalize(content: str) -> str:
+    return " ".join(content.split())
+
+
+def cache_key(messages: list[dict], model: str) -> str:
+    """Hash the model and the prompt, ignoring differences in whitespace."""
+    prompt = [[message["role"], _normalize(message["content"])] for message in messages]
+    return hashlib.sha256(json.dumps([model, prompt], ensure_ascii=False).encode()).hexdigest()
+
+
+async def lookup(key: str) -> str | None:
+    """Return the live cached reply for ``key``, counting the hit, or None."""
+    now = utcnow()
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        row = (
+            await db.execute(
+                select(CachedResponse.response, CachedResponse.last_used_at).filter(
+                    CachedResponse.key == key, CachedResponse.expires_at > now
+                )
+            )
+        ).first()
+        if row is None:
+            return None
+
+        hits = _pending_hits.pop(key, 0) + 1
+        if row.last_used_at is None or now - row.last_used_at >= timedelta(seconds=RESPONSE_CACHE_TOUCH_SECONDS):
+            # noinspection PyTypeChecker
+            await db.execute(
+                update(CachedResponse)
+                .filter(CachedResponse.key == key)
+                .values(hits=CachedResponse.hits + hits, last_used_at=now)
+            )
+            await db.commit()
+        else:
+            _pending_hits[key] = hits
+    return row.response
+
+
+async def store(key: str, function: str, response: str) -> None:
+    """Cache ``response`` for ``key``, replacing an expired entry."""
+    global _writes
+    now = utcnow()
+    entry = CachedResponse(
+        key=key,
+        function=function,
+        response=response,
+        hits=0,
+        last_used_at=now,
+        expires_at=now + timedelta(hours=RESPONSE_CACHE_TTL_HOURS),
+    )
+    async with db_session() as db:
+        try:
+            await db.merge(entry)
+            await db.commit()
+        except IntegrityError:
+            # Another replica stored the same reply first
+            await db.rollback()
+            return
+
+    _pending_hits.pop(key, None)
+    stats.stored += 1
+    _writes += 1
+    if _writes % RESPONSE_CACHE_PRUNE_EVERY == 0:
+        await prune()
+
+
+async def prune() -> int:
+    """Drop expired entries and the least recently used ones beyond the size bound; returns how many."""
+    async with db_session() as db:
+        # noinspection PyTypeChecker
+        expired = await db.scalars(
+            delete(CachedResponse).filter(CachedResponse.expires_at <= utcnow()).returning(CachedResponse.key)
+        )
+        evicted_keys = list(expired)
+        # noinspection PyTypeChecker
+        overflow = await db.scalars(
+            delete(CachedResponse)
+            .filter(
+                CachedResponse.key.in_(
+                    select(CachedResponse.key)
+                    .order_by(CachedResponse.last_used_at.desc())
+                    .offset(RESPONSE_CACHE_MAX_ENTRIES)
+                )
+            )
+            .returning(CachedResponse.key)
+        )
+        evicted_keys += overflow
+        await db.commit()
+
+    for key in evicted_keys:
+        _pending_hits.pop(key, None)
+    stats.evicted += len(evicted_keys)
+    return len(evicted_keys)
+
+
+async def _lookup_or_none(key: str) -> str | None:
+    try:
+        return await lookup(key)
+    except Exception:
+        stats.errors += 1
+        logger.exception("Response cache lookup failed")
+        return None
+
+
+async def cached_reply(messages: list[dict], model: str, produce: Callable[[], Awaitable[str]]) -> str:
+    """Serve the reply to ``messages`` from the cache, or get it from ``produce`` and cache it.
+
+    Identical requests arriving together wait for the first one's reply instead of each paying for a completion.
+    A cache that cannot be reached is treated as a miss, so a database problem never costs the learner a reply.
+    """
+    if RESPONSE_CACHE_MAX_ENTRIES <= 0:
+        return await produce()
+
+    function = current_openai_function()
+    key = cache_key(messages, model)
+
+    # Hits are read without the lock, so learners on a hot entry never queue behind each other; a miss takes
+    # the lock and looks again, in case an identical request stored the reply while it waited
+    response = await _lookup_or_none(key)
+    if response is None:
+        async with _locks.hold(key):
+            response = await _lookup_or_none(key)
+            if response is None:
+                stats.misses += 1
+                RESPONSE_CACHE_REQUESTS.inc(function=function, outcome="miss")
+                response = await produce()
+                try:
+                    await store(key, function, response)
+                except Exception:
+                    stats.errors += 1
+                    logger.exception("Response cache write failed")
+                return response
+
+    stats.hits += 1
+    RESPONSE_CACHE_REQUESTS.inc(function=function, outcome="hit")
+    return response
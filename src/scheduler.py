@@ -1,19 +1,131 @@
 import asyncio
+import functools
+import logging
+import os
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+from typing import TypeVar
 
+import pytz
+from telegram.error import BadRequest, NetworkError
 from telegram.ext import ExtBot as Bot
 
-from src.db import User, create_tutor_session, get_all_users_with_subject
-from src.openai_handler import chat_generate_question
+from src.async_db import (
+    create_tutor_session,
+    db_session,
+    get_all_users_with_subject,
+    get_unscheduled_users,
+    get_user,
+    get_users_due,
+    invalidate_old_sessions,
+)
+from src.db import Job, TutorSession, User, utcnow
+from src.jobs import enqueue, job_handler, notify_workers, update_payload
+from src.metrics import FANOUT_DURATION, FANOUT_PENDING, FANOUT_USERS, openai_caller
+from src.openai_handler import generate_question_async
+from src.question_pool import schedule_refill, take_question
+from src.rate_limit import backoff_delay
 from src.strings import QUESTION_READY_MESSAGE
 
+logger = logging.getLogger(__name__)
 
-async def generate_daily_question_for_user(db, bot: Bot, user: User) -> None:
+# Fan-out tuning for the daily delivery run in place by /daily_question; scheduled deliveries go through the job
+# queue (src.jobs), which has its own concurrency and retry settings
+DAILY_QUESTION_CONCURRENCY = int(os.getenv("DAILY_QUESTION_CONCURRENCY", "20"))
+DAILY_QUESTION_MAX_ATTEMPTS = int(os.getenv("DAILY_QUESTION_MAX_ATTEMPTS", "3"))
+DAILY_QUESTION_RETRY_DELAY = float(os.getenv("DAILY_QUESTION_RETRY_DELAY", "2"))
+DAILY_QUESTION_PROGRESS_INTERVAL = float(os.getenv("DAILY_QUESTION_PROGRESS_INTERVAL", "30"))
+
+# Per-user delivery schedule. "rolling" ticks every SCHEDULER_TICK_SECONDS and queues deliveries to users whose
+# next_problem is due; "cron" keeps the single daily run for everyone at DAILY_QUESTION_HOUR.
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "rolling")
+SCHEDULER_TICK_SECONDS = int(os.getenv("SCHEDULER_TICK_SECONDS", "60"))
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "50"))
+DAILY_QUESTION_HOUR = int(os.getenv("DAILY_QUESTION_HOUR", "15"))
+DAILY_QUESTION_SPREAD_MINUTES = int(os.getenv("DAILY_QUESTION_SPREAD_MINUTES", "60"))
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "US/Eastern")
+
+
+@functools.cache
+def retryable_openai_errors() -> tuple[type[Exception], ...]:
+    """Errors worth another attempt; anything else (bad request, blocked bot, revoked key) fails the user at once."""
+    # Imported on first use; by then generating a question has loaded both anyway
+    import openai
+    from pydantic import ValidationError
+
+    return openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError, ValidationError
+
+
+T = TypeVar("T")
+
+
+@dataclass
+class FanoutSummary:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    skipped: int = 0
+    duration: float = 0.0
+    failed_user_ids: list[int] = field(default_factory=list)
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed + self.skipped
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, retryable_openai_errors()):
+        return True
+    # BadRequest is a NetworkError subclass in python-telegram-bot, but retrying it never helps
+    return isinstance(error, NetworkError) and not isinstance(error, BadRequest)
+
+
+async def with_retries(operation: Callable[[], Awaitable[T]], attempts: int = DAILY_QUESTION_MAX_ATTEMPTS) -> T:
+    """Run an OpenAI or Telegram call, retrying transient failures with backoff.
+
+    Telegram flood-waits (RetryAfter) are not retried here: the bot's TelegramRateLimiter already waits them out
+    and retries the call, so one that still fails has used up its retries.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return await operation()
+        except (*retryable_openai_errors(), NetworkError) as e:
+            if attempt == attempts or not _is_retryable(e):
+                raise
+            delay = backoff_delay(DAILY_QUESTION_RETRY_DELAY, attempt)
+            logger.info(f"Retrying after {type(e).__name__} (attempt {attempt}/{attempts}) in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def _send_question(bot: Bot, user: User, question: str) -> None:
+    # Retried on its own so a Telegram hiccup does not generate (and store) a second question
+    await with_retries(
+        lambda: bot.send_message(user.id, QUESTION_READY_MESSAGE.format(subject=user.subject, question=question))
+    )
+
+
+async def generate_daily_question_for_user(bot: Bot, user: User, job: Job | None = None) -> bool:
+    """Generate, store and send one user's daily question. Returns False when the user was skipped.
+
+    When run for a delivery ``job``, the new session's id is added to the job's payload along with the session,
+    so a retry can send that question again instead of making another.
+    """
     if user.subject is None:
-        return
+        return False
+
+    # A pooled question makes the delivery a DB read; generate on the spot only when the pool is empty
+    with openai_caller(user_id=user.id):
+        question_data = await take_question(user) or await with_retries(
+            lambda: generate_question_async(user.subject, user.memo)
+        )
 
-    _, question_data = chat_generate_question(user.subject, user.memo)
-    if not isinstance(question_data, str):
-        create_tutor_session(
+    # Each user gets their own session; an AsyncSession cannot be shared between concurrent tasks
+    async with db_session() as db:
+        # The new question replaces whatever the user was working on, as with /question
+        await invalidate_old_sessions(db, user.id)
+        session = await create_tutor_session(
             db=db,
             user_id=user.id,
             subject=user.subject,
@@ -22,14 +134,177 @@ async def generate_daily_question_for_user(db, bot: Bot, user: User) -> None:
             solving_process=question_data.solving_process,
             expected_answer=question_data.expected_answer,
             thread_id=None,
+            commit=False,
         )
+        if job is not None:
+            await update_payload(db, job, session_id=session.id)
+        await db.commit()
+
+    await _send_question(bot, user, question_data.question)
+
+    schedule_refill(user)
+    return True
+
 
-        await bot.send_message(
-            user.id, QUESTION_READY_MESSAGE.format(subject=user.subject, question=question_data.question)
+async def _report_progress(summary: FanoutSummary, started: float) -> None:
+    while True:
+        await asyncio.sleep(DAILY_QUESTION_PROGRESS_INTERVAL)
+        logger.info(
+            f"Daily questions: {summary.processed}/{summary.total} processed "
+            f"({summary.sent} sent, {summary.failed} failed) after {time.monotonic() - started:.0f}s"
         )
 
 
-async def generate_daily_questions(db, bot: Bot):
-    users = get_all_users_with_subject(db)
-    tasks = [asyncio.create_task(generate_daily_question_for_user(db, bot, user)) for user in users]
-    await asyncio.gather(*tasks)
+async def generate_daily_questions(
+    bot: Bot, users: Iterable[User] | None = None, concurrency: int = DAILY_QUESTION_CONCURRENCY
+) -> FanoutSummary:
+    """Deliver a daily question to every user with a subject (or to the given users) using a bounded worker pool."""
+    started = time.monotonic()
+
+    if users is None:
+        async with db_session() as db:
+            users = await get_all_users_with_subject(db)
+    users = list(users)
+
+    summary = FanoutSummary(total=len(users))
+    queue: asyncio.Queue[User] = asyncio.Queue()
+    for user in users:
+        queue.put_nowait(user)
+
+    async def worker() -> None:
+        while not queue.empty():
+            user = queue.get_nowait()
+            try:
+                if await generate_daily_question_for_user(bot, user):
+                    summary.sent += 1
+                    FANOUT_USERS.inc(outcome="sent")
+                else:
+                    summary.skipped += 1
+                    FANOUT_USERS.inc(outcome="skipped")
+            except Exception:
+                # One user's failure must not stop everyone else's delivery
+                logger.exception(f"Failed to deliver the daily question to user {user.id}")
+                summary.failed += 1
+                summary.failed_user_ids.append(user.id)
+                FANOUT_USERS.inc(outcome="failed")
+            finally:
+                FANOUT_PENDING.dec()
+
+    FANOUT_PENDING.inc(len(users))
+    progress = asyncio.create_task(_report_progress(summary, started))
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(users))))))
+    finally:
+        progress.cancel()
+        # Users left in the queue (the fan-out was cancelled) are no longer pending
+        FANOUT_PENDING.dec(queue.qsize())
+
+    summary.duration = time.monotonic() - started
+    FANOUT_DURATION.observe(summary.duration)
+    logger.info(
+        f"Daily questions finished in {summary.duration:.1f}s: {summary.sent} sent, "
+        f"{summary.failed} failed, {summary.skipped} skipped out of {summary.total}"
+    )
+    return summary
+
+
+def next_delivery_time(user: User, after: datetime) -> datetime:
+    """The first delivery slot for a user strictly after ``after`` (naive UTC in, naive UTC out).
+
+    Slots are DAILY_QUESTION_HOUR in the user's time zone, offset by a stable per-user number of
+    minutes so users in the same zone do not all come due in the same tick.
+    """
+    tz = pytz.timezone(user.timezone or DEFAULT_TIMEZONE)
+    offset = timedelta(minutes=user.id % DAILY_QUESTION_SPREAD_MINUTES if DAILY_QUESTION_SPREAD_MINUTES else 0)
+    after_utc = after.replace(tzinfo=UTC)
+
+    local_day = after_utc.astimezone(tz).date()
+    for days in range(3):
+        day = local_day + timedelta(days=days)
+        slot = tz.localize(datetime(day.year, day.month, day.day, DAILY_QUESTION_HOUR)) + offset
+        if slot > after_utc:
+            return slot.astimezone(UTC).replace(tzinfo=None)
+    raise AssertionError("unreachable: a daily slot always exists within three days")
+
+
+async def schedule_unscheduled_users(now: datetime) -> int:
+    """Give users with a subject but no next_problem (new users, or users from before scheduling) a slot."""
+    scheduled = 0
+    while True:
+        async with db_session() as db:
+            users = await get_unscheduled_users(db, SCHEDULER_BATCH_SIZE)
+            for user in users:
+                user.next_problem = next_delivery_time(user, now)
+            await db.commit()
+        scheduled += len(users)
+        if len(users) < SCHEDULER_BATCH_SIZE:
+            return scheduled
+
+
+def daily_question_key(user: User, at: datetime) -> str:
+    """Idempotency key of a user's delivery job for the local day of ``at`` (naive UTC): one delivery per day."""
+    tz = pytz.timezone(user.timezone or DEFAULT_TIMEZONE)
+    return f"daily_question:{user.id}:{at.replace(tzinfo=UTC).astimezone(tz).date().isoformat()}"
+
+
+# with_retries already retried these in place; a later attempt of the job is worth it for the same errors
+@job_handler("daily_question", retryable=_is_retryable)
+async def deliver_daily_question(bot: Bot, job: Job) -> None:
+    """Job: deliver one user's daily question, or resend the one an earlier attempt stored but failed to send."""
+    async with db_session() as db:
+        user = await get_user(db, job.payload["user_id"])
+        session_id = job.payload.get("session_id")
+        session = await db.get(TutorSession, session_id) if session_id is not None else None
+    try:
+        if session is not None:
+            # Skipped when the user has moved on to another question since
+            sent = user is not None and not session.archived
+            if sent:
+                await _send_question(bot, user, session.question)
+        else:
+            sent = user is not None and await generate_daily_question_for_user(bot, user, job)
+    except Exception:
+        FANOUT_USERS.inc(outcome="failed")
+        raise
+    FANOUT_USERS.inc(outcome="sent" if sent else "skipped")
+
+
+async def enqueue_daily_questions(users: Iterable[User] | None = None) -> int:
+    """Queue today's delivery to every user with a subject (or to the given users); returns how many were new."""
+    now = utcnow()
+    async with db_session() as db:
+        if users is None:
+            users = await get_all_users_with_subject(db)
+        jobs = [(daily_question_key(user, now), {"user_id": user.id}) for user in users]
+        queued = await enqueue(db, "daily_question", jobs)
+        await db.commit()
+    notify_workers()
+    logger.info(f"Queued {queued} daily questions")
+    return queued
+
+
+async def enqueue_due_questions() -> int:
+    """Scheduler tick: queue a delivery job for every user whose next_problem is due, one small batch at a time.
+
+    The jobs are added in the transaction that advances next_problem, so a crash loses neither and no slot is
+    queued twice. Returns how many jobs were queued.
+    """
+    now = utcnow()
+    await schedule_unscheduled_users(now)
+
+    queued = 0
+    while True:
+        async with db_session() as db:
+            users = await get_users_due(db, now, SCHEDULER_BATCH_SIZE)
+            # Keyed by the day of the slot that came due, not of the tick, so a late tick cannot skip or repeat a day
+            jobs = [(daily_question_key(user, user.next_problem), {"user_id": user.id}) for user in users]
+            for user in users:
+                user.next_problem = next_delivery_time(user, now)
+            queued += await enqueue(db, "daily_question", jobs)
+            await db.commit()
+        notify_workers()
+
+        if len(users) < SCHEDULER_BATCH_SIZE:
+            break
+
+    return queued
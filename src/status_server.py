@@ -1,20 +1,38 @@
 import logging
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.health import health_body, liveness, readiness_from_thread
+from src.metrics import CONTENT_TYPE, registry
 
 status_server_port = 8080
 
 
 class StatusPageHandler(BaseHTTPRequestHandler):
     def do_GET(self):
-        self.send_response(200)
-        self.send_header("Content-type", "text/plain")
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            status, body, content_type = 200, registry.render().encode(), CONTENT_TYPE
+        elif path in ("/healthz", "/readyz"):
+            ok, checks = liveness() if path == "/healthz" else readiness_from_thread()
+            status, body, content_type = 200 if ok else 503, health_body(ok, checks), "application/json"
+        else:
+            status, body, content_type = 200, b"OK", "text/plain"
+
+        self.send_response(status)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        self.wfile.write(b"OK")
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Probes and scrapes arrive every few seconds; keep them out of the default stderr access log
+        logging.debug(f"Status server: {format % args}")
 
 
 def run_status_server():
     server_address = ("0.0.0.0", status_server_port)
     logging.info(f"Status server running on port {status_server_port}")
+    # One thread per request, so a slow readiness probe cannot hold up liveness checks or scrapes
     # noinspection PyTypeChecker
-    httpd = HTTPServer(server_address, StatusPageHandler)
+    httpd = ThreadingHTTPServer(server_address, StatusPageHandler)
     httpd.serve_forever()
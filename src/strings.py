@@ -24,6 +24,8 @@ BOT_MENU_SOLVE_DESCRIPTION = (
 
 BOT_MENU_GIVE_UP_DESCRIPTION = "Give up and submit your solution to the latest question. I'll evaluate it and provide feedback to help you improve."
 
+BOT_MENU_TIMEZONE_DESCRIPTION = "Set your time zone so your daily question arrives at a sensible local time."
+
 BOT_MENU_PLAY_DESCRIPTION = "Chat with me about anything regarding your subject! No question needed."
 
 START_MESSAGE = (
@@ -60,6 +62,19 @@ PROMPT_SET_SUBJECT_MESSAGE = (
     "Please set your subject using /subject before we can generate a question."
 )
 
+TIMEZONE_SET_MESSAGE = (
+    "Got it! Your time zone is now {timezone}. Your next daily question will arrive around {delivery_time}."
+)
+
+CURRENT_TIMEZONE_MESSAGE = (
+    "Your time zone is {timezone}, so your daily question arrives around {delivery_time}. "
+    "To change it, use /timezone followed by a time zone name, like /timezone Europe/Berlin."
+)
+
+INVALID_TIMEZONE_MESSAGE = (
+    'I don\'t recognize the time zone "{timezone}". Please use a name like America/New_York or Europe/Berlin.'
+)
+
 GENERATING_QUESTION_MESSAGE = "Hang tight! I'm crafting a question just for you. This will only take a moment..."
 
 QUESTION_GENERATION_FAILED_MESSAGE = "Oops, something went wrong while generating your question. Please try again later while our technicians look into the issue."
@@ -85,4 +100,31 @@ NO_QUESTION_TO_SOLVE_MESSAGE = (
 
 TUTOR_ERROR_MESSAGE = "Oops, something went wrong on my end. I'm sorry about that! Please try again in a little bit, and I'll be here to help."
 
-ADMIN_DELIVERED_DAILY_QUESTION = "🎉 Delivered the daily question!"
+ADMIN_DAILY_QUESTION_SUMMARY = (
+    "🎉 Daily questions done in {duration:.1f}s: {sent} sent, {failed} failed, {skipped} skipped out of {total}."
+)
+
+ADMIN_QUESTION_POOL_STATS = (
+    "📦 Question pool: {hits} hits, {misses} misses ({hit_rate:.0%} hit rate), "
+    "{refilled} generated, {refill_failures} failed refills, {evicted} evicted."
+)
+
+ADMIN_RESPONSE_CACHE_STATS = (
+    "🗃️ Response cache: {hits} hits, {misses} misses ({hit_rate:.0%} hit rate), "
+    "{stored} stored, {evicted} evicted, {errors} errors."
+)
+
+ADMIN_LLM_USAGE_SUMMARY = "💸 OpenAI usage in the last {hours:g}h: {calls} requests, {tokens} tokens, ${cost:.2f}."
+
+ADMIN_LLM_USAGE_FUNCTION = (
+    "{function}: {calls} requests ({errors} failed), {prompt_tokens} + {completion_tokens} tokens, ${cost:.3f}; "
+    "{queue_wait:.2f}s queued, {latency:.1f}s average, {max_latency:.1f}s max."
+)
+
+ADMIN_JOB_STATS = (
+    "📋 Jobs in this process: {claimed} claimed, {done} done, {retried} retried, {dead} dead, {released} released."
+)
+
+ADMIN_JOB_COUNTS = "{kind}: {counts}"
+
+ADMIN_JOBS_REQUEUED = "🔁 Requeued {count} dead jobs."
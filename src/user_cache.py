@@ -0,0 +1,74 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import inspect
+
+from src.db import User
+from src.metrics import USER_CACHE_REMOVALS, USER_CACHE_REQUESTS, HitStats
+
+# Profiles change rarely (/subject, /memo, /timezone, play mode) and every change goes through the helpers
+# that update this process's cache; the TTL bounds staleness for edits made elsewhere. In webhook mode the next
+# update may reach another replica whose copy predates a /subject, so entries only outlive a burst of updates there.
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "2" if os.getenv("BOT_MODE") == "webhook" else "300"))
+
+
+@dataclass
+class CacheStats(HitStats):
+    invalidations: int = 0
+    evictions: int = 0
+
+
+class UserCache:
+    """A bounded LRU of user rows that expire after ``ttl`` seconds.
+
+    Rows are stored as plain column values and handed out as new, session-less ``User`` objects,
+    so concurrent handlers never share (or accidentally flush) the same instance.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+
+    def get(self, user_id: int) -> User | None:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.stats.misses += 1
+            USER_CACHE_REQUESTS.inc(outcome="miss")
+            return None
+
+        self._entries.move_to_end(user_id)
+        self.stats.hits += 1
+        USER_CACHE_REQUESTS.inc(outcome="hit")
+        return User(**entry[1])
+
+    def put(self, user: User) -> None:
+        if self.max_size <= 0:
+            return
+
+        loaded = inspect(user).dict
+        values = {column.key: loaded[column.key] for column in User.__table__.columns if column.key in loaded}
+        self._entries[user.id] = (time.monotonic() + self.ttl, values)
+        self._entries.move_to_end(user.id)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+            USER_CACHE_REMOVALS.inc(reason="evicted")
+
+    def invalidate(self, user_id: int) -> None:
+        if self._entries.pop(user_id, None) is not None:
+            self.stats.invalidations += 1
+            USER_CACHE_REMOVALS.inc(reason="invalidated")
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+user_cache = UserCache()
@@ -0,0 +1,140 @@
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+
+from telegram import Update
+from telegram.ext import Application, CallbackContext
+
+from src.locks import KeyedLocks
+from src.metrics import COALESCED_MESSAGES, USER_QUEUE_WAIT
+
+# Updates from one chat are handled one at a time, in the order they arrived; different chats still run in parallel.
+# Text messages sent within COALESCE_WINDOW seconds of each other are answered together with one model call,
+# waiting at most COALESCE_MAX_WAIT seconds after the first of them (0 turns coalescing off).
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "0.5"))
+COALESCE_MAX_WAIT = float(os.getenv("COALESCE_MAX_WAIT", "3"))
+
+Callback = Callable[[Update, CallbackContext], Awaitable[None]]
+
+# The merged text of the coalesced messages the current update answers for
+_coalesced_text: contextvars.ContextVar[str | None] = contextvars.ContextVar("coalesced_text", default=None)
+
+
+def message_text(update: Update) -> str:
+    """The text a message handler should answer: every coalesced message, or just this update's."""
+    return _coalesced_text.get() or update.message.text
+
+
+@dataclass
+class _Batch:
+    texts: list[str]
+    first: float = field(default_factory=time.monotonic)
+    last: float = field(default_factory=time.monotonic)
+
+
+class UserQueue:
+    """Per-chat FIFO locks, plus an open batch of text messages per chat that later messages can join."""
+
+    def __init__(self, window: float = COALESCE_WINDOW, max_wait: float = COALESCE_MAX_WAIT):
+        self.window = window
+        self.max_wait = max_wait
+        self._locks = KeyedLocks()
+        self._batches: dict[int, _Batch] = {}
+
+    async def _run_locked(self, chat_id: int, callback: Callback, update: Update, context: CallbackContext) -> None:
+        queued = time.perf_counter()
+        # Waiters are woken in FIFO order, so updates keep the order their tasks were created in
+        async with self._locks.hold(chat_id):
+            USER_QUEUE_WAIT.observe(time.perf_counter() - queued)
+            return await callback(update, context)
+
+    def serialize(self, callback: Callback) -> Callback:
+        """Run ``callback`` after every earlier update from the same chat has been handled."""
+
+        @functools.wraps(callback)
+        async def wrapper(update: Update, context: CallbackContext) -> None:
+            chat_id = _chat_id(update)
+            if chat_id is None:
+                return await callback(update, context)
+
+            # Anything that is not a coalesced text closes the open batch, so later texts are not answered before it
+            self._batches.pop(chat_id, None)
+            return await self._run_locked(chat_id, callback, update, context)
+
+        return wrapper
+
+    def coalesce(self, callback: Callback) -> Callback:
+        """Like ``serialize``, but texts arriving while an earlier one is queued or within the window join it.
+
+        The first update of a batch runs ``callback`` once for all of them (read the text with ``message_text``);
+        the updates that joined it return without doing anything.
+        """
+        if self.window <= 0:
+            return self.serialize(callback)
+
+        @functools.wraps(callback)
+        async def wrapper(update: Update, context: CallbackContext) -> None:
+            chat_id = _chat_id(update)
+            if chat_id is None:
+                return await callback(update, context)
+
+            batch = self._batches.get(chat_id)
+            if batch is not None:
+                batch.texts.append(update.message.text)
+                batch.last = time.monotonic()
+                COALESCED_MESSAGES.inc()
+                return
+
+            batch = self._batches[chat_id] = _Batch([update.message.text])
+            return await self._run_locked(
+                chat_id, functools.partial(self._answer_batch, chat_id, batch, callback), update, context
+            )
+
+        return wrapper
+
+    async def _answer_batch(
+        self, chat_id: int, batch: _Batch, callback: Callback, update: Update, context: CallbackContext
+    ) -> None:
+        # Holding the chat's lock (so the batch keeps its place in line), wait for the user to stop typing;
+        # once another update has closed the batch, nothing more can join it
+        while self._batches.get(chat_id) is batch:
+            deadline = min(batch.last + self.window, batch.first + self.max_wait)
+            if deadline <= time.monotonic():
+                del self._batches[chat_id]
+                break
+            await asyncio.sleep(deadline - time.monotonic())
+
+        token = _coalesced_text.set("\n".join(batch.texts))
+        try:
+            return await callback(update, context)
+        finally:
+            _coalesced_text.reset(token)
+
+
+def _chat_id(update: Update) -> int | None:
+    message = getattr(update, "effective_message", None)
+    return message.chat_id if message is not None else None
+
+
+user_queue = UserQueue()
+
+
+def serialize_handlers(
+    application: Application, coalesce: Iterable[Callback] = (), exempt: Iterable[Callback] = ()
+) -> None:
+    """Queue every registered handler per chat; the callbacks in ``coalesce`` also merge rapid messages.
+
+    The callbacks in ``exempt`` run as soon as their update arrives and hold no chat's queue, e.g. long admin
+    commands that would otherwise stall everything else from the admin's chat.
+    """
+    coalesce, exempt = set(coalesce), set(exempt)
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if handler.callback in exempt:
+                continue
+            wrap = user_queue.coalesce if handler.callback in coalesce else user_queue.serialize
+            handler.callback = wrap(handler.callback)
@@ -1,11 +1,23 @@
+import functools
 import logging
+import os
+import time
+from collections.abc import Awaitable, Callable
 
-from sqlalchemy.orm import Session
-from telegram import Update
-from telegram.constants import ChatAction
-from telegram.ext import CallbackContext
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import Message, Update
+from telegram.constants import ChatAction, MessageLimit
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from telegram.ext import Application, CallbackContext, CommandHandler
 
-from src.db import get_db
+from src.async_db import db_session
+from src.metrics import HANDLER_DURATION, HANDLER_REQUESTS, UPDATES_IN_FLIGHT, openai_caller
+from src.rate_limit import retry_after_seconds
+
+# Minimum seconds between edits of a streaming reply; Telegram throttles bots that edit the same message faster
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+logger = logging.getLogger(__name__)
 
 
 def error_handler(update, context):
@@ -13,13 +25,124 @@ def error_handler(update, context):
 
 
 # Dependency for the database session
-def get_db_context() -> Session:
-    # We may choose to use the CallbackContext to get the database session
-    # For now, though, we expect only one database
-    return next(get_db())
+def with_db(
+    handler: Callable[[Update, CallbackContext, AsyncSession], Awaitable[None]],
+) -> Callable[[Update, CallbackContext], Awaitable[None]]:
+    """Give a handler its own database session for the duration of one update, closed when it returns."""
+
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: CallbackContext) -> None:
+        async with db_session() as db:
+            return await handler(update, context, db)
+
+    return wrapper
+
+
+def track_handler(name: str, callback: Callable[[Update, CallbackContext], Awaitable[None]]):
+    """Count, time and track in flight every update ``callback`` handles, under ``name``.
+
+    OpenAI requests made while handling the update are attributed to the user who sent it.
+    """
+
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: CallbackContext) -> None:
+        UPDATES_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            with openai_caller(user_id=update.effective_user.id if update.effective_user else None):
+                return await callback(update, context)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - started, handler=name)
+            HANDLER_REQUESTS.inc(handler=name, outcome=outcome)
+            UPDATES_IN_FLIGHT.dec()
+
+    return wrapper
+
+
+def instrument_handlers(application: Application) -> None:
+    """Wrap every registered handler with ``track_handler``, labelled with its command or callback name."""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            name = sorted(handler.commands)[0] if isinstance(handler, CommandHandler) else handler.callback.__name__
+            handler.callback = track_handler(name, handler.callback)
 
 
 #
 async def send_typing(update: Update, context: CallbackContext) -> None:
     # Send that the bot is typing so the user knows to wait
     await context.bot.send_chat_action(chat_id=update.effective_message.chat_id, action=ChatAction.TYPING)
+
+
+class StreamingReply:
+    """Show a reply while it is being generated by sending it early and editing it as more text arrives.
+
+    Pass ``update`` as the ``on_text`` callback of the ``chat_*_async`` functions, then call ``finish``
+    with the final text. Without any streamed text, ``finish`` simply sends the reply.
+    """
+
+    def __init__(self, message: Message, parse_mode: str | None = None):
+        self.message = message
+        self.parse_mode = parse_mode
+        self.sent: Message | None = None
+        self.shown = ""
+        self.next_edit = 0.0
+
+    async def update(self, text: str) -> None:
+        text = text[: MessageLimit.MAX_TEXT_LENGTH]
+        if not text.strip() or text == self.shown or time.monotonic() < self.next_edit:
+            return
+
+        # Partial Markdown rarely parses, so the text is shown plain until the final edit
+        try:
+            if self.sent is None:
+                self.sent = await self.message.reply_text(text)
+            else:
+                await self.sent.edit_text(text)
+            self.shown = text
+            self.next_edit = time.monotonic() + STREAM_EDIT_INTERVAL
+        except RetryAfter as e:
+            self.next_edit = time.monotonic() + retry_after_seconds(e)
+        except TelegramError as e:
+            # An intermediate edit is cosmetic (a timeout, a network error, an unparsable edit); finish() still
+            # delivers the full text
+            logger.debug(f"Skipping a streaming edit: {type(e).__name__}: {e}")
+            self.next_edit = time.monotonic() + STREAM_EDIT_INTERVAL
+
+    async def finish(self, text: str) -> None:
+        chunks = [
+            text[i : i + MessageLimit.MAX_TEXT_LENGTH] for i in range(0, len(text), MessageLimit.MAX_TEXT_LENGTH)
+        ] or [text]
+
+        first, rest = chunks[0], chunks[1:]
+        if self.sent is None:
+            await self._send(first)
+        elif first != self.shown or self.parse_mode:
+            await self._edit(first)
+
+        # Anything past Telegram's length limit goes out as follow-up messages
+        for chunk in rest:
+            await self._send(chunk)
+
+    async def _send(self, text: str) -> None:
+        try:
+            await self.message.reply_text(text, parse_mode=self.parse_mode)
+        except BadRequest:
+            if self.parse_mode is None:
+                raise
+            await self.message.reply_text(text)
+
+    async def _edit(self, text: str) -> None:
+        try:
+            await self.sent.edit_text(text, parse_mode=self.parse_mode)
+        except BadRequest as e:
+            if "not modified" in str(e):
+                return
+            if self.parse_mode is None:
+                raise
+            # The model's Markdown did not parse; keep the plain text rather than losing the reply
+            if text != self.shown:
+                await self.sent.edit_text(text)
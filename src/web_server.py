@@ -0,0 +1,194 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from http import HTTPStatus
+
+from src.health import health_body, liveness, readiness
+from src.metrics import CONTENT_TYPE, registry
+
+logger = logging.getLogger(__name__)
+
+# Webhook mode: one HTTP server on the bot's event loop receives Telegram updates and serves the status page
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_BODY_BYTES = int(os.getenv("WEBHOOK_MAX_BODY_BYTES", str(1024 * 1024)))
+# Idle keep-alive connections from the load balancer are closed after this many seconds
+WEBHOOK_IDLE_TIMEOUT = float(os.getenv("WEBHOOK_IDLE_TIMEOUT", "75"))
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    headers: dict[str, str]
+    body: bytes
+
+
+@dataclass
+class Response:
+    status: int = HTTPStatus.OK
+    body: bytes = b"OK"
+    content_type: str = "text/plain"
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class WebServer:
+    """A minimal asyncio HTTP/1.1 server: exact-path routes, Content-Length bodies and keep-alive."""
+
+    def __init__(self, host: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT):
+        self.host = host
+        self.port = port
+        self.routes: dict[tuple[str, str], Handler] = {}
+        self._server: asyncio.Server | None = None
+        self._connections: set[asyncio.Task] = set()
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        self.routes[(method, path)] = handler
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Web server listening on {self.host}:{self.port}")
+
+    async def close(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        for task in self._connections:
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                request = await asyncio.wait_for(self._read_request(reader), WEBHOOK_IDLE_TIMEOUT)
+                if request is None:
+                    break
+
+                response = await self._dispatch(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                self._write(writer, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, TimeoutError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        except ValueError as e:
+            # Malformed request line, headers or length; there is no way to resync the stream
+            self._write(writer, Response(HTTPStatus.BAD_REQUEST, str(e).encode()), keep_alive=False)
+        finally:
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Request | None:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0))
+        if length > WEBHOOK_MAX_BODY_BYTES:
+            raise ValueError(f"Request body of {length} bytes is too large")
+        body = await reader.readexactly(length)
+        return Request(method=method, path=path.split("?", 1)[0], headers=headers, body=body)
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            allowed = any(path == request.path for _, path in self.routes)
+            status = HTTPStatus.METHOD_NOT_ALLOWED if allowed else HTTPStatus.NOT_FOUND
+            return Response(status, status.phrase.encode())
+        try:
+            return await handler(request)
+        except Exception:
+            logger.exception(f"Error handling {request.method} {request.path}")
+            return Response(HTTPStatus.INTERNAL_SERVER_ERROR, b"Internal Server Error")
+
+    @staticmethod
+    def _write(writer: asyncio.StreamWriter, response: Response, keep_alive: bool) -> None:
+        status = HTTPStatus(response.status)
+        headers = {
+            "Content-Type": response.content_type,
+            "Content-Length": str(len(response.body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **response.headers,
+        }
+        head = f"HTTP/1.1 {status.value} {status.phrase}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + response.body)
+
+
+# noinspection PyUnusedLocal
+async def status_page(request: Request) -> Response:
+    return Response()
+
+
+# noinspection PyUnusedLocal
+async def metrics_page(request: Request) -> Response:
+    return Response(body=registry.render().encode(), content_type=CONTENT_TYPE)
+
+
+def _health_response(ok: bool, checks: dict) -> Response:
+    status = HTTPStatus.OK if ok else HTTPStatus.SERVICE_UNAVAILABLE
+    return Response(status, health_body(ok, checks), "application/json")
+
+
+# noinspection PyUnusedLocal
+async def liveness_page(request: Request) -> Response:
+    return _health_response(*liveness())
+
+
+# noinspection PyUnusedLocal
+async def readiness_page(request: Request) -> Response:
+    return _health_response(*await readiness())
+
+
+def webhook_handler(on_update: Callable[[dict], Awaitable[None]], secret: str | None = WEBHOOK_SECRET) -> Handler:
+    """Accept Telegram webhook POSTs, checking the secret token Telegram echoes back in a header."""
+
+    async def handle(request: Request) -> Response:
+        if secret and not hmac.compare_digest(
+            request.headers.get("x-telegram-bot-api-secret-token", "").encode(), secret.encode()
+        ):
+            return Response(HTTPStatus.FORBIDDEN, b"Forbidden")
+
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return Response(HTTPStatus.BAD_REQUEST, b"Invalid JSON")
+        if not isinstance(data, dict):
+            return Response(HTTPStatus.BAD_REQUEST, b"Expected an update object")
+
+        # Only queue the update here; answering quickly keeps Telegram from retrying or backing off
+        await on_update(data)
+        return Response()
+
+    return handle
+
+
+def create_web_server(on_update: Callable[[dict], Awaitable[None]]) -> WebServer:
+    server = WebServer()
+    server.route("GET", "/", status_page)
+    server.route("GET", "/status", status_page)
+    server.route("GET", "/metrics", metrics_page)
+    server.route("GET", "/healthz", liveness_page)
+    server.route("GET", "/readyz", readiness_page)
+    server.route("POST", WEBHOOK_PATH, webhook_handler(on_update))
+    return server
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+import os
+import signal
+
+from telegram.ext import ExtBot
+
+# Registers the daily_question job handler
+import src.scheduler  # noqa: F401
+from src.async_db import dispose_engine, init_db
+from src.db import DB_MIGRATE_ON_START
+from src.jobs import JOB_WORKERS, start_job_workers, stop_job_workers
+from src.llm_usage import start_usage_writer, stop_usage_writer
+from src.openai_handler import close_clients, wait_for_summaries
+from src.question_pool import stop_refills
+from src.rate_limit import TelegramRateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker() -> None:
+    """Run queued jobs until SIGINT or SIGTERM, then hand the running ones back to the queue."""
+    bot = ExtBot(
+        os.getenv("TELEGRAM_BOT_TOKEN"),
+        base_url=os.getenv("TELEGRAM_BASE_URL", "https://api.telegram.org/bot"),
+        rate_limiter=TelegramRateLimiter(),
+    )
+    if DB_MIGRATE_ON_START:
+        await init_db()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with bot:
+        start_usage_writer()
+        start_job_workers(bot, max(JOB_WORKERS, 1))
+        logger.info("Job worker started")
+        try:
+            await stop.wait()
+        finally:
+            await stop_job_workers()
+            await stop_refills()
+            await wait_for_summaries()
+            await stop_usage_writer()
+            await close_clients()
+            await dispose_engine()
+
+
+if __name__ == "__main__":
+    # More workers for the job queue, on this or another machine: python -m src.worker
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    asyncio.run(run_worker())